@@ -22,7 +22,8 @@ app.use(
     res.send("I'm awake");
   })
 );
+const port = +process.env.PORT || 3030;
 const httpServer = http.createServer(app);
-httpServer.listen(3030, () => {
-  console.log(`Test OAuth2 server listening on http://localhost:3030/`);
+httpServer.listen(port, () => {
+  console.log(`Test OAuth2 server listening on http://localhost:${port}/`);
 });
@@ -1,9 +1,12 @@
+// the Saltcorn server under test, moved off 3001 on other test shards
+const saltcornPort = +process.env.SALTCORN_PORT || 3001;
+
 const clients = [
   {
     clientId: "_saltcorn_client_id_",
     clientSecret: "2e85aa0c063aa97329a31fbb",
     grants: ["authorization_code"],
-    redirectUris: ["http://localhost:3001/auth/callback/oauth2"],
+    redirectUris: [`http://localhost:${saltcornPort}/auth/callback/oauth2`],
   },
 ];
 const tokens = [];
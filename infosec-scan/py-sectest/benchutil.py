@@ -0,0 +1,100 @@
+import os
+import json
+import time
+import logging
+import cli_client
+
+logger = logging.getLogger(__name__)
+
+# the fixtures' admin, which the benchmarks log in as
+ADMIN_EMAIL = 'admin@foo.com'
+ADMIN_PASSWORD = 'AhGGr6rhu45'
+# store plugins with no setup of their own, installed in this order
+PLUGINS = ['markdown', 'flatpickr-date', 'json', 'money', 'badges', 'kanban',
+           'tabulator', 'many-to-many', 'ckeditor4', 'any-bootstrap-theme']
+
+
+def setup_logging():
+  """the log format of every benchmark script"""
+  logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+  )
+
+
+def env_ints(name, default):
+  """a comma separated list of ints from the environment, e.g. SALTCORN_BENCH_NODES=2,4"""
+  return [int(v) for v in os.environ.get(name, default).split(',') if v.strip()]
+
+
+def us(seconds):
+  """seconds as the us a latency.Histogram('us') records"""
+  return seconds * 1e6
+
+
+def ms(hist, p):
+  """percentile `p` of a latency.Histogram('us') in ms, None if it is empty"""
+  v = hist.percentile(p)
+  return v / 1000 if v is not None else None
+
+
+def cpu(sampler):
+  """
+  cores a server was busy over a resources.ResourceSampler's run:
+  (master, [each worker])
+  """
+  if sampler is None or len(sampler.samples) < 2:
+    return None, []
+  first, last = sampler.samples[0], sampler.samples[-1]
+  span = last['t'] - first['t']
+  master, workers = None, []
+  for pid, proc in last['processes'].items():
+    before = first['processes'].get(pid)
+    if before is None:
+      continue  # forked while we sampled
+    busy = (proc['cpu_s'] - before['cpu_s']) / span
+    if proc['role'] == 'master':
+      master = busy
+    else:
+      workers.append(busy)
+  return master, workers
+
+
+def enable_multi_tenant():
+  """
+  SALTCORN_MULTI_TENANT=true for the CLI and any server started after;
+  without it create-tenant exits 0 having created nothing
+  """
+  if os.environ.get('SALTCORN_MULTI_TENANT') != 'true':
+    os.environ['SALTCORN_MULTI_TENANT'] = 'true'
+    # the command server inherited the environment it started with
+    cli_client.restart()
+
+
+def check_tenants(prefix, count):
+  """fail unless exactly `count` tenants named prefix... exist"""
+  found = [t for t in cli_client.run("list-tenants", "--plain").stdout.splitlines()
+           if t.strip().startswith(prefix)]
+  if len(found) != count:
+    raise RuntimeError("expected %d %s* tenants, found %d" % (count, prefix, len(found)))
+
+
+def results_dir():
+  """where benchmark reports go: $SALTCORN_BENCH_DIR, default ./bench-results"""
+  path = os.environ.get('SALTCORN_BENCH_DIR', 'bench-results')
+  os.makedirs(path, exist_ok=True)
+  return path
+
+
+def results_path(name):
+  return os.path.join(results_dir(), name)
+
+
+def write_report(name, data):
+  """write a JSON report, stamped with when it was taken"""
+  path = results_path(name if name.endswith('.json') else name + '.json')
+  with open(path, 'w') as f:
+    json.dump({'timestamp': time.time(), **data}, f, indent=2)
+  logger.info("benchmark report written to %s", path)
+  return path
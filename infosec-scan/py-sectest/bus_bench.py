@@ -0,0 +1,101 @@
+"""
+Throughput of the multi-node message bus. Every node of a cluster emits
+bursts of dynamic updates at once, through the bus_flood trigger, while a
+BusMonitor counts what arrives on the wire:
+
+  SALTCORN_BENCH_NODES=2,4 SALTCORN_BENCH_MESSAGES=5000 python3 bus_bench.py
+
+For each cluster size and message size (SALTCORN_BENCH_SIZES, bytes of
+padding; sizes over a NOTIFY payload go through the spill table) it
+reports messages/s, messages per NOTIFY, spills and drops (messages that
+never arrived, plus gaps in the batch sequence numbers) to
+bench-results/bus.json.
+"""
+import os
+import time
+import threading
+import logging
+from scsession import SaltcornSession
+from session_pool import pool
+from cluster import ClusterHarness
+from busmonitor import BusMonitor, install_flood_trigger, flood, bench_seq
+import benchutil
+
+benchutil.setup_logging()
+
+logger = logging.getLogger(__name__)
+
+
+def run_size(cluster, messages, burst, size, timeout):
+  nodes = cluster.size
+  per_node = messages // nodes
+  errors = []
+
+  def emit(i):
+    sess = SaltcornSession(port=cluster.port(i), open_process=False)
+    pool.login(sess, benchutil.ADMIN_EMAIL, benchutil.ADMIN_PASSWORD)
+    try:
+      for start in range(i * per_node, (i + 1) * per_node, burst):
+        flood(sess, count=min(burst, (i + 1) * per_node - start), size=size, start=start)
+    except Exception as e:
+      errors.append(e)
+    finally:
+      sess.close()
+
+  expected = per_node * nodes
+  with BusMonitor() as bus:
+    started = time.monotonic()
+    threads = [threading.Thread(target=emit, args=(i,)) for i in range(nodes)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    if errors:
+      raise errors[0]
+    try:
+      bus.wait_for(lambda m: bench_seq(m) is not None, count=expected, timeout=timeout)
+    except TimeoutError as e:
+      logger.warning("%s", e)
+    elapsed = time.monotonic() - started
+  arrived = {bench_seq(m.message) for m in bus.find(lambda m: bench_seq(m) is not None)}
+  stats = bus.stats(lambda m: bench_seq(m) is not None)
+  result = {
+    'size': size,
+    'sent': expected,
+    'dropped': expected - len(arrived & set(range(expected))),
+    'elapsed_s': elapsed,
+    'end_to_end_per_s': len(arrived) / elapsed,
+    **stats,
+  }
+  logger.info("%d nodes, %6d byte messages: %s msgs/s on the bus, %.1f per NOTIFY, "
+              "%d spilled, %d dropped, %d seq gaps",
+              nodes, size, stats['messages_per_s'] and round(stats['messages_per_s']),
+              stats['messages_per_notify'] or 0, stats['spilled'], result['dropped'],
+              stats['seq_gaps'])
+  return result
+
+
+def main():
+  node_counts = benchutil.env_ints('SALTCORN_BENCH_NODES', '2,4')
+  sizes = benchutil.env_ints('SALTCORN_BENCH_SIZES', '0,1000,20000')
+  workers = int(os.environ.get('SALTCORN_BENCH_WORKERS', 2))
+  messages = int(os.environ.get('SALTCORN_BENCH_MESSAGES', 5000))
+  burst = int(os.environ.get('SALTCORN_BENCH_BURST', 100))
+  timeout = float(os.environ.get('SALTCORN_BENCH_TIMEOUT', 60))
+  clusters = []
+  for nodes in node_counts:
+    SaltcornSession.reset_to_fixtures()
+    install_flood_trigger()
+    with ClusterHarness(nodes=nodes, workers=workers) as cluster:
+      clusters.append({
+        'nodes': nodes,
+        'workers': workers,
+        'sizes': [run_size(cluster, messages, burst, size, timeout) for size in sizes],
+      })
+  return benchutil.write_report('bus', {
+    'messages': messages, 'burst': burst, 'clusters': clusters,
+  })
+
+
+if __name__ == '__main__':
+  main()
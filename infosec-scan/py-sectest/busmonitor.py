@@ -0,0 +1,176 @@
+"""
+Listens in on the multi-node message bus of a cluster and decodes what the
+nodes send each other (see packages/server/multinode_bus.js): batched
+NOTIFY payloads on `<schema>_events`, and messages spilled to the
+_sc_node_messages table because they were too large for a NOTIFY.
+
+  with BusMonitor() as bus:
+    flood(sess, count=500)
+    bus.wait_for(lambda m: bench_seq(m) is not None, count=500)
+    bus.stats()   # messages/s, notifies, batch sizes, spills, seq gaps
+
+Needs PostgreSQL, as multi-node servers do.
+"""
+import time
+import json
+import threading
+import collections
+import logging
+import scdb
+
+try:
+  import psycopg
+except ImportError:
+  psycopg = None
+
+logger = logging.getLogger(__name__)
+
+BusMessage = collections.namedtuple(
+  'BusMessage', ['time', 'pid', 'seq', 'spilled', 'message'])
+
+FLOOD_TRIGGER = 'bus_flood'
+# emits row.count dynamic updates numbered from row.start, padded with
+# row.size bytes so large ones can be made to spill
+FLOOD_CODE = """
+for (let i = 0; i < (row.count || 1); i++)
+  emit_to_client({bench_seq: (row.start || 0) + i, pad: "x".repeat(row.size || 0)});
+"""
+
+
+def install_flood_trigger(database=None):
+  """
+  add the API call trigger flood() runs; straight into the database, so
+  do it before starting the servers, which load triggers on boot
+  """
+  database = database or scdb.db
+  database.query("delete from _sc_triggers where name = %s", (FLOOD_TRIGGER,))
+  database.query(
+    "insert into _sc_triggers(name, action, when_trigger, configuration, min_role, description) "
+    "values (%s, 'run_js_code', 'API call', %s, 1, '')",
+    (FLOOD_TRIGGER, json.dumps({'code': FLOOD_CODE})))
+
+
+def flood(sess, count, size=0, start=0):
+  """have the node behind `sess` (logged in as admin) emit `count` dynamic updates"""
+  sess.refresh_csrf()
+  sess.apiPost('/api/action/' + FLOOD_TRIGGER, {'count': count, 'size': size, 'start': start})
+  assert sess.status == 200, (sess.status, sess.content)
+
+
+def bench_seq(message):
+  """the number of a flood() message, None for anything else"""
+  update = message.get('dynamic_update')
+  return update.get('bench_seq') if isinstance(update, dict) else None
+
+
+class BusMonitor:
+  def __init__(self, schema=None, database=None):
+    self.database = database or scdb.db
+    params = scdb.connect_params()
+    if params['driver'] != 'postgres' or psycopg is None:
+      raise RuntimeError("the multi-node bus needs PostgreSQL and psycopg")
+    self.conninfo = params['conninfo']
+    self.schema = schema or params['default_schema']
+    self.messages = []
+    self.notifies = 0
+    self.payload_bytes = 0
+    self.gaps = 0
+    self.last_seq = {}
+    self.started = None
+    self.cond = threading.Condition()
+    self._stop = threading.Event()
+    self._thread = None
+    self._ready = threading.Event()
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, *exc):
+    self.stop()
+
+  def _spilled(self, spill_id):
+    rows = self.database.tenant(self.schema).query(
+      "select payload from _sc_node_messages where id = %s", (spill_id,))
+    return json.loads(rows[0]['payload']) if rows else None
+
+  def _receive(self, notify):
+    now = time.monotonic()
+    parsed = json.loads(notify.payload)
+    batch, seq = parsed.get('batch'), parsed.get('seq')
+    if not isinstance(batch, list):
+      batch, seq = [parsed], None  # a node without batching
+    elif seq is not None:
+      last = self.last_seq.get(notify.pid)
+      if last is not None and seq != 1 and seq != last + 1:
+        self.gaps += seq - last - 1
+      self.last_seq[notify.pid] = seq
+    received = []
+    for msg in batch:
+      if isinstance(msg, dict) and msg.get('_spilled'):
+        spilled = self._spilled(msg['_spilled'])
+        if spilled is None:
+          logger.warning("spilled multinode message %s not found", msg['_spilled'])
+          self.gaps += 1
+          continue
+        received.append(BusMessage(now, notify.pid, seq, True, spilled))
+      else:
+        received.append(BusMessage(now, notify.pid, seq, False, msg))
+    with self.cond:
+      self.notifies += 1
+      self.payload_bytes += len(notify.payload.encode())
+      self.messages.extend(received)
+      self.cond.notify_all()
+
+  def _loop(self):
+    with psycopg.connect(**self.conninfo, autocommit=True) as conn:
+      conn.execute('LISTEN "%s_events"' % self.schema)
+      self._ready.set()
+      while not self._stop.is_set():
+        for notify in conn.notifies(timeout=0.2):
+          self._receive(notify)
+
+  def start(self):
+    self.started = time.monotonic()
+    self._thread = threading.Thread(target=self._loop, daemon=True)
+    self._thread.start()
+    if not self._ready.wait(10):
+      raise TimeoutError("could not LISTEN on %s_events" % self.schema)
+    return self
+
+  def stop(self):
+    self._stop.set()
+    if self._thread is not None:
+      self._thread.join()
+
+  def find(self, predicate):
+    with self.cond:
+      return [m for m in self.messages if predicate(m.message)]
+
+  def wait_for(self, predicate, count=1, timeout=10):
+    """block until `count` messages match; returns them, or raises TimeoutError"""
+    deadline = time.monotonic() + timeout
+    with self.cond:
+      while True:
+        found = [m for m in self.messages if predicate(m.message)]
+        if len(found) >= count:
+          return found
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+          raise TimeoutError("%d of %d bus messages within %ss" % (len(found), count, timeout))
+        self.cond.wait(remaining)
+
+  def stats(self, predicate=None):
+    with self.cond:
+      msgs = [m for m in self.messages if predicate is None or predicate(m.message)]
+      total, notifies, payload_bytes, gaps = (
+        len(self.messages), self.notifies, self.payload_bytes, self.gaps)
+    span = msgs[-1].time - msgs[0].time if len(msgs) > 1 else 0
+    return {
+      'messages': len(msgs),
+      'notifies': notifies,
+      'spilled': sum(m.spilled for m in msgs),
+      'payload_bytes': payload_bytes,
+      'messages_per_notify': total / notifies if notifies else None,
+      'messages_per_s': (len(msgs) - 1) / span if span else None,
+      'seq_gaps': gaps,
+    }
@@ -0,0 +1,231 @@
+"""
+Building blocks for crash-recovery measurements: kill a worker or a whole
+node while clients keep using the server, and time what the server does
+about it.
+
+  events = SignalWatcher(node)          # worker_exited / worker_started /
+                                        # scheduler events, timestamped
+  load = SteadyLoad({0: sess0, 1: sess1}, '/view/authorlist').start()
+  sockets = SocketFleet(sess0, count=20).start()
+  pid = kill_worker(node)
+  events.wait_for(lambda e: e.get('worker_started'), since=t0)
+  load.window(since=t0)                 # failed requests, error window
+  sockets.dropped(since=t0)             # disconnected, reconnected
+
+See chaos_bench.py for the experiments built from them.
+"""
+import os
+import time
+import signal
+import random
+import threading
+import collections
+import logging
+import resources
+from socket_client import SocketHub, open_connections, close_connections
+
+logger = logging.getLogger(__name__)
+
+Event = collections.namedtuple('Event', ['time', 'info'])
+Request = collections.namedtuple('Request', ['start', 'end', 'node', 'ok', 'error'])
+
+
+def worker_pids(sess):
+  """the cluster workers of the node behind `sess`, i.e. all but its master"""
+  master = sess.salcorn_process.pid
+  return [pid for pid in resources.descendants(master) if pid != master]
+
+
+def kill_worker(sess, pid=None, sig=signal.SIGKILL):
+  """kill one of the node's workers (a random one by default); returns its pid"""
+  if pid is None:
+    pids = worker_pids(sess)
+    if not pids:
+      raise RuntimeError("no cluster workers to kill; is SALTCORN_NWORKERS > 1?")
+    pid = random.choice(pids)
+  os.kill(pid, sig)
+  return pid
+
+
+class SignalWatcher:
+  """
+  reads the events a node reports on its ready fd (see SaltcornSession
+  and packages/server/ready_signal.js) in the background, stamping each
+  with when it arrived. Owns the node's signal pipe while running.
+  """
+
+  def __init__(self, sess):
+    self.sess = sess
+    self.events = []
+    self.cond = threading.Condition()
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target=self._loop, daemon=True)
+    self._thread.start()
+
+  def _loop(self):
+    while not self._stop.is_set():
+      signals = self.sess.signals
+      if signals is None or signals.fd is None:
+        return  # pipe closed by the session's stop()
+      try:
+        info = signals.read(timeout=0.2)
+      except ValueError:
+        if not self.sess.running():
+          return  # node is gone, and its end of the pipe with it
+        continue
+      except OSError:
+        return  # pipe closed while we were reading
+      with self.cond:
+        self.events.append(Event(time.monotonic(), info))
+        self.cond.notify_all()
+
+  def wait_for(self, predicate, timeout=30, since=0):
+    """the first event after `since` matching predicate(info), or TimeoutError"""
+    deadline = time.monotonic() + timeout
+    with self.cond:
+      while True:
+        for e in self.events:
+          if e.time >= since and predicate(e.info):
+            return e
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+          raise TimeoutError("no matching event from %s within %ss"
+                             % (self.sess.base_url, timeout))
+        self.cond.wait(remaining)
+
+  def stop(self, timeout=5):
+    # reads time out every 0.2s, so this only waits long if one is stuck
+    self._stop.set()
+    self._thread.join(timeout)
+    if self._thread.is_alive():
+      logger.warning("signal watcher of %s did not stop within %ss",
+                     self.sess.base_url, timeout)
+
+
+class SteadyLoad:
+  """
+  one client thread per node, each sending `url` back to back (every
+  `interval` seconds at most) with its own logged-in session, recording
+  every request as ok or failed
+  """
+
+  def __init__(self, sessions, url, interval=0.01, timeout=5):
+    self.sessions = sessions
+    self.url = url
+    self.interval = interval
+    self.timeout = timeout
+    self.requests = []
+    self.lock = threading.Lock()
+    self._stop = threading.Event()
+    self._threads = []
+
+  def _loop(self, node, sess):
+    while not self._stop.is_set():
+      start = time.monotonic()
+      error = None
+      try:
+        sess.get(self.url, timeout=self.timeout)
+        ok = sess.status < 400
+        if not ok:
+          error = 'HTTP %d' % sess.status
+      except Exception as e:
+        ok = False
+        error = type(e).__name__
+      end = time.monotonic()
+      with self.lock:
+        self.requests.append(Request(start, end, node, ok, error))
+      self._stop.wait(max(0, self.interval - (end - start)))
+
+  def start(self):
+    for node, sess in self.sessions.items():
+      t = threading.Thread(target=self._loop, args=(node, sess), daemon=True)
+      t.start()
+      self._threads.append(t)
+    return self
+
+  def stop(self):
+    self._stop.set()
+    for t in self._threads:
+      t.join()
+
+  def window(self, since, nodes=None):
+    """
+    requests started after `since`, to `nodes` (default all): how many
+    failed, and the error window, from `since` to the end of the last
+    failed request (0 if none did)
+    """
+    with self.lock:
+      reqs = [r for r in self.requests
+              if r.start >= since and (nodes is None or r.node in nodes)]
+    failed = [r for r in reqs if not r.ok]
+    errors = collections.Counter(r.error for r in failed)
+    return {
+      'requests': len(reqs),
+      'failed': len(failed),
+      'error_window_s': max(r.end for r in failed) - since if failed else 0,
+      'errors': dict(errors),
+    }
+
+  def first_ok(self, since, node):
+    """when the first request to `node` started after `since` succeeded"""
+    with self.lock:
+      oks = [r.end for r in self.requests if r.start >= since and r.node == node and r.ok]
+    return min(oks) if oks else None
+
+
+class SocketFleet:
+  """
+  `count` socket.io connections to one node with the cookie of a
+  logged-in session; they reconnect on their own, and every disconnect
+  and connect is timestamped
+  """
+
+  def __init__(self, sess, count=20, hub=None):
+    self.sess = sess
+    self.count = count
+    self.hub = hub or SocketHub.default()
+    self.clients = []
+    self.connects = collections.defaultdict(list)
+    self.disconnects = collections.defaultdict(list)
+    self.lock = threading.Lock()
+
+  def _on_event(self, conn, event, data):
+    with self.lock:
+      (self.connects if event == 'connect' else self.disconnects)[conn].append(time.monotonic())
+
+  def start(self):
+    cookie = 'connect.sid=' + self.sess.sessionID() + '; loggedin=true'
+    self.clients, errors = self.hub.run(open_connections(
+      self.sess.base_url, [cookie] * self.count, events=['connect', 'disconnect'],
+      on_event=self._on_event, reconnection=True, reconnection_delay=0.2,
+      reconnection_delay_max=2))
+    if errors:
+      raise errors[0]
+    return self
+
+  def stop(self):
+    self.hub.run(close_connections(self.clients))
+    self.clients = []
+
+  def dropped(self, since, until=None):
+    """
+    connections dropped after `since`, how many of them were back by
+    `until` (default now), and how long the slowest took to reconnect
+    """
+    until = until or time.monotonic()
+    dropped, back, gaps = 0, 0, []
+    with self.lock:
+      for conn in self.clients:
+        lost = [t for t in self.disconnects[conn] if since <= t <= until]
+        if not lost:
+          continue
+        dropped += 1
+        again = [t for t in self.connects[conn] if lost[0] < t <= until]
+        if again:
+          back += 1
+          gaps.append(again[0] - lost[0])
+    return {
+      'dropped': dropped,
+      'reconnected': back,
+      'max_reconnect_s': max(gaps) if gaps else None,
+    }
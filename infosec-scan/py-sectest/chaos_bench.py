@@ -0,0 +1,201 @@
+"""
+Crash recovery under load. A multi-node cluster serves a steady stream
+of logged-in requests and holds open socket.io connections on every node
+while its workers, then whole nodes, are killed with SIGKILL:
+
+  SALTCORN_BENCH_NODES=2 SALTCORN_BENCH_WORKERS=2 python3 chaos_bench.py
+
+worker kill  -- error window on that node, time until the master notices
+                and until the re-forked worker is listening, sockets
+                dropped and how fast they came back
+node kill    -- the scheduler's leader is killed: time until another node
+                takes the advisory lock and starts the scheduler, errors
+                and dropped sockets on the surviving nodes, and time until
+                the restarted node serves again
+
+Every number is checked against a budget (SALTCORN_BENCH_BUDGET_*, see
+BUDGETS); the report goes to bench-results/chaos.json and the script
+exits with 1 if the worst round of any of them is over budget.
+"""
+import os
+import sys
+import time
+import signal
+import logging
+from scsession import SaltcornSession
+from session_pool import pool
+from cluster import ClusterHarness
+from chaos import SignalWatcher, SteadyLoad, SocketFleet, kill_worker
+import benchutil
+
+benchutil.setup_logging()
+
+logger = logging.getLogger(__name__)
+
+URL = '/view/authorlist'
+
+# name -> default budget; SALTCORN_BENCH_BUDGET_<NAME> overrides
+BUDGETS = {
+  'worker_error_window_s': 2.0,
+  'refork_s': 10.0,
+  'worker_sockets_not_back': 0,
+  # leadership is polled every 5s, so a new leader can take up to that
+  'scheduler_resume_s': 10.0,
+  'survivor_failed_requests': 0,
+  'survivor_sockets_dropped': 0,
+  'node_back_s': 60.0,
+}
+
+
+def budgets():
+  return {name: float(os.environ.get('SALTCORN_BENCH_BUDGET_' + name.upper(), default))
+          for name, default in BUDGETS.items()}
+
+
+def _settle(seconds):
+  # let in-flight requests fail or finish, and sockets reconnect
+  time.sleep(seconds)
+
+
+def worker_kill(cluster, watchers, load, fleets, settle, timeout):
+  node = cluster.node(0)
+  t0 = time.monotonic()
+  pid = kill_worker(node)
+  exited = watchers[0].wait_for(lambda e: e.get('worker_exited') == pid, timeout, t0)
+  started = watchers[0].wait_for(lambda e: 'worker_started' in e, timeout, t0)
+  _settle(settle)
+  window = load.window(t0, nodes={0})
+  sockets = fleets[0].dropped(t0)
+  result = {
+    'pid': pid,
+    'detected_s': exited.time - t0,
+    'refork_s': started.time - t0,
+    **window,
+    'sockets': sockets,
+  }
+  logger.info("worker %d killed: re-forked after %.2fs, %d failed requests over %.2fs, "
+              "%d sockets dropped, %d back", pid, result['refork_s'], window['failed'],
+              window['error_window_s'], sockets['dropped'], sockets['reconnected'])
+  return result
+
+
+def node_kill(cluster, watchers, load, fleets, leader, settle, timeout):
+  survivors = [i for i in range(cluster.size) if i != leader]
+  t0 = time.monotonic()
+  # stop reading the pipe before stop_node closes it underneath us
+  watchers[leader].stop()
+  cluster.stop_node(leader, sig=signal.SIGKILL)
+  killed = time.monotonic()
+  # whichever survivor wins the advisory lock starts its scheduler
+  resumed, new_leader = None, None
+  deadline = t0 + timeout
+  while resumed is None and time.monotonic() < deadline:
+    for i in survivors:
+      try:
+        e = watchers[i].wait_for(lambda e: e.get('scheduler') == 'started', 0.1, t0)
+        resumed, new_leader = e, i
+        break
+      except TimeoutError:
+        pass
+  restarted = time.monotonic()
+  cluster.restart_node(leader)
+  watchers[leader] = SignalWatcher(cluster.node(leader))
+  back = load.first_ok(restarted, leader)
+  while back is None and time.monotonic() < restarted + timeout:
+    time.sleep(0.05)
+    back = load.first_ok(restarted, leader)
+  _settle(settle)
+  window = load.window(t0, nodes=set(survivors))
+  dropped = [fleets[i].dropped(t0) for i in survivors]
+  result = {
+    'killed': leader,
+    'kill_s': killed - t0,
+    'new_leader': new_leader,
+    'scheduler_resume_s': resumed.time - t0 if resumed else None,
+    'node_back_s': back - t0 if back else None,
+    'survivors': window,
+    'survivor_sockets': {
+      'dropped': sum(d['dropped'] for d in dropped),
+      'reconnected': sum(d['reconnected'] for d in dropped),
+    },
+    'killed_node': load.window(t0, nodes={leader}),
+  }
+  logger.info("leader node %d killed: scheduler resumed on node %s after %s, node back "
+              "after %s, %d failed requests on the survivors",
+              leader, new_leader,
+              '%.2fs' % result['scheduler_resume_s'] if resumed else 'never',
+              '%.2fs' % result['node_back_s'] if back else 'never',
+              window['failed'])
+  return result, new_leader if new_leader is not None else leader
+
+
+def check(worker_rounds, node_rounds, limits):
+  """worst round of each measurement against its budget"""
+  worst = {
+    'worker_error_window_s': max((r['error_window_s'] for r in worker_rounds), default=0),
+    'refork_s': max((r['refork_s'] for r in worker_rounds), default=0),
+    'worker_sockets_not_back': max(
+      (r['sockets']['dropped'] - r['sockets']['reconnected'] for r in worker_rounds), default=0),
+    # a leader that never came back counts as infinitely late
+    'scheduler_resume_s': max((r['scheduler_resume_s'] if r['scheduler_resume_s'] is not None
+                               else float('inf') for r in node_rounds), default=0),
+    'survivor_failed_requests': max((r['survivors']['failed'] for r in node_rounds), default=0),
+    'survivor_sockets_dropped': max(
+      (r['survivor_sockets']['dropped'] for r in node_rounds), default=0),
+    'node_back_s': max((r['node_back_s'] if r['node_back_s'] is not None
+                        else float('inf') for r in node_rounds), default=0),
+  }
+  return {
+    name: {'worst': worst[name], 'budget': limit, 'ok': worst[name] <= limit}
+    for name, limit in limits.items()
+  }
+
+
+def main():
+  nodes = int(os.environ.get('SALTCORN_BENCH_NODES', 2))
+  workers = int(os.environ.get('SALTCORN_BENCH_WORKERS', 2))
+  worker_kills = int(os.environ.get('SALTCORN_BENCH_WORKER_KILLS', 5))
+  node_kills = int(os.environ.get('SALTCORN_BENCH_NODE_KILLS', 2))
+  sockets = int(os.environ.get('SALTCORN_BENCH_SOCKETS', 20))
+  settle = float(os.environ.get('SALTCORN_BENCH_SETTLE', 3))
+  timeout = float(os.environ.get('SALTCORN_BENCH_TIMEOUT', 60))
+  if workers < 2:
+    raise ValueError("SALTCORN_BENCH_WORKERS must be at least 2 to have workers to kill")
+  limits = budgets()
+  SaltcornSession.reset_to_fixtures()
+  with ClusterHarness(nodes=nodes, workers=workers) as cluster:
+    leader = next((i for i in range(nodes) if cluster.node(i).ready_info.get('leader')), 0)
+    watchers = [SignalWatcher(cluster.node(i)) for i in range(nodes)]
+    clients = {}
+    for i in range(nodes):
+      clients[i] = SaltcornSession(port=cluster.port(i), open_process=False)
+      pool.login(clients[i], benchutil.ADMIN_EMAIL, benchutil.ADMIN_PASSWORD)
+    load = SteadyLoad(clients, URL).start()
+    fleets = [SocketFleet(clients[i], sockets).start() for i in range(nodes)]
+    try:
+      worker_rounds = [worker_kill(cluster, watchers, load, fleets, settle, timeout)
+                       for _ in range(worker_kills)]
+      node_rounds = []
+      for _ in range(node_kills if nodes > 1 else 0):
+        result, leader = node_kill(cluster, watchers, load, fleets, leader, settle, timeout)
+        node_rounds.append(result)
+    finally:
+      load.stop()
+      for fleet in fleets:
+        fleet.stop()
+      for w in watchers:
+        w.stop()
+  verdict = check(worker_rounds, node_rounds, limits)
+  for name, v in verdict.items():
+    logger.log(logging.INFO if v['ok'] else logging.ERROR,
+               "%-26s worst %8s  budget %8s  %s", name, v['worst'], v['budget'],
+               'ok' if v['ok'] else 'OVER BUDGET')
+  benchutil.write_report('chaos', {
+    'nodes': nodes, 'workers': workers, 'sockets_per_node': sockets,
+    'worker_kills': worker_rounds, 'node_kills': node_rounds, 'budgets': verdict,
+  })
+  return all(v['ok'] for v in verdict.values())
+
+
+if __name__ == '__main__':
+  sys.exit(0 if main() else 1)
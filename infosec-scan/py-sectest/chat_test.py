@@ -1,7 +1,6 @@
 from scsession import SaltcornSession
+from shard import shard
 from chat_client import ChatClient;
-import socketio
-import time
 
 staffEmail='staff@foo.com'
 staffPassword='ghrarhr54hg'
@@ -18,7 +17,7 @@ adminRoomsView='admin_rooms_view'
 class Test:
   def setup_class(self):
     SaltcornSession.reset_to_fixtures()
-    self.sess = SaltcornSession(port=3001)
+    self.sess = SaltcornSession.warm(port=shard.port())
 
   def teardown_class(self):
     self.sess.close()
@@ -48,7 +47,8 @@ class Test:
         room_id=1, content=staffMsg,
         view_name=publicRoomsView
       )
-      time.sleep(0.2)
+      adminClient.wait_for(lambda m: staffMsg in m['append'])
+      staffClient.wait_for(lambda m: staffMsg in m['append'])
       assert len(adminClient.messages) == 1
       assert adminClient.has_message(
           content=staffMsg,
@@ -64,7 +64,8 @@ class Test:
         room_id=1, content=adminMsg,
         view_name=publicRoomsView
       )
-      time.sleep(0.2)
+      staffClient.wait_for(lambda m: adminMsg in m['append'])
+      adminClient.wait_for(lambda m: adminMsg in m['append'])
       assert len(staffClient.messages) == 2
       assert staffClient.has_message(
           content=adminMsg,
@@ -85,7 +86,9 @@ class Test:
         room_id=1, content=fooMsg, 
         view_name=publicRoomsView
       )
-      time.sleep(0.2)
+      fooClient.wait_for(lambda m: fooMsg in m['append'])
+      adminClient.wait_for(lambda m: fooMsg in m['append'])
+      staffClient.wait_for(lambda m: fooMsg in m['append'])
       assert len(fooClient.messages) == 1
       assert fooClient.has_message(
         content=fooMsg,
@@ -132,7 +135,8 @@ class Test:
         room_id=2, content='lost message from staff',
         view_name=publicRoomsView
       )
-      time.sleep(0.2)
+      adminClient.expect_no_event(window=0.2)
+      staffClient.expect_no_event(window=0.2)
       assert len(adminClient.messages) == 0
       assert len(staffClient.messages) == 0
       staffMsg = 'valid messge from staff'
@@ -140,7 +144,8 @@ class Test:
         room_id=1, content=staffMsg,
         view_name=publicRoomsView
       )
-      time.sleep(0.2)
+      adminClient.wait_for(lambda m: staffMsg in m['append'])
+      staffClient.wait_for(lambda m: staffMsg in m['append'])
       assert len(adminClient.messages) == 1
       assert len(staffClient.messages) == 1
       assert staffClient.has_message(
@@ -176,7 +181,8 @@ class Test:
         room_id=1, content='message content',
         view_name=publicRoomsView
       )
-      time.sleep(0.2)
+      withoutLogin.expect_no_event(window=0.2)
+      staffClient.expect_no_event(window=0.2)
       assert len(withoutLogin.messages) == 0
       assert len(staffClient.messages) == 0
     finally:
@@ -207,7 +213,8 @@ class Test:
         room_id=1, content='lost message from staff', 
         view_name=adminRoomsView
       )
-      time.sleep(0.2)
+      adminClient.expect_no_event(window=0.2)
+      staffClient.expect_no_event(window=0.2)
       assert len(adminClient.messages) == 0
       assert len(staffClient.messages) == 0
       adminMsg = 'message from admin'
@@ -215,7 +222,8 @@ class Test:
         room_id=1, content=adminMsg,
         view_name=adminRoomsView
       )
-      time.sleep(0.2)
+      adminClient.wait_for(lambda m: adminMsg in m['append'])
+      staffClient.expect_no_event(window=0.2)
       assert len(adminClient.messages) == 1
       assert len(staffClient.messages) == 0
       assert adminClient.has_message(
@@ -0,0 +1,155 @@
+"""
+Client for `saltcorn command-server`: CLI commands run in one long-lived
+node process instead of paying node startup, plugin loading and database
+connection for every call.
+"""
+import os
+import json
+import atexit
+import time
+import socket
+import tempfile
+import threading
+import subprocess
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLI = "packages/saltcorn-cli/bin/saltcorn"
+START_TIMEOUT = 60
+# longest a command may take before the server counts as wedged
+REPLY_TIMEOUT = float(os.environ.get("SALTCORN_SECTEST_CLI_TIMEOUT", 600))
+
+
+def enabled():
+  """SALTCORN_SECTEST_CLI_SERVER=false runs every command as its own process"""
+  return os.environ.get("SALTCORN_SECTEST_CLI_SERVER", "true") != "false" \
+    and hasattr(socket, "AF_UNIX")
+
+
+class CliResult:
+  def __init__(self, argv, exit_code, stdout, stderr, ms):
+    self.argv = argv
+    self.exit_code = exit_code
+    self.stdout = stdout
+    self.stderr = stderr
+    self.ms = ms
+
+  def json(self):
+    """stdout parsed, for commands run with --json"""
+    return json.loads(self.stdout)
+
+  def check(self):
+    if self.exit_code != 0:
+      # same exception as subprocess.run(check=True), so callers need not care
+      raise subprocess.CalledProcessError(self.exit_code, [CLI] + self.argv,
+                                          self.stdout, self.stderr)
+    return self
+
+
+class CliServer:
+  def __init__(self, socket_path=None):
+    self.socket_path = socket_path or os.path.join(
+      tempfile.gettempdir(), "saltcorn-sectest-cli-%d.sock" % os.getpid())
+    self.process = None
+    self.sock = None
+    self.reader = None
+    self.lock = threading.Lock()
+    self.next_id = 0
+
+  def start(self):
+    self.process = subprocess.Popen(
+      [CLI, "command-server", "-s", self.socket_path],
+      stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+    ready = threading.Event()
+
+    def drain(pipe):
+      # keep reading so a chatty plugin can't fill the pipe and block the server
+      for line in iter(pipe.readline, ""):
+        if "Command server listening" in line:
+          ready.set()
+        logger.debug("[command-server] %s", line.rstrip())
+      ready.set()
+
+    threading.Thread(target=drain, args=(self.process.stdout,), daemon=True).start()
+    if not ready.wait(START_TIMEOUT) or self.process.poll() is not None:
+      self.stop()
+      raise RuntimeError("saltcorn command-server did not start")
+    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.sock.connect(self.socket_path)
+    self.sock.settimeout(REPLY_TIMEOUT)
+    self.reader = self.sock.makefile("r", encoding="utf-8")
+
+  def stop(self):
+    if self.sock is not None:
+      self.reader.close()
+      self.sock.close()
+      self.sock = self.reader = None
+    if self.process is not None:
+      self.process.terminate()
+      try:
+        self.process.wait(10)
+      except subprocess.TimeoutExpired:
+        self.process.kill()
+      self.process = None
+
+  @property
+  def running(self):
+    return self.process is not None and self.process.poll() is None
+
+  def run(self, argv):
+    with self.lock:
+      if not self.running:
+        self.stop()
+        self.start()
+      self.next_id += 1
+      self.sock.sendall((json.dumps({"id": self.next_id, "argv": argv}) + "\n").encode())
+      try:
+        line = self.reader.readline()
+      except socket.timeout:
+        # a wedged server: drop it, the caller runs the command directly
+        self.stop()
+        raise RuntimeError("saltcorn command-server gave no reply to %s within %ss"
+                           % (argv, REPLY_TIMEOUT))
+      if not line:
+        self.stop()
+        raise RuntimeError("saltcorn command-server exited running %s" % argv)
+      reply = json.loads(line)
+      if "error" in reply or any(k not in reply for k in ("exit_code", "stdout", "stderr", "ms")):
+        self.stop()
+        raise RuntimeError("saltcorn command-server could not run %s: %r" % (argv, reply))
+    return CliResult(argv, reply["exit_code"], reply["stdout"], reply["stderr"], reply["ms"])
+
+
+server = CliServer()
+atexit.register(server.stop)
+
+
+def run_process(*args, check=True):
+  """run a command in a fresh process, bypassing the command server"""
+  argv = [str(a) for a in args]
+  t0 = time.perf_counter()
+  proc = subprocess.run([CLI] + argv, capture_output=True, text=True)
+  result = CliResult(argv, proc.returncode, proc.stdout, proc.stderr,
+                     (time.perf_counter() - t0) * 1000)
+  return result.check() if check else result
+
+
+def run(*args, check=True):
+  argv = [str(a) for a in args]
+  if enabled():
+    try:
+      result = server.run(argv)
+      return result.check() if check else result
+    except (OSError, RuntimeError) as e:
+      logger.warning("command server unavailable, running %s directly: %s", argv[0], e)
+  return run_process(*argv, check=check)
+
+
+def restart():
+  """
+  drop the server's cached state, e.g. after the database was reset
+  underneath it; the next command starts a fresh one
+  """
+  with server.lock:
+    server.stop()
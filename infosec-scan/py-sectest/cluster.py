@@ -0,0 +1,130 @@
+"""
+K multi-node Saltcorn servers on one database, for tests and benchmarks
+of the LISTEN/NOTIFY propagation between nodes:
+
+  with ClusterHarness(nodes=4, workers=2) as cluster:
+    cluster.login(email, password)
+    cluster.get('/table/new')            # next node, round robin
+    cluster.node(2).get('/table/new')    # pinned
+"""
+import signal
+import itertools
+import threading
+import subprocess
+import logging
+from scsession import SaltcornSession
+from session_pool import pool
+from shard import shard
+
+logger = logging.getLogger(__name__)
+
+
+class ClusterHarness:
+  def __init__(self, nodes=2, workers=None, env_vars=None, pipe_output=False, port_offset=0):
+    """
+    `workers` is SALTCORN_NWORKERS for every node (default: the server's
+    own choice, one per core); node i listens on shard.port(port_offset + i)
+    """
+    self.size = nodes
+    self.workers = workers
+    self.env_vars = env_vars or {}
+    self.pipe_output = pipe_output
+    self.port_offset = port_offset
+    self.nodes = []
+    self._rr = None
+    self._lock = threading.Lock()
+
+  def __enter__(self):
+    self.start()
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def port(self, i):
+    return shard.port(self.port_offset + i)
+
+  def _start_node(self, i):
+    env = {"SALTCORN_MULTI_NODE": True, **self.env_vars}
+    if self.workers:
+      env["SALTCORN_NWORKERS"] = self.workers
+    return SaltcornSession(port=self.port(i), env_vars=env, pipe_output=self.pipe_output)
+
+  def start(self):
+    # the first node runs any pending migrations, so start it alone; the
+    # rest boot in parallel
+    self.nodes = [self._start_node(0)]
+    rest = [None] * (self.size - 1)
+    errors = []
+
+    def boot(i):
+      try:
+        rest[i - 1] = self._start_node(i)
+      except Exception as e:
+        errors.append(e)
+
+    threads = [threading.Thread(target=boot, args=(i,)) for i in range(1, self.size)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    self.nodes += [n for n in rest if n is not None]
+    if errors:
+      self.close()
+      raise errors[0]
+    self._rr = itertools.cycle(self.nodes)
+    logger.info("cluster of %d nodes up, boot times %s", self.size,
+                [round(n.boot_time, 2) for n in self.nodes])
+
+  def node(self, i):
+    return self.nodes[i]
+
+  def next(self):
+    with self._lock:
+      return next(self._rr)
+
+  def login(self, email, password):
+    for n in self.nodes:
+      pool.login(n, email, password)
+
+  # requests on the next node in turn, or on node `pin`; they return the
+  # node's session, which holds the response
+  def get(self, url, pin=None, **kwargs):
+    sess = self.next() if pin is None else self.nodes[pin]
+    sess.get(url, **kwargs)
+    return sess
+
+  def postForm(self, url, data, pin=None, **kwargs):
+    sess = self.next() if pin is None else self.nodes[pin]
+    sess.postForm(url, data, **kwargs)
+    return sess
+
+  def apiPost(self, url, data, pin=None, **kwargs):
+    sess = self.next() if pin is None else self.nodes[pin]
+    sess.apiPost(url, data, **kwargs)
+    return sess
+
+  def stop_node(self, i, sig=signal.SIGTERM, timeout=10):
+    """stop one node's master; its workers exit when it disconnects"""
+    node = self.nodes[i]
+    proc = node.salcorn_process
+    if proc is not None and proc.poll() is None:
+      proc.send_signal(sig)
+      try:
+        proc.wait(timeout)
+      except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+    # closes its signal pipe, and writes its resource report if sampled
+    node.stop()
+
+  def restart_node(self, i):
+    self.stop_node(i)
+    self.nodes[i] = self._start_node(i)
+    self._rr = itertools.cycle(self.nodes)
+    return self.nodes[i]
+
+  def close(self):
+    for i in range(len(self.nodes)):
+      self.stop_node(i)
+    self.nodes = []
@@ -0,0 +1,9 @@
+import pytest
+from scsession import SaltcornSession
+
+
+@pytest.fixture(scope="session", autouse=True)
+def warm_servers():
+  """servers from SaltcornSession.warm() live until the whole run is done"""
+  yield
+  SaltcornSession.close_warm()
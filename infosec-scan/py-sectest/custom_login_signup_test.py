@@ -1,17 +1,18 @@
 from scsession import SaltcornSession
+from shard import shard
 
 
 
 class Test:
     def setup_class(self):
-        SaltcornSession.cli("reset-schema", "-f")
+        SaltcornSession.reset_schema()
         SaltcornSession.cli("install-pack", "-f", SaltcornSession.asset_path("custom_login_signup_pack.json"))
         SaltcornSession.cli("set-cfg", "new_user_form","userinfo" )
         SaltcornSession.cli("set-cfg", "login_form","login" )
         SaltcornSession.cli("set-cfg", "signup_form","signup" )
         SaltcornSession.cli("set-cfg", "user_settings_form","userinfo" )
 
-        self.sess = SaltcornSession(3001)
+        self.sess = SaltcornSession.warm(shard.port())
     def teardown_class(self):
         self.sess.close()
     def cannot_access_admin(self):
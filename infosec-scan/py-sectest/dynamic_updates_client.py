@@ -1,5 +1,4 @@
-from scsession import SaltcornSession
-import socketio
+from socket_client import SocketClient, mark_action
 import logging
 import random
 logging.basicConfig(
@@ -10,46 +9,31 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-class DynamicUpdatesClient:
-  def __init__(self):
-    self.session = SaltcornSession(port=3001, open_process=False)
-    self.updates = []
-    self.page_load_tag = format(random.randint(0, 0xFFFFFF), 'x')
-    sio = socketio.Client()
-    sio.on('dynamic_update', self.handle_update_event)
-    self.sio = sio
-    self.init_csrf()
-
-  def handle_update_event(self, data):
-    logger.info("handle_event")
-    self.updates.append(data)
+class DynamicUpdatesClient(SocketClient):
+  events = ('dynamic_update',)
+  reload_after_login = True
 
-  def init_csrf(self):
-    self.session.get('/auth/login')
-    self.csrf = self.session.csrf()
-
-  def login(self, email, password):
-    self.session.postForm('/auth/login',
-      {'email': email,
-        'password': password,
-        '_csrf': self.csrf
-      })
-    assert self.session.redirect_url == '/'
-    self.session.get('/')  # refresh CSRF for the new post-login session
+  def __init__(self, port=None):
+    self.page_load_tag = format(random.randint(0, 0xFFFFFF), 'x')
+    super().__init__(port)
 
-  def connect(self):
-    auth_headers = 'connect.sid=' + self.session.sessionID() + '; loggedin=true'
-    self.sio.connect('http://localhost:3001',
-      transports= ["websocket"], headers={'cookie': auth_headers})
+  @property
+  def updates(self):
+    return self.received
 
-  def connect_as_public(self):
-    auth_headers = 'connect.sid=' + self.session.sessionID()
-    self.sio.connect('http://localhost:3001',
-      transports= ["websocket"], headers={'cookie': auth_headers})
+  def handle_event(self, event, data):
+    logger.info("handle_event")
+    super().handle_event(event, data)
 
   def join_dynamic_updates_room(self):
-    self.sio.emit("join_dynamic_update_room", {"page_load_tag": self.page_load_tag})
+    # like saltcorn-common.js: no payload, so the server's ack reaches us
+    # once the socket is in its rooms; the page_load_tag goes with the
+    # requests that trigger updates (see run_trigger)
+    return self.call("join_dynamic_update_room") or {}
 
   def run_trigger(self, name, page_load_tag=None):
+    """call a trigger; returns when, for wait_for and expect_no_event's since"""
     headers = {'page-load-tag': page_load_tag} if page_load_tag else {}
+    since = mark_action()
     self.session.apiPost(f'/api/action/{name}', {}, extra_headers=headers)
+    return since
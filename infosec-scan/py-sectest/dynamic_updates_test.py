@@ -1,7 +1,6 @@
 from scsession import SaltcornSession
+from shard import shard
 from dynamic_updates_client import DynamicUpdatesClient;
-import socketio
-import time
 
 adminEmail='admin@foo.com'
 adminPassword='AhGGr6rhu45'
@@ -15,7 +14,7 @@ userPassword='GFeggwrwq45fjn'
 class Test:
   def setup_class(self):
     SaltcornSession.reset_to_fixtures()
-    self.sess = SaltcornSession(port=3001)
+    self.sess = SaltcornSession.warm(port=shard.port())
 
   def teardown_class(self):
     self.sess.close()
@@ -24,32 +23,31 @@ class Test:
     client = DynamicUpdatesClient()
     client.login(email=adminEmail, password=adminPassword)
     client.connect()
-    assert client.sio.connected
-    client.sio.disconnect()
+    assert client.connected
+    client.disconnect()
 
   def test_join_dynamic_updates_room(self):
     client = DynamicUpdatesClient()
     client.login(email=adminEmail, password=adminPassword)
     client.connect()
-    client.join_dynamic_updates_room()
-    time.sleep(1)
+    assert client.join_dynamic_updates_room() == {'status': 'ok'}
 
   def test_run_trigger_admin(self):
     client = DynamicUpdatesClient()
     client.login(email=adminEmail, password=adminPassword)
     client.connect()
     client.join_dynamic_updates_room()
-    client.run_trigger("emit_to_admin")
-    time.sleep(1)
+    t = client.run_trigger("emit_to_admin")
+    client.wait_for(since=t)
     assert len(client.updates) == 1
-    client.run_trigger("emit_to_staff")
-    time.sleep(1)
+    t = client.run_trigger("emit_to_staff")
+    client.expect_no_event(since=t)
     assert len(client.updates) == 1
-    client.run_trigger("emit_to_admin_and_staff")
-    time.sleep(1)
+    t = client.run_trigger("emit_to_admin_and_staff")
+    client.wait_for(since=t)
     assert len(client.updates) == 2
-    client.run_trigger("emit_tenant_wide")
-    time.sleep(1)
+    t = client.run_trigger("emit_tenant_wide")
+    client.wait_for(since=t)
     assert len(client.updates) == 3
 
   def test_run_trigger_staff(self):
@@ -57,52 +55,55 @@ class Test:
     client.login(email=staffEmail, password=staffPassword)
     client.connect()
     client.join_dynamic_updates_room()
-    client.run_trigger("emit_to_admin")
-    time.sleep(1)
+    t = client.run_trigger("emit_to_admin")
+    client.expect_no_event(since=t)
     assert len(client.updates) == 0
-    client.run_trigger("emit_to_staff")
-    time.sleep(1)
+    t = client.run_trigger("emit_to_staff")
+    client.wait_for(since=t)
     assert len(client.updates) == 1
-    client.run_trigger("emit_to_admin_and_staff")
-    time.sleep(1)
+    t = client.run_trigger("emit_to_admin_and_staff")
+    client.wait_for(since=t)
     assert len(client.updates) == 2
-    client.run_trigger("emit_tenant_wide")
-    time.sleep(1)
+    t = client.run_trigger("emit_tenant_wide")
+    client.wait_for(since=t)
     assert len(client.updates) == 3
 
   def test_connect_public(self):
     client = DynamicUpdatesClient()
     client.connect_as_public()
-    assert client.sio.connected
-    client.sio.disconnect()
+    assert client.connected
+    client.disconnect()
 
   def test_join_dynamic_updates_room_public(self):
     client = DynamicUpdatesClient()
     client.connect_as_public()
-    client.join_dynamic_updates_room()
-    time.sleep(1)
+    assert client.join_dynamic_updates_room() == {'status': 'ok'}
 
   def test_run_trigger_public(self):
     public_client = DynamicUpdatesClient()
     public_client.connect_as_public()
     public_client.join_dynamic_updates_room()
-    time.sleep(0.5)  # wait for room join to complete
 
-    # public session can't call trigger API — use a logged-in client to fire triggers
+    # public session can't call trigger API — use a logged-in client to fire
+    # triggers, whose own socket sees the admin updates arrive first
     admin_client = DynamicUpdatesClient()
     admin_client.login(email=adminEmail, password=adminPassword)
+    admin_client.connect()
+    admin_client.join_dynamic_updates_room()
 
-    admin_client.run_trigger("emit_to_admin")
-    time.sleep(1)
+    t = admin_client.run_trigger("emit_to_admin")
+    admin_client.wait_for(since=t)
+    public_client.expect_no_event(since=t)
     assert len(public_client.updates) == 0
-    admin_client.run_trigger("emit_to_staff")
-    time.sleep(1)
+    t = admin_client.run_trigger("emit_to_staff")
+    public_client.expect_no_event(since=t)
     assert len(public_client.updates) == 0
-    admin_client.run_trigger("emit_to_admin_and_staff")
-    time.sleep(1)
+    t = admin_client.run_trigger("emit_to_admin_and_staff")
+    admin_client.wait_for(since=t)
+    public_client.expect_no_event(since=t)
     assert len(public_client.updates) == 0
-    admin_client.run_trigger("emit_to_public")
-    time.sleep(1)
+    t = admin_client.run_trigger("emit_to_public")
+    public_client.wait_for(since=t)
     assert len(public_client.updates) == 1
 
   def test_broadcast_reaches_multiple_public_clients(self):
@@ -114,18 +115,18 @@ class Test:
     client_b = DynamicUpdatesClient()
     client_b.connect_as_public()
     client_b.join_dynamic_updates_room()
-    time.sleep(0.5)
 
     assert client_a.page_load_tag != client_b.page_load_tag
 
     admin_client = DynamicUpdatesClient()
     admin_client.login(email=adminEmail, password=adminPassword)
-    admin_client.run_trigger("emit_to_public")
-    time.sleep(1)
+    t = admin_client.run_trigger("emit_to_public")
+    client_a.wait_for(since=t)
+    client_b.wait_for(since=t)
     assert len(client_a.updates) == 1
     assert len(client_b.updates) == 1
-    client_a.sio.disconnect()
-    client_b.sio.disconnect()
+    client_a.disconnect()
+    client_b.disconnect()
 
   def test_public_clients_receive_page_load_tag_in_emit(self):
     # Server broadcasts to all public clients; each client receives the page_load_tag
@@ -137,15 +138,15 @@ class Test:
     client_b = DynamicUpdatesClient()
     client_b.connect_as_public()
     client_b.join_dynamic_updates_room()
-    time.sleep(0.5)
 
     assert client_a.page_load_tag != client_b.page_load_tag
 
     admin_client = DynamicUpdatesClient()
     admin_client.login(email=adminEmail, password=adminPassword)
     # Fire trigger tagged with client_a's page_load_tag
-    admin_client.run_trigger("emit_to_public", page_load_tag=client_a.page_load_tag)
-    time.sleep(1)
+    t = admin_client.run_trigger("emit_to_public", page_load_tag=client_a.page_load_tag)
+    client_a.wait_for(since=t)
+    client_b.wait_for(since=t)
 
     # Both clients receive the emit (server does not filter by page_load_tag)
     assert len(client_a.updates) == 1
@@ -156,25 +157,25 @@ class Test:
     assert received_tag == client_a.page_load_tag
     assert received_tag != client_b.page_load_tag
 
-    client_a.sio.disconnect()
-    client_b.sio.disconnect()
+    client_a.disconnect()
+    client_b.disconnect()
 
   def test_run_trigger_user(self):
     client = DynamicUpdatesClient()
     client.login(email=userEmail, password=userPassword)
     client.connect()
     client.join_dynamic_updates_room()
-    client.run_trigger("emit_to_admin")
-    time.sleep(1)
+    t = client.run_trigger("emit_to_admin")
+    client.expect_no_event(since=t)
     assert len(client.updates) == 0
-    client.run_trigger("emit_to_staff")
-    time.sleep(1)
+    t = client.run_trigger("emit_to_staff")
+    client.expect_no_event(since=t)
     assert len(client.updates) == 0
-    client.run_trigger("emit_to_admin_and_staff")
-    time.sleep(1)
+    t = client.run_trigger("emit_to_admin_and_staff")
+    client.expect_no_event(since=t)
     assert len(client.updates) == 0
-    client.run_trigger("emit_tenant_wide")
-    time.sleep(1)
+    t = client.run_trigger("emit_tenant_wide")
+    client.wait_for(since=t)
     assert len(client.updates) == 1
 
   # ── Security tests for GHSA-23w3-vxv3-xm92 ─────────────────────────────────
@@ -198,19 +199,23 @@ class Test:
     attacker.login(email=userEmail, password=userPassword)
     attacker.connect()
     attacker.join_dynamic_updates_room()
-    time.sleep(0.5)
 
-    # emit_to_admin targets user_id=1 (admin); attacker is a regular user
+    # emit_to_admin targets user_id=1 (admin); attacker is a regular user.
+    # The admin's own socket is the barrier: once it has the update, the
+    # server has delivered it to every room it was going to
     trigger = DynamicUpdatesClient()
     trigger.login(email=adminEmail, password=adminPassword)
-    trigger.run_trigger("emit_to_admin")
-    time.sleep(1)
+    trigger.connect()
+    trigger.join_dynamic_updates_room()
+    t = trigger.run_trigger("emit_to_admin")
+    trigger.wait_for(since=t)
+    attacker.expect_no_event(since=t)
 
     assert len(attacker.updates) == 0, (
       "IDOR: regular user received a dynamic-update event intended for the "
       "admin user via the shared tenant-wide room"
     )
-    attacker.sio.disconnect()
+    attacker.disconnect()
 
   def test_cross_user_dynamic_update_isolation(self):
     """
@@ -226,22 +231,30 @@ class Test:
     user_client.login(email=userEmail, password=userPassword)
     user_client.connect()
     user_client.join_dynamic_updates_room()
-    time.sleep(0.5)
+
+    # staff_client is only the barrier for the staff-targeted update
+    staff_client = DynamicUpdatesClient()
+    staff_client.login(email=staffEmail, password=staffPassword)
+    staff_client.connect()
+    staff_client.join_dynamic_updates_room()
 
     trigger = DynamicUpdatesClient()
     trigger.login(email=adminEmail, password=adminPassword)
 
     # emit_to_admin targets user_id=1 — only admin_client should receive it
-    trigger.run_trigger("emit_to_admin")
-    time.sleep(1)
+    t = trigger.run_trigger("emit_to_admin")
+    admin_client.wait_for(since=t)
+    user_client.expect_no_event(since=t)
     assert len(admin_client.updates) == 1, "Admin must receive its own targeted event"
     assert len(user_client.updates) == 0, (
       "IDOR: user received a dynamic-update event intended for admin"
     )
 
     # emit_to_staff targets user_id=2 — neither admin nor user should receive it
-    trigger.run_trigger("emit_to_staff")
-    time.sleep(1)
+    t = trigger.run_trigger("emit_to_staff")
+    staff_client.wait_for(since=t)
+    admin_client.expect_no_event(since=t)
+    user_client.expect_no_event(since=t)
     assert len(admin_client.updates) == 1, (
       "Admin must not receive an event targeted at staff"
     )
@@ -249,8 +262,9 @@ class Test:
       "User must not receive an event targeted at staff"
     )
 
-    admin_client.sio.disconnect()
-    user_client.sio.disconnect()
+    admin_client.disconnect()
+    user_client.disconnect()
+    staff_client.disconnect()
 
   def test_authenticated_user_receives_own_dynamic_updates(self):
     """
@@ -261,11 +275,10 @@ class Test:
     admin_client.login(email=adminEmail, password=adminPassword)
     admin_client.connect()
     admin_client.join_dynamic_updates_room()
-    time.sleep(0.5)
 
-    admin_client.run_trigger("emit_to_admin")
-    time.sleep(1)
+    t = admin_client.run_trigger("emit_to_admin")
+    admin_client.wait_for(since=t)
     assert len(admin_client.updates) == 1, (
       "Admin must still receive its own targeted dynamic-update event"
     )
-    admin_client.sio.disconnect()
+    admin_client.disconnect()
@@ -0,0 +1,230 @@
+"""
+Dynamic update fan-out to thousands of subscribers. N public sockets,
+spread over every node of a ClusterHarness (and so over every node's
+cluster workers), join the dynamic update room the way a browser tab
+does. Then the fixture's emit_to_public trigger is called through
+/api/action at a fixed rate, on each node in turn:
+
+  SALTCORN_BENCH_SUBSCRIBERS=1000,5000,10000 SALTCORN_BENCH_NODES=1,2 \\
+    SALTCORN_BENCH_RATE=2 python3 fanout_bench.py
+
+Each emit is tagged with a page-load-tag, which the trigger passes on in
+the update, so every arrival is matched to the call that caused it.
+For every node count and N this reports delivery latency percentiles
+(split into subscribers on the emitting node and on the others), the
+fraction of the expected deliveries that arrived, and the CPU cores each
+node used. Written to bench-results/fanout.json.
+
+The subscribers live in SALTCORN_BENCH_CLIENT_PROCS processes, each with
+its own event loop, so that decoding 10k+ updates a second is not
+limited to one Python core; latencies compare time.monotonic() across
+them, which is the same clock on Linux.
+"""
+import os
+import time
+import logging
+import multiprocessing
+from scsession import SaltcornSession
+from session_pool import pool
+from cluster import ClusterHarness
+from latency import Histogram
+from socket_client import SocketHub, open_connections, close_connections, raise_fd_limit
+import benchutil
+
+benchutil.setup_logging()
+
+logger = logging.getLogger(__name__)
+
+TRIGGER = 'emit_to_public'
+TAG_PREFIX = 'fanout-'
+
+
+async def _join(conn):
+  ack = await conn.call('join_dynamic_update_room')
+  if not ack or ack.get('status') != 'ok':
+    raise RuntimeError("join_dynamic_update_room: %r" % (ack,))
+
+
+def _subscribers(urls, count, concurrency, ready, stop, out):
+  """
+  a client process: `count` public sockets, round robin over `urls`,
+  joined to the dynamic update room. Reports (connected, errors) on
+  `ready`, then once `stop` is set puts [(tag, node, arrived)] on `out`
+  """
+  raise_fd_limit(count + 256)
+  hub = SocketHub()
+  arrivals = []
+  conns, errors = [], []
+
+  def on_event(node):
+    def record(conn, event, data):
+      # runs on the hub's loop: keep it to an append
+      arrivals.append((data.get('page_load_tag') if isinstance(data, dict) else None,
+                       node, time.monotonic()))
+    return record
+
+  for node, url in enumerate(urls):
+    share = count // len(urls) + (1 if node < count % len(urls) else 0)
+    ok, failed = hub.run(open_connections(
+      url, [''] * share, events=['dynamic_update'], on_event=on_event(node),
+      join=_join, concurrency=concurrency))
+    conns += ok
+    errors += failed
+  ready.put((len(conns), [repr(e) for e in errors[:5]], len(errors)))
+  stop.wait()
+  hub.run(close_connections(conns))
+  hub.stop()
+  out.put(arrivals)
+
+
+class SubscriberProcs:
+  def __init__(self, urls, count, procs, concurrency):
+    ctx = multiprocessing.get_context('spawn')
+    self.ready = ctx.Queue()
+    self.out = ctx.Queue()
+    self.stop = ctx.Event()
+    self.procs = []
+    for i in range(procs):
+      share = count // procs + (1 if i < count % procs else 0)
+      if share:
+        self.procs.append(ctx.Process(
+          target=_subscribers, daemon=True,
+          args=(urls, share, concurrency, self.ready, self.stop, self.out)))
+
+  def start(self, timeout):
+    for p in self.procs:
+      p.start()
+    connected, errors, failed = 0, [], 0
+    for _ in self.procs:
+      n, errs, nfailed = self.ready.get(timeout=timeout)
+      connected += n
+      errors += errs
+      failed += nfailed
+    return connected, errors, failed
+
+  def collect(self, timeout=60):
+    self.stop.set()
+    arrivals = []
+    for _ in self.procs:
+      arrivals += self.out.get(timeout=timeout)
+    for p in self.procs:
+      p.join(timeout)
+    return arrivals
+
+
+def fire(cluster, sessions, rate, duration):
+  """call the trigger `rate` times a second, on each node in turn: {tag: (node, sent)}"""
+  sent, failed, late = {}, 0, 0
+  calls = Histogram('us')
+  start = time.monotonic()
+  for i in range(int(rate * duration)):
+    slot = start + i / rate
+    now = time.monotonic()
+    if now < slot:
+      time.sleep(slot - now)
+    elif now - slot > 1 / rate:
+      late += 1  # the calls themselves take longer than the interval
+    node = i % cluster.size
+    tag = TAG_PREFIX + str(i)
+    t = time.monotonic()
+    try:
+      sessions[node].apiPost('/api/action/' + TRIGGER, {},
+                             extra_headers={'page-load-tag': tag})
+      ok = sessions[node].status == 200
+    except Exception:
+      ok = False
+    calls.record((time.monotonic() - t) * 1e6)
+    if ok:
+      sent[tag] = (node, t)
+    else:
+      failed += 1
+  return sent, failed, late, calls
+
+
+def run_fanout(cluster, sessions, subscribers, rate, duration, drain, procs, concurrency):
+  urls = [cluster.node(i).base_url for i in range(cluster.size)]
+  clients = SubscriberProcs(urls, subscribers, procs, concurrency)
+  t0 = time.monotonic()
+  connected, errors, failed_connects = clients.start(timeout=600)
+  logger.info("%d subscribers joined over %d nodes in %.1fs, %d failed %s", connected,
+              cluster.size, time.monotonic() - t0, failed_connects, errors)
+  samplers = [cluster.node(i).start_sampler(1.0) for i in range(cluster.size)]
+  try:
+    sent, failed_calls, late, calls = fire(cluster, sessions, rate, duration)
+    time.sleep(drain)  # let the last updates arrive
+  finally:
+    for i in range(cluster.size):
+      cluster.node(i).stop_sampler()
+    arrivals = clients.collect()
+
+  overall, local, remote = Histogram('us'), Histogram('us'), Histogram('us')
+  delivered = 0
+  for tag, node, arrived in arrivals:
+    if tag not in sent:
+      continue
+    from_node, t = sent[tag]
+    us = (arrived - t) * 1e6
+    overall.record(us)
+    (local if node == from_node else remote).record(us)
+    delivered += 1
+  expected = connected * len(sent)
+  cpu = []
+  for sampler in samplers:
+    master, workers = benchutil.cpu(sampler)
+    cpu.append({'master': master, 'workers': workers,
+                'total': (master or 0) + sum(workers)})
+  result = {
+    'nodes': cluster.size,
+    'subscribers': subscribers,
+    'connected': connected,
+    'connect_errors': failed_connects,
+    'emits': len(sent),
+    'emit_errors': failed_calls,
+    'emits_late': late,
+    'call_p50_ms': benchutil.ms(calls, 50),
+    'call_p99_ms': benchutil.ms(calls, 99),
+    'delivered': delivered,
+    'delivered_fraction': delivered / expected if expected else None,
+    'latency_ms': {'p50': benchutil.ms(overall, 50), 'p90': benchutil.ms(overall, 90),
+                   'p99': benchutil.ms(overall, 99), 'max': (overall.max or 0) / 1000},
+    'local_p99_ms': benchutil.ms(local, 99),
+    'remote_p99_ms': benchutil.ms(remote, 99),
+    'cpu': cpu,
+    'latency': overall.to_dict(),
+  }
+  logger.info("%d nodes, %d subscribers: %.2f%% delivered, p50 %s p99 %s max %.1fms, "
+              "cpu per node %s", cluster.size, connected,
+              100 * (result['delivered_fraction'] or 0),
+              result['latency_ms']['p50'], result['latency_ms']['p99'],
+              result['latency_ms']['max'], ['%.2f' % c['total'] for c in cpu])
+  return result
+
+
+def main():
+  subscriber_counts = benchutil.env_ints('SALTCORN_BENCH_SUBSCRIBERS', '1000,5000,10000')
+  node_counts = benchutil.env_ints('SALTCORN_BENCH_NODES', '1,2')
+  workers = int(os.environ.get('SALTCORN_BENCH_WORKERS', 2))
+  rate = float(os.environ.get('SALTCORN_BENCH_RATE', 2))
+  duration = float(os.environ.get('SALTCORN_BENCH_DURATION', 20))
+  drain = float(os.environ.get('SALTCORN_BENCH_DRAIN', 5))
+  procs = int(os.environ.get('SALTCORN_BENCH_CLIENT_PROCS', 4))
+  concurrency = int(os.environ.get('SALTCORN_BENCH_CONCURRENCY', 100))
+  SaltcornSession.close_warm()
+  runs = []
+  for nodes in node_counts:
+    SaltcornSession.reset_to_fixtures()
+    with ClusterHarness(nodes=nodes, workers=workers) as cluster:
+      sessions = []
+      for i in range(nodes):
+        sessions.append(SaltcornSession(port=cluster.port(i), open_process=False))
+        pool.login(sessions[i], benchutil.ADMIN_EMAIL, benchutil.ADMIN_PASSWORD)
+      for subscribers in subscriber_counts:
+        runs.append(run_fanout(cluster, sessions, subscribers, rate, duration, drain,
+                               procs, concurrency))
+  return benchutil.write_report('fanout', {
+    'workers': workers, 'rate': rate, 'duration_s': duration, 'runs': runs,
+  })
+
+
+if __name__ == '__main__':
+  main()
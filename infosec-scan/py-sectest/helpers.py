@@ -1,3 +1,7 @@
+import os
+import errno
+import json
+import select
 import time
 from urllib.request import urlopen
 
@@ -13,3 +17,42 @@ def wait_for_port_open(url):
       i=i+1
       pass
   raise ValueError("wait_for_port_open: Iterations exceeded")
+
+class SignalPipe:
+  """
+  read end of the pipe a server started with SALTCORN_READY_FD=<write end>
+  reports on: one JSON line once it is ready, then one per later event
+  (e.g. {"state_reloaded": true} after SIGUSR2)
+  """
+
+  def __init__(self, fd, process):
+    self.fd = fd
+    self.process = process
+    self.buf = b''
+
+  def read(self, timeout=60):
+    """block until the next line and return its JSON"""
+    deadline = time.monotonic() + timeout
+    while b'\n' not in self.buf:
+      remaining = deadline - time.monotonic()
+      if remaining <= 0:
+        raise ValueError("SignalPipe: no signal from the server within %ss" % timeout)
+      fd = self.fd
+      if fd is None:
+        # closed, maybe by another thread while this one was reading
+        raise OSError(errno.EBADF, "SignalPipe: closed")
+      readable, _, _ = select.select([fd], [], [], remaining)
+      if not readable:
+        continue
+      chunk = os.read(fd, 4096)
+      if not chunk:
+        raise ValueError("SignalPipe: server closed the signal fd (exit status %s)"
+                         % self.process.poll())
+      self.buf += chunk
+    line, self.buf = self.buf.split(b'\n', 1)
+    return json.loads(line)
+
+  def close(self):
+    if self.fd is not None:
+      os.close(self.fd)
+      self.fd = None
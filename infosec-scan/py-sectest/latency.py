@@ -0,0 +1,226 @@
+import os
+import re
+import json
+import time
+import atexit
+import threading
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# 2^7 sub-buckets per power of two keeps every recorded value within ~1.6%,
+# the same trade-off HdrHistogram makes with 2 significant digits
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+
+ID_SEGMENT_RE = re.compile(r'^(\d+|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})$', re.I)
+
+
+class Histogram:
+  """
+  HDR-style log-linear histogram of non-negative integers (microseconds for
+  timings, bytes for sizes). Memory is bounded by the value range, not the
+  sample count, so it can stay attached to long benchmark runs.
+  """
+
+  def __init__(self, unit='us'):
+    self.unit = unit
+    self.counts = {}
+    self.count = 0
+    self.total = 0
+    self.min = None
+    self.max = None
+
+  @staticmethod
+  def _key(value):
+    shift = max(value.bit_length() - SUB_BUCKET_BITS, 0)
+    return (shift << SUB_BUCKET_BITS) | (value >> shift)
+
+  @staticmethod
+  def _value_at(key):
+    shift, mantissa = key >> SUB_BUCKET_BITS, key & (SUB_BUCKET_COUNT - 1)
+    if shift == 0:
+      return mantissa
+    # middle of the bucket's range
+    return (mantissa << shift) + (1 << (shift - 1))
+
+  def record(self, value):
+    value = max(int(value), 0)
+    key = self._key(value)
+    self.counts[key] = self.counts.get(key, 0) + 1
+    self.count += 1
+    self.total += value
+    self.min = value if self.min is None else min(self.min, value)
+    self.max = value if self.max is None else max(self.max, value)
+
+  def merge(self, other):
+    for key, n in other.counts.items():
+      self.counts[key] = self.counts.get(key, 0) + n
+    self.count += other.count
+    self.total += other.total
+    if other.count:
+      self.min = other.min if self.min is None else min(self.min, other.min)
+      self.max = other.max if self.max is None else max(self.max, other.max)
+
+  def percentile(self, p):
+    if not self.count:
+      return None
+    rank = max(1, -(-self.count * p // 100))
+    seen = 0
+    for key in sorted(self.counts):
+      seen += self.counts[key]
+      if seen >= rank:
+        return min(max(self._value_at(key), self.min), self.max)
+    return self.max
+
+  def to_dict(self):
+    return {
+      'unit': self.unit,
+      'count': self.count,
+      'min': self.min,
+      'max': self.max,
+      'mean': self.total / self.count if self.count else None,
+      'p50': self.percentile(50),
+      'p90': self.percentile(90),
+      'p95': self.percentile(95),
+      'p99': self.percentile(99),
+      'p999': self.percentile(99.9),
+      'buckets': {
+        str(self._value_at(key)): n for key, n in sorted(self.counts.items())
+      },
+    }
+
+
+def route_template(url, templates=()):
+  """
+  maps a concrete request path onto its route, e.g.
+  /actions/testrun/12?x=1 -> /actions/testrun/:id. Explicit `templates`
+  win; otherwise numeric and uuid path segments become :id
+  """
+  path = urlparse(url).path or '/'
+  parts = path.rstrip('/').split('/') or ['']
+  for template in templates:
+    tparts = template.rstrip('/').split('/')
+    if len(tparts) == len(parts) and all(
+        t.startswith(':') or t == p for t, p in zip(tparts, parts)):
+      return template
+  return '/'.join(':id' if ID_SEGMENT_RE.match(p) else p for p in parts) or '/'
+
+
+class LatencyRecorder:
+  """
+  Collects per-request timings, grouped by method and route template:
+  connect (dns + tcp + tls, 0 on a reused keep-alive connection), ttfb,
+  total, and approximate bytes in and out including headers.
+  """
+
+  METRICS = (('connect', 'us'), ('ttfb', 'us'), ('total', 'us'),
+             ('bytes_in', 'bytes'), ('bytes_out', 'bytes'))
+
+  def __init__(self, templates=()):
+    self.templates = list(templates)
+    self.routes = {}
+    self.lock = threading.Lock()
+
+  def add_template(self, template):
+    self.templates.append(template)
+
+  def record(self, method, url, status, connect, ttfb, total, bytes_in, bytes_out):
+    """timings in seconds, as returned by time.perf_counter() differences"""
+    route = '%s %s' % (method.upper(), route_template(url, self.templates))
+    with self.lock:
+      hists = self.routes.get(route)
+      if hists is None:
+        hists = {name: Histogram(unit) for name, unit in self.METRICS}
+        hists['status'] = {}
+        self.routes[route] = hists
+      hists['connect'].record(connect * 1e6)
+      hists['ttfb'].record(ttfb * 1e6)
+      hists['total'].record(total * 1e6)
+      hists['bytes_in'].record(bytes_in)
+      hists['bytes_out'].record(bytes_out)
+      hists['status'][str(status)] = hists['status'].get(str(status), 0) + 1
+
+  def to_dict(self):
+    with self.lock:
+      return {
+        route: {
+          name: (h if name == 'status' else h.to_dict())
+          for name, h in hists.items()
+        }
+        for route, hists in sorted(self.routes.items())
+      }
+
+  def dump(self, path):
+    with open(path, 'w') as f:
+      json.dump(self.to_dict(), f, indent=2)
+
+
+# --- connect timing for requests.Session -----------------------------------
+# requests only reports the time until response headers (resp.elapsed), so
+# connection setup is measured by the urllib3 connection classes themselves
+
+_connect_timing = threading.local()
+
+
+def reset_connect_time():
+  _connect_timing.seconds = 0.0
+
+
+def connect_time():
+  return getattr(_connect_timing, 'seconds', 0.0)
+
+
+class _TimedConnectMixin:
+  def connect(self):
+    t0 = time.perf_counter()
+    try:
+      super().connect()
+    finally:
+      _connect_timing.seconds = connect_time() + time.perf_counter() - t0
+
+
+class _TimedHTTPConnection(_TimedConnectMixin, HTTPConnection):
+  pass
+
+
+class _TimedHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+  pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+  ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+  ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+  def init_poolmanager(self, *args, **kwargs):
+    super().init_poolmanager(*args, **kwargs)
+    self.poolmanager.pool_classes_by_scheme = {
+      'http': _TimedHTTPConnectionPool,
+      'https': _TimedHTTPSConnectionPool,
+    }
+
+
+def headers_size(headers):
+  return sum(len(k) + len(v) + 4 for k, v in headers.items()) + 2
+
+
+def _recorder_from_env():
+  """
+  SALTCORN_SECTEST_LATENCY=<file.json> turns every Session into a latency
+  probe for the routes it touches; the histograms are written at exit
+  """
+  path = os.environ.get('SALTCORN_SECTEST_LATENCY')
+  if not path:
+    return None
+  rec = LatencyRecorder()
+  atexit.register(rec.dump, path)
+  return rec
+
+
+recorder = _recorder_from_env()
@@ -0,0 +1,303 @@
+"""
+Scenario-based virtual-user load generator.
+
+Each virtual user (VU) is an AsyncSaltcornSession with its own cookie jar;
+all VUs share one pooled transport and one event loop. A scenario is a
+list of steps built from the same primitives the tests use (login, view
+form submits, REST API calls, trigger testruns), so authenticated
+workloads can be benchmarked, not just static GETs:
+
+  gen = LoadGenerator(
+    [Scenario('browse', [get('/view/authorlist'), api_get('books')])],
+    setup=[login('admin@foo.com', 'AhGGr6rhu45')],
+    users=50, ramp_up=10, duration=60, think_time=(0.5, 2))
+  report = gen.run()
+  print(report.summary())
+  report.dump('browse')
+"""
+import time
+import random
+import asyncio
+import logging
+import httpx
+import benchutil
+from latency import Histogram
+from scsession import AsyncSaltcornSession
+from shard import shard
+
+logger = logging.getLogger(__name__)
+
+MAX_ERROR_SAMPLES = 20
+
+
+def _ms(us):
+  return None if us is None else us / 1000
+
+
+def _resolve(value, vu):
+  """step arguments may be callables of the VU, to vary data per user"""
+  return value(vu) if callable(value) else value
+
+
+class Step:
+  """
+  `action` is an async callable taking the VU. It may return False to flag
+  a failure; otherwise the step passes if `ok(status)` holds for the last
+  response status (default: anything below 400).
+  """
+
+  def __init__(self, name, action, ok=None, measured=True):
+    self.name = name
+    self.action = action
+    self.ok = ok or (lambda status: status is not None and status < 400)
+    self.measured = measured
+
+
+class Scenario:
+  def __init__(self, name, steps, weight=1):
+    self.name = name
+    self.steps = steps
+    self.weight = weight
+
+
+class VirtualUser:
+  def __init__(self, index, sess, seed=None):
+    self.index = index
+    self.sess = sess
+    self.random = random.Random(seed if seed is not None else index)
+    # scratch space for steps to hand values on (e.g. an inserted row id)
+    self.context = {}
+
+
+# --- steps -----------------------------------------------------------------
+
+def get(url, name=None, ok=None):
+  async def action(vu):
+    await vu.sess.get(_resolve(url, vu))
+  return Step(name or ('GET' if callable(url) else f'GET {url}'), action, ok)
+
+
+def login(email, password, name='login'):
+  async def action(vu):
+    await vu.sess.get('/auth/login')
+    await vu.sess.postForm('/auth/login', {
+      'email': _resolve(email, vu),
+      'password': _resolve(password, vu),
+      '_csrf': vu.sess.csrf(),
+    })
+    if vu.sess.redirect_url != '/':
+      return False
+    await vu.sess.refresh_csrf()
+  return Step(name, action)
+
+
+def submit_view_form(viewname, data, row_id=None, name=None):
+  """load the edit view (for its CSRF token), then post the form like a browser"""
+  async def action(vu):
+    rid = _resolve(row_id, vu)
+    await vu.sess.get(f'/view/{viewname}' + (f'?id={rid}' if rid is not None else ''))
+    if vu.sess.status != 200:
+      return False
+    form = {'_csrf': vu.sess.csrf(), **_resolve(data, vu)}
+    if rid is not None:
+      form['id'] = rid
+    await vu.sess.postForm(f'/view/{viewname}', form)
+  return Step(name or f'submit {viewname}', action)
+
+
+def api_get(table, query='', name=None):
+  async def action(vu):
+    q = _resolve(query, vu)
+    await vu.sess.get(f'/api/{table}' + (f'?{q}' if q else ''))
+  return Step(name or f'GET /api/{table}', action)
+
+
+def api_post(table, data, row_id=None, name=None):
+  """insert into `table`, or update `row_id` if given"""
+  async def action(vu):
+    rid = _resolve(row_id, vu)
+    url = f'/api/{table}' + (f'/{rid}' if rid is not None else '')
+    await vu.sess.apiPost(url, _resolve(data, vu))
+  return Step(name or f'POST /api/{table}', action)
+
+
+def api_action(action_name, data=None, name=None):
+  async def action(vu):
+    await vu.sess.apiPost(f'/api/action/{action_name}', _resolve(data, vu) or {})
+  return Step(name or f'POST /api/action/{action_name}', action)
+
+
+def testrun(trigger_id, name=None):
+  # testrun redirects back to the trigger whether or not the run failed
+  async def action(vu):
+    await vu.sess.get(f'/actions/testrun/{_resolve(trigger_id, vu)}')
+  return Step(name or 'GET /actions/testrun/:id', action,
+              ok=lambda status: status in (200, 302))
+
+
+def think(low, high=None, name='think'):
+  async def action(vu):
+    await asyncio.sleep(low if high is None else vu.random.uniform(low, high))
+  return Step(name, action, measured=False)
+
+
+# --- reporting -------------------------------------------------------------
+
+class LoadReport:
+  def __init__(self, users):
+    self.users = users
+    self.steps = {}
+    self.errors = []
+    self.started = None
+    self.finished = None
+
+  def record(self, key, seconds, ok, status, error=None):
+    entry = self.steps.get(key)
+    if entry is None:
+      entry = self.steps[key] = {
+        'latency': Histogram('us'), 'ok': 0, 'errors': 0, 'statuses': {},
+      }
+    entry['latency'].record(seconds * 1e6)
+    entry['ok' if ok else 'errors'] += 1
+    entry['statuses'][str(status)] = entry['statuses'].get(str(status), 0) + 1
+    if not ok and len(self.errors) < MAX_ERROR_SAMPLES:
+      self.errors.append({'step': key, 'status': status, 'error': error})
+
+  @property
+  def duration(self):
+    return (self.finished or time.perf_counter()) - self.started
+
+  def to_dict(self):
+    steps = {}
+    for key, entry in sorted(self.steps.items()):
+      h = entry['latency']
+      steps[key] = {
+        'count': h.count,
+        'errors': entry['errors'],
+        'rps': h.count / self.duration if self.duration else None,
+        'mean_ms': _ms(h.total / h.count if h.count else None),
+        'p50_ms': _ms(h.percentile(50)),
+        'p95_ms': _ms(h.percentile(95)),
+        'p99_ms': _ms(h.percentile(99)),
+        'max_ms': _ms(h.max),
+        'statuses': entry['statuses'],
+      }
+    total = sum(e['latency'].count for e in self.steps.values())
+    return {
+      'users': self.users,
+      'duration_s': self.duration,
+      'requests': total,
+      'errors': sum(e['errors'] for e in self.steps.values()),
+      'throughput_rps': total / self.duration if self.duration else None,
+      'steps': steps,
+      'error_samples': self.errors,
+    }
+
+  def summary(self):
+    d = self.to_dict()
+    lines = [
+      f"{d['users']} users, {d['duration_s']:.1f}s, {d['requests']} steps, "
+      f"{d['errors']} errors, {d['throughput_rps']:.1f} steps/s",
+      f"{'step':<48} {'count':>7} {'err':>5} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8}",
+    ]
+    for key, s in d['steps'].items():
+      lines.append(
+        f"{key:<48} {s['count']:>7} {s['errors']:>5} "
+        f"{s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f}")
+    return '\n'.join(lines)
+
+  def dump(self, name, **extra):
+    return benchutil.write_report(name, {**extra, **self.to_dict()})
+
+
+# --- engine ----------------------------------------------------------------
+
+class LoadGenerator:
+  """
+  Runs `users` VUs through weighted `scenarios`. VUs start evenly spread
+  over `ramp_up` seconds, run their `setup` steps once (e.g. login), then
+  loop over randomly picked scenarios until `duration` seconds have passed
+  or each has done `iterations` scenarios. `think_time` (seconds, or a
+  (low, high) range) is waited between steps and is not measured.
+  """
+
+  def __init__(self, scenarios, users=10, base_url=None,
+               setup=(), ramp_up=0, duration=None, iterations=None,
+               think_time=0, max_connections=None, recorder=None, seed=0):
+    assert duration or iterations, "give a duration or an iteration count"
+    self.scenarios = scenarios
+    self.users = users
+    self.base_url = base_url or shard.url()
+    self.setup = list(setup)
+    self.ramp_up = ramp_up
+    self.duration = duration
+    self.iterations = iterations
+    self.think_time = think_time if isinstance(think_time, (tuple, list)) \
+      else (think_time, think_time)
+    self.max_connections = max_connections or users
+    self.recorder = recorder
+    self.seed = seed
+
+  async def _run_step(self, vu, prefix, step, report):
+    if not step.measured:
+      await step.action(vu)
+      return True
+    t0 = time.perf_counter()
+    error = None
+    try:
+      result = await step.action(vu)
+      ok = result is not False and step.ok(vu.sess.status)
+    except Exception as e:
+      ok = False
+      error = f'{type(e).__name__}: {e}'
+    report.record(f'{prefix}/{step.name}', time.perf_counter() - t0, ok,
+                  vu.sess.status, error)
+    return ok
+
+  async def _think(self, vu):
+    low, high = self.think_time
+    if high > 0:
+      await asyncio.sleep(vu.random.uniform(low, high))
+
+  async def _run_user(self, vu, deadline, report):
+    for step in self.setup:
+      if not await self._run_step(vu, 'setup', step, report):
+        logger.warning("VU %d: setup step %s failed, not starting", vu.index, step.name)
+        return
+    weights = [s.weight for s in self.scenarios]
+    done = 0
+    while (deadline is None or time.perf_counter() < deadline) \
+        and (self.iterations is None or done < self.iterations):
+      scenario = vu.random.choices(self.scenarios, weights)[0]
+      for step in scenario.steps:
+        await self._run_step(vu, scenario.name, step, report)
+        await self._think(vu)
+      done += 1
+
+  async def arun(self):
+    report = LoadReport(self.users)
+    transport = httpx.AsyncHTTPTransport(
+      limits=httpx.Limits(max_connections=self.max_connections,
+                          max_keepalive_connections=self.max_connections))
+    vus = [
+      VirtualUser(i, AsyncSaltcornSession(base_url=self.base_url, transport=transport,
+                                          recorder=self.recorder), seed=self.seed + i)
+      for i in range(self.users)
+    ]
+
+    async def start(vu):
+      if self.ramp_up:
+        await asyncio.sleep(self.ramp_up * vu.index / self.users)
+      await self._run_user(vu, deadline, report)
+
+    report.started = time.perf_counter()
+    deadline = report.started + self.ramp_up + self.duration if self.duration else None
+    try:
+      await asyncio.gather(*(start(vu) for vu in vus))
+    finally:
+      report.finished = time.perf_counter()
+      await transport.aclose()
+    return report
+
+  def run(self):
+    return asyncio.run(self.arun())
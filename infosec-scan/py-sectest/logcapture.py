@@ -0,0 +1,96 @@
+"""
+Bounded capture of a server's output as structured records, so tests can
+wait on what the server actually logged instead of sleeping:
+
+  mark = sess.logs.mark()
+  os.kill(pid, signal.SIGHUP)
+  sess.wait_for_log(r'SIGHUP received', since=mark)
+
+Servers started by SaltcornSession with pipe_output=True log with
+SALTCORN_LOG_FORMAT=json, so records from State.log() carry the server's
+own timestamp, pid, level and tenant. Other lines (node warnings, plain
+console.log) are kept too, with only the arrival time.
+"""
+import re
+import json
+import time
+import threading
+import collections
+
+DEFAULT_CAPACITY = 10000
+
+LogRecord = collections.namedtuple(
+  'LogRecord', ['seq', 'time', 'server_time', 'pid', 'level', 'tenant', 'message'])
+
+
+def parse_line(line):
+  """(server_time, pid, level, tenant, message); server fields None for plain lines"""
+  line = line.rstrip('\n')
+  if line.startswith('{"ts":'):
+    try:
+      rec = json.loads(line)
+      return rec['ts'] / 1000, rec.get('pid'), rec.get('level'), rec.get('tenant'), rec.get('msg', '')
+    except (ValueError, KeyError, TypeError):
+      pass
+  return None, None, None, None, line
+
+
+def _matcher(pattern):
+  if callable(pattern):
+    return pattern
+  regex = re.compile(pattern) if isinstance(pattern, str) else pattern
+  return lambda rec: regex.search(rec.message) is not None
+
+
+class LogBuffer:
+  """ring buffer of the last `capacity` records, safe to feed from a reader thread"""
+
+  def __init__(self, capacity=DEFAULT_CAPACITY):
+    self.records = collections.deque(maxlen=capacity)
+    self.cond = threading.Condition()
+    self.seq = 0
+
+  def append(self, line):
+    server_time, pid, level, tenant, message = parse_line(line)
+    with self.cond:
+      self.seq += 1
+      rec = LogRecord(self.seq, time.time(), server_time, pid, level, tenant, message)
+      self.records.append(rec)
+      self.cond.notify_all()
+    return rec
+
+  def mark(self):
+    """position to pass as `since`, to only look at records logged after now"""
+    with self.cond:
+      return self.seq
+
+  def find(self, pattern, since=0, level=None, tenant=None):
+    """
+    records whose message matches `pattern` (a regex, or a callable taking
+    the record), optionally only at log `level` or below, or for `tenant`
+    """
+    match = _matcher(pattern)
+    with self.cond:
+      return [r for r in self.records
+              if r.seq > since and (level is None or (r.level is not None and r.level <= level))
+              and (tenant is None or r.tenant == tenant) and match(r)]
+
+  def count_logs(self, pattern, since=0, **kwargs):
+    return len(self.find(pattern, since, **kwargs))
+
+  def wait_for_log(self, pattern, timeout=10, since=0, count=1, **kwargs):
+    """
+    block until `count` matching records exist after `since`; returns the
+    last of them, or raises TimeoutError
+    """
+    deadline = time.monotonic() + timeout
+    with self.cond:
+      while True:
+        found = self.find(pattern, since, **kwargs)
+        if len(found) >= count:
+          return found[count - 1]
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+          raise TimeoutError("no server log matching %r within %ss (%d of %d seen)"
+                             % (pattern, timeout, len(found), count))
+        self.cond.wait(remaining)
@@ -1,11 +1,12 @@
 from scsession import SaltcornSession
+from shard import shard
 email = "admin@foo.com"
 password="AhGGr6rhu45"
 
 class Test:
     def setup_class(self):
         SaltcornSession.reset_to_fixtures()
-        self.sess = SaltcornSession(3001)
+        self.sess = SaltcornSession.warm(shard.port())
 
     def teardown_class(self):
         self.sess.close()
@@ -1,4 +1,5 @@
 from scsession import SaltcornSession
+from shard import shard
 from logs_viewer_client import LogsViewerClient
 import time
 import logging
@@ -15,7 +16,7 @@ class Test:
   def setup_class(self):
     SaltcornSession.reset_to_fixtures()
     SaltcornSession.cli("set-cfg", "log_level", "3")
-    self.sess = SaltcornSession(port=3001)
+    self.sess = SaltcornSession.warm(port=shard.port())
 
   def teardown_class(self):
     self.sess.close()
@@ -28,14 +29,12 @@ class Test:
       adminClient.login(email=adminEmail, password=adminPassword)
       adminClient.connect()
       adminClient.join_logs_room()
-      time.sleep(0.2)
       assert adminClient.callbackResult == { 'status': 'ok'} 
       # not authorized
       staffClient = LogsViewerClient()
       staffClient.login(email=staffEmail, password=staffPassword)
       staffClient.connect()
       staffClient.join_logs_room()
-      time.sleep(0.2)
       assert staffClient.callbackResult == {'msg': 'Not authorized', 'status': 'error'}
     finally:
       if adminClient is not None:
@@ -51,10 +50,9 @@ class Test:
       adminClient.login(email=adminEmail, password=adminPassword)
       adminClient.connect()
       adminClient.join_logs_room()
-      time.sleep(0.2)
       assert adminClient.callbackResult == { 'status': 'ok'} 
       adminClient.load_view()
-      time.sleep(0.2)
+      adminClient.wait_for(lambda m: m['text'] == 'Route /view/rooms_view user=1')
       assert len(adminClient.messages) == 1
       assert adminClient.has_log('Route /view/rooms_view user=1')
       # can't join but produce logs
@@ -62,17 +60,18 @@ class Test:
       staffClient.login(email=staffEmail, password=staffPassword)
       staffClient.connect()
       staffClient.load_view()
-      time.sleep(0.2)
+      adminClient.wait_for(lambda m: m['text'] == 'Route /view/rooms_view user=2')
       assert len(adminClient.messages) == 2
       assert adminClient.has_log('Route /view/rooms_view user=2')
+      staffClient.expect_no_event(window=0.2)
       assert len(staffClient.messages) == 0
       # join again and only get the new logs
       adminClientB = LogsViewerClient()
       adminClientB.login(email=adminEmail, password=adminPassword)
       adminClientB.connect()
       adminClientB.join_logs_room()
-      time.sleep(0.2)
       assert adminClientB.callbackResult == { 'status': 'ok'}
+      adminClientB.expect_no_event(window=0.2, since=time.monotonic())
       assert len(adminClientB.messages) == 0
       # LOGGER.info (adminClient.messages)
     finally:
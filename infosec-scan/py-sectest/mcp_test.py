@@ -5,6 +5,7 @@ import logging
 import pytest
 import httpx
 from scsession import SaltcornSession
+from shard import shard
 from mcp.client.streamable_http import streamable_http_client
 from mcp import ClientSession
 
@@ -16,7 +17,7 @@ AGENTS_PLUGIN = "@saltcorn/agents"
 
 ADMIN_EMAIL = "admin@foo.com"
 ADMIN_PASSWORD = "AhGGr6rhu45"
-MCP_URL = "http://localhost:3001/mcp"
+MCP_URL = shard.url("mcp")
 
 
 def auth_client(token):
@@ -32,7 +33,8 @@ class Test:
         cls.api_token = SaltcornSession.cli("modify-user", "-g", ADMIN_EMAIL)
         cls.staff_api_token = SaltcornSession.cli("modify-user", "-g", "staff@foo.com")
         logger.info("API token: %s", cls.api_token)
-        cls.sess = SaltcornSession(port=3001)
+        # a cold process: the plugins installed above mount their routes at boot
+        cls.sess = SaltcornSession(port=shard.port())
         cls._login(cls)
         trigger_id = cls._create_agent_trigger(cls)
         cls._configure_agent_trigger(cls, trigger_id)
@@ -0,0 +1,136 @@
+"""
+Room join and leave throughput of one node. M logged-in sockets connect
+at once and each joins the log, collab and dynamic update rooms, then
+they all disconnect together:
+
+  SALTCORN_BENCH_SOCKETS=500,2000 SALTCORN_BENCH_WORKERS=4 \\
+    SALTCORN_BENCH_LABEL=after python3 membership_bench.py
+
+Joins are timed by their acks: joins/s over the whole phase and latency
+percentiles per room kind. A leave has no ack, so the leave phase runs
+from the first disconnect until the node's CPU falls back to idle,
+which gives leaves/s and the CPU seconds the node spent on them. Run it
+on two commits with a different SALTCORN_BENCH_LABEL to compare them,
+e.g. the room membership kept in ephemeral config arrays against
+server/socket_members.js. Written to
+bench-results/socket-membership[-label].json.
+"""
+import os
+import time
+import logging
+from scsession import SaltcornSession
+from session_pool import pool
+from latency import Histogram
+from socket_client import SocketHub, open_connections, close_connections, raise_fd_limit
+import benchutil
+
+benchutil.setup_logging()
+
+logger = logging.getLogger(__name__)
+
+# kind -> event and its payload; an admin may join all of them
+JOINS = [
+  ('log', 'join_log_room', None),
+  ('collab', 'join_collab_room', 'authoredit'),
+  ('dynamic_update', 'join_dynamic_update_room', None),
+]
+# the node is idle again below this many cores busy
+IDLE = 0.05
+
+
+def _cpu_s(sample):
+  return sample['total']['cpu_s']
+
+
+def wait_idle(sampler, since, timeout):
+  """when the node's CPU use last dropped below IDLE after `since`, and the CPU s spent"""
+  deadline = time.monotonic() + timeout
+  start = None
+  while time.monotonic() < deadline:
+    samples = [s for s in sampler.samples if sampler.started + s['t'] >= since]
+    if start is None and samples:
+      start = samples[0]
+    for prev, cur in zip(samples, samples[1:]):
+      if (_cpu_s(cur) - _cpu_s(prev)) / (cur['t'] - prev['t']) < IDLE:
+        return sampler.started + prev['t'], _cpu_s(prev) - _cpu_s(start)
+    time.sleep(sampler.interval)
+  return None, None
+
+
+def run_round(sess, hub, cookie, sockets, concurrency, timeout):
+  acks = {kind: Histogram('us') for kind, _, _ in JOINS}
+  refused = []
+
+  async def join(conn):
+    for kind, event, data in JOINS:
+      t = time.monotonic()
+      ack = await conn.call(event, data)
+      acks[kind].record((time.monotonic() - t) * 1e6)
+      if not ack or ack.get('status') != 'ok':
+        refused.append((kind, ack))
+
+  sampler = sess.start_sampler(0.25)
+  try:
+    t0 = time.monotonic()
+    conns, errors = hub.run(open_connections(
+      sess.base_url, [cookie] * sockets, join=join, concurrency=concurrency))
+    joined = time.monotonic() - t0
+    join_cpu = _cpu_s(sampler.samples[-1]) - _cpu_s(sampler.samples[0]) \
+      if len(sampler.samples) > 1 else None
+    t1 = time.monotonic()
+    hub.run(close_connections(conns))
+    idle_at, leave_cpu = wait_idle(sampler, t1, timeout)
+  finally:
+    sess.stop_sampler()
+  joins = len(conns) * len(JOINS)
+  left = idle_at - t1 if idle_at is not None else None
+  result = {
+    'sockets': sockets,
+    'connected': len(conns),
+    'connect_errors': len(errors),
+    'refused_joins': len(refused),
+    'join_s': joined,
+    'joins_per_s': joins / joined if joined else None,
+    'join_cpu_s': join_cpu,
+    'join_ack_ms': {kind: {'p50': benchutil.ms(h, 50), 'p99': benchutil.ms(h, 99)}
+                    for kind, h in acks.items()},
+    'leave_s': left,
+    'leaves_per_s': len(conns) / left if left else None,
+    'leave_cpu_s': leave_cpu,
+  }
+  logger.info("%d sockets: %.0f joins/s (p99 ack %s), %s leaves/s using %s CPU s",
+              len(conns), result['joins_per_s'] or 0,
+              {k: v['p99'] for k, v in result['join_ack_ms'].items()},
+              '%.0f' % result['leaves_per_s'] if left else 'never idle in %ss' % timeout,
+              '%.2f' % leave_cpu if leave_cpu is not None else '-')
+  if refused:
+    logger.warning("%d joins refused, e.g. %r", len(refused), refused[0])
+  return result
+
+
+def main():
+  socket_counts = benchutil.env_ints('SALTCORN_BENCH_SOCKETS', '500,2000')
+  workers = int(os.environ.get('SALTCORN_BENCH_WORKERS', 4))
+  concurrency = int(os.environ.get('SALTCORN_BENCH_CONCURRENCY', 200))
+  timeout = float(os.environ.get('SALTCORN_BENCH_TIMEOUT', 120))
+  label = os.environ.get('SALTCORN_BENCH_LABEL', '')
+  raise_fd_limit(max(socket_counts) + 256)
+  SaltcornSession.close_warm()
+  SaltcornSession.reset_to_fixtures()
+  server = SaltcornSession(env_vars={'SALTCORN_NWORKERS': workers})
+  hub = SocketHub()
+  try:
+    pool.login(server, benchutil.ADMIN_EMAIL, benchutil.ADMIN_PASSWORD)
+    cookie = 'connect.sid=' + server.sessionID() + '; loggedin=true'
+    rounds = [run_round(server, hub, cookie, n, concurrency, timeout)
+              for n in socket_counts]
+  finally:
+    hub.stop()
+    server.close()
+  return benchutil.write_report('socket-membership' + ('-' + label if label else ''), {
+    'label': label, 'workers': workers, 'rounds': rounds,
+  })
+
+
+if __name__ == '__main__':
+  main()
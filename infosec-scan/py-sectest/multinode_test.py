@@ -1,4 +1,7 @@
 from scsession import SaltcornSession
+from session_pool import pool
+from cluster import ClusterHarness
+from busmonitor import BusMonitor, install_flood_trigger, flood, bench_seq
 import logging
 
 logging.basicConfig(
@@ -12,28 +15,20 @@ logger = logging.getLogger(__name__)
 email='admin@foo.com'
 password='AhGGr6rhu45'
 
-# function to login
+# function to login, reusing a pooled session cookie where still valid
 def login(sess):
-  sess.get('/auth/login')
-  sess.postForm('/auth/login',
-    {'email': email, 
-    'password': password, 
-    '_csrf':  sess.csrf()
-    })
+  pool.login(sess, email, password)
 
 class Test:
   def setup_class(self):
     SaltcornSession.reset_to_fixtures()
-    self.sess1 = SaltcornSession(port=3001, env_vars={
-        "SALTCORN_MULTI_NODE": True,
-    }, pipe_output=True)
-    self.sess2 = SaltcornSession(port=3002, env_vars={
-        "SALTCORN_MULTI_NODE": True,
-    }, pipe_output=True)
+    install_flood_trigger()
+    self.cluster = ClusterHarness(nodes=2, pipe_output=True)
+    self.cluster.start()
+    self.sess1, self.sess2 = self.cluster.nodes
 
   def teardown_class(self):
-    self.sess1.close()
-    self.sess2.close()
+    self.cluster.close()
 
 
   # TEST 1:
@@ -305,4 +300,24 @@ class Test:
     login(self.sess2)
     self.sess2.get('/actions/configure/trigger_from_sess1')
     assert self.sess2.status == 200
-    assert 'An error occurred' not in self.sess2.content
\ No newline at end of file
+    assert 'An error occurred' not in self.sess2.content
+
+
+  # TEST 8:
+  # a burst of messages, some too large for one NOTIFY, reaches the other
+  # nodes complete and in order
+  def test_message_bus_no_drops(self):
+    login(self.sess1)
+    with BusMonitor() as bus:
+      flood(self.sess1, count=300)
+      flood(self.sess1, count=3, size=20000, start=300)
+      found = bus.wait_for(lambda m: bench_seq(m) is not None, count=303)
+    seqs = [bench_seq(m.message) for m in found]
+    assert sorted(seqs) == list(range(303))
+    # one request's messages keep their order
+    assert [s for s in seqs if s < 300] == list(range(300))
+    assert sorted(bench_seq(m.message) for m in found if m.spilled) == [300, 301, 302]
+    stats = bus.stats()
+    assert stats['seq_gaps'] == 0
+    # coalesced, not one NOTIFY per message
+    assert stats['notifies'] < 303
@@ -1,8 +1,9 @@
-import re
-import time
 import threading
 import logging
 from scsession import SaltcornSession
+from session_pool import pool
+from cluster import ClusterHarness
+from scdb import db
 
 logging.basicConfig(
   level=logging.INFO,
@@ -16,30 +17,22 @@ email = 'admin@foo.com'
 password = 'AhGGr6rhu45'
 
 
+# function to login, reusing a pooled session cookie where still valid
 def login(sess):
-  sess.get('/auth/login')
-  sess.postForm('/auth/login', {
-    'email': email,
-    'password': password,
-    '_csrf': sess.csrf(),
-  })
+  pool.login(sess, email, password)
 
 
 class Test:
   def setup_class(self):
     SaltcornSession.reset_to_fixtures()
-    self.sess1 = SaltcornSession(port=3001, env_vars={
-        "SALTCORN_MULTI_NODE": True,
-    }, pipe_output=True)
-    self.sess2 = SaltcornSession(port=3002, env_vars={
-        "SALTCORN_MULTI_NODE": True,
-    }, pipe_output=True)
+    self.cluster = ClusterHarness(nodes=2, pipe_output=True)
+    self.cluster.start()
+    self.sess1, self.sess2 = self.cluster.nodes
     login(self.sess1)
     login(self.sess2)
 
   def teardown_class(self):
-    self.sess1.close()
-    self.sess2.close()
+    self.cluster.close()
 
   # --- helpers ---------------------------------------------------------
 
@@ -81,15 +74,9 @@ class Test:
     results[key] = (sess.status, sess.content)
 
   def _markers(self, prefix):
-    out = SaltcornSession.cli(
-      "run-sql",
-      "--sql",
-      f"select author from books where author like '{prefix}-%' order by id",
-    )
-    # the cli echoes the query itself, which also contains '{prefix}-%' -
-    # drop that literal match, it's not a row
-    found = re.findall(rf"'({re.escape(prefix)}-[^']*)'", out)
-    return [m for m in found if m != f'{prefix}-%']
+    rows = db.query(
+      "select author from books where author like %s order by id", (f'{prefix}-%',))
+    return [row['author'] for row in rows]
 
   # --- tests -------------------------------------------------------------
 
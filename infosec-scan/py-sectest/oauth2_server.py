@@ -1,14 +1,23 @@
+import os
 import subprocess
 from helpers import wait_for_port_open
+from shard import shard
+
+# 3030 on the first shard
+PORT_OFFSET = 29
 
 class OAuth2Server:
-  def __init__(self, port=3030):
+  def __init__(self, port=None, saltcorn_port=None):
+    port = port or shard.port(PORT_OFFSET)
+    # the Saltcorn server it redirects back to
+    saltcorn_port = saltcorn_port or shard.port()
     subprocess.call(
       args=["npm", "install"],
       cwd="infosec-scan/oauth2-test-server")
     self.auth_server_process = subprocess.Popen(
         args=["node", "app.js"], 
-        cwd="infosec-scan/oauth2-test-server")
+        cwd="infosec-scan/oauth2-test-server",
+        env={**os.environ, "PORT": str(port), "SALTCORN_PORT": str(saltcorn_port)})
     self.base_url = 'http://localhost:%d/' % port
     wait_for_port_open(self.base_url)
 
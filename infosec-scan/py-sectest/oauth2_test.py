@@ -1,6 +1,7 @@
 import pytest
 from scsession import SaltcornSession
-from oauth2_server import OAuth2Server
+from shard import shard
+from oauth2_server import OAuth2Server, PORT_OFFSET
 
 class Test:
   def setup_class(self):
@@ -9,10 +10,11 @@ class Test:
     SaltcornSession.cli("set-cfg", "-p", "oauth2-auth", "clientID", "_saltcorn_client_id_")
     SaltcornSession.cli("set-cfg", "-p", "oauth2-auth", "clientSecret", "2e85aa0c063aa97329a31fbb")
     SaltcornSession.cli("set-cfg", "-p", "oauth2-auth", "label", "my test oauth2 server")
-    SaltcornSession.cli("set-cfg", "-p", "oauth2-auth", "authorizationURL", "http://localhost:3030/oauth2/authorize")
-    SaltcornSession.cli("set-cfg", "-p", "oauth2-auth", "tokenURL", "http://localhost:3030/oauth2/token")
+    SaltcornSession.cli("set-cfg", "-p", "oauth2-auth", "authorizationURL", shard.url("oauth2/authorize", PORT_OFFSET))
+    SaltcornSession.cli("set-cfg", "-p", "oauth2-auth", "tokenURL", shard.url("oauth2/token", PORT_OFFSET))
     SaltcornSession.cli("set-cfg", "-p", "oauth2-auth", "scope", "user.read")
-    self.sess = SaltcornSession(3001)
+    # a cold process: the plugin installed above sets up its login strategy at boot
+    self.sess = SaltcornSession(shard.port())
     self.oauth2_server = OAuth2Server()
 
   def teardown_class(self):
@@ -33,7 +35,7 @@ class Test:
   def test_login_with_userinfo_from_auth_server(self):
     # configure 'userInfoURL' to get the email
     self.sess.close()
-    SaltcornSession.cli("set-cfg", "-p", "oauth2-auth", "userInfoURL", "http://localhost:3030/user")
+    SaltcornSession.cli("set-cfg", "-p", "oauth2-auth", "userInfoURL", shard.url("user", PORT_OFFSET))
     self.sess.open()
     # skip auth server login and accept
     # the auth server uses a dummy user and accepts automaticly
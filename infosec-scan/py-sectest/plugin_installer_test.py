@@ -1,10 +1,9 @@
 import os
 import json
 import platform
-import signal
-import time
 import logging
 from scsession import SaltcornSession
+from shard import shard
 from helpers import wait_for_port_open
 
 logging.basicConfig(level=logging.INFO)
@@ -15,7 +14,7 @@ LOCAL_TEST_PLUGIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..
 TENANT = "py_test_tenant"
 ADMIN_EMAIL = "admine@foo.com"
 ADMIN_PASSWORD = "AhGGr6rhu45"
-TENANT_BASE_URL = f"http://{TENANT}.localhost:3001/"
+TENANT_BASE_URL = shard.url(host=f"{TENANT}.localhost")
 
 
 def _plugin_root_folder():
@@ -60,7 +59,8 @@ class TestLocalPluginInstaller:
             "package.json",
         )
 
-        cls.sess = SaltcornSession(3001, env_vars={"SALTCORN_NWORKERS": "2"})
+        # a cold process of its own: the SIGHUP reloads must not leak into a warm server
+        cls.sess = SaltcornSession(shard.port(), env_vars={"SALTCORN_NWORKERS": "2"})
 
     @classmethod
     def teardown_class(cls):
@@ -124,10 +124,8 @@ class TestLocalPluginInstaller:
         pid = self.sess.salcorn_process.pid
         assert pid is not None, "Server process should be running"
 
-        os.kill(pid, signal.SIGHUP)
-
-        # give the master time to call refresh_plugins() for all tenants
-        time.sleep(5)
+        # returns once the master and every worker reloaded all tenants
+        self.sess.reload_plugins()
 
         # the original process must still be alive — SIGHUP reloads, not restarts
         assert self.sess.salcorn_process.poll() is None, (
@@ -165,11 +163,7 @@ class TestLocalPluginInstaller:
             with open(index_js_path, "w") as f:
                 f.write(modified_index)
 
-            pid = self.sess.salcorn_process.pid
-            os.kill(pid, signal.SIGHUP)
-
-            # wait for the reload
-            time.sleep(5)
+            self.sess.reload_plugins()
 
             assert self.sess.salcorn_process.poll() is None, (
                 "Server must still be running after SIGHUP"
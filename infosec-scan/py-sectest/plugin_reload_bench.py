@@ -0,0 +1,199 @@
+"""
+What a SIGHUP plugin reload costs a live server. With many plugins
+installed in the root site and in several tenants, and a steady stream of
+requests to each of them, the code of a local plugin is changed and the
+server sent SIGHUP:
+
+  SALTCORN_BENCH_PLUGINS=10 SALTCORN_BENCH_TENANTS=4 \\
+    SALTCORN_BENCH_WORKERS=4 python3 plugin_reload_bench.py
+
+The bench plugin puts a marker into every page head. Each round measures
+the time from SIGHUP until every worker serves the new marker, in every
+site, and until the server reports it is done (see
+SaltcornSession.reload_plugins). It also records the requests that
+failed meanwhile, and request latency during the reload against the
+second before it. Written to bench-results/plugin-reload.json.
+"""
+import os
+import json
+import time
+import signal
+import shutil
+import tempfile
+import threading
+import logging
+from scsession import SaltcornSession
+from shard import shard
+from latency import Histogram
+from chaos import SteadyLoad
+import benchutil
+
+benchutil.setup_logging()
+
+logger = logging.getLogger(__name__)
+
+TENANT_PREFIX = 'benchreload'
+PLUGIN_NAME = 'bench-reload-plugin'
+URL = '/auth/login'
+MARKER = '<meta name="bench-reload" content="%d">'
+
+PLUGIN_JS = """module.exports = {
+  sc_plugin_api_version: 1,
+  plugin_name: "%s",
+  headers: [{ headerTag: '%s' }],
+};
+"""
+
+
+def write_plugin(folder, version):
+  with open(os.path.join(folder, 'index.js'), 'w') as f:
+    f.write(PLUGIN_JS % (PLUGIN_NAME, MARKER % version))
+
+
+def make_plugin():
+  """a local plugin with no dependencies, in a scratch folder"""
+  folder = tempfile.mkdtemp(prefix='sc-bench-reload-')
+  with open(os.path.join(folder, 'package.json'), 'w') as f:
+    json.dump({'name': '@saltcorn/' + PLUGIN_NAME, 'version': '0.1.0', 'main': 'index.js'}, f)
+  write_plugin(folder, 0)
+  return folder
+
+
+def site_url(tenant):
+  return shard.url() if tenant is None else shard.url(host='%s.localhost' % tenant)
+
+
+def setup_sites(plugins, tenants, folder):
+  SaltcornSession.reset_to_fixtures()
+  SaltcornSession.cli("set-cfg", "tenants_unsafe_plugins", "true")
+  sites = [None] + ['%s%d' % (TENANT_PREFIX, i) for i in range(tenants)]
+  for site in sites:
+    target = [] if site is None else ["-t", site]
+    if site is not None:
+      SaltcornSession.cli("create-tenant", site)
+    for name in benchutil.PLUGINS[:plugins]:
+      SaltcornSession.cli("install-plugin", "-n", name, *target)
+    SaltcornSession.cli("install-plugin", "-d", folder, *target)
+  benchutil.check_tenants(TENANT_PREFIX, tenants)
+  return sites
+
+
+def _watch(site, version, since, confirm, timeout, out):
+  """first time `site` shows the new marker, and when `confirm` requests in a row have"""
+  sess = SaltcornSession(open_process=False, port=shard.port())
+  sess.base_url = site_url(site)
+  marker = MARKER % version
+  first, streak, deadline = None, 0, since + timeout
+  try:
+    while time.monotonic() < deadline:
+      try:
+        sess.get(URL)
+        seen = marker in (sess.content or '')
+      except Exception:
+        seen = False
+      if seen:
+        now = time.monotonic()
+        first = first or now
+        streak += 1
+        if streak >= confirm:
+          out[site] = (first - since, now - since)
+          return
+      else:
+        streak = 0
+  finally:
+    sess.close()
+  out[site] = (None, None)
+
+
+def _latency(load, start, end):
+  h = Histogram('us')
+  with load.lock:
+    for r in load.requests:
+      if start <= r.start < end and r.ok:
+        h.record((r.end - r.start) * 1e6)
+  return h
+
+
+def reload_round(server, load, sites, folder, version, confirm, timeout):
+  write_plugin(folder, version)
+  seen = {}
+  t0 = time.monotonic()
+  server.salcorn_process.send_signal(signal.SIGHUP)
+  threads = [threading.Thread(target=_watch, args=(site, version, t0, confirm, timeout, seen))
+             for site in sites]
+  for t in threads:
+    t.start()
+  done = None
+  while done is None and time.monotonic() < t0 + timeout:
+    try:
+      if server.signals.read(timeout=1).get('plugins_reloaded'):
+        done = time.monotonic() - t0
+    except ValueError:
+      pass
+  for t in threads:
+    t.join()
+  settled = [s for _, s in seen.values()]
+  end = t0 + max([s for s in settled if s is not None] + [done or 0])
+  baseline = _latency(load, t0 - 1, t0)
+  during = _latency(load, t0, end)
+  window = load.window(t0)
+  result = {
+    'version': version,
+    'signalled_s': done,
+    'all_sites_settled_s': None if None in settled else max(settled),
+    'sites': {site or 'root': {'first_s': f, 'settled_s': s} for site, (f, s) in seen.items()},
+    'failed': window['failed'],
+    'errors': window['errors'],
+    'baseline_p99_ms': (baseline.percentile(99) or 0) / 1000,
+    'reload_p99_ms': (during.percentile(99) or 0) / 1000,
+    'reload_max_ms': (during.max or 0) / 1000,
+  }
+  logger.info("reload %d: all workers serve the new code after %s, server done after %s, "
+              "%d failed requests, p99 %.1fms -> %.1fms (max %.1fms)", version,
+              '%.2fs' % result['all_sites_settled_s'] if result['all_sites_settled_s']
+              is not None else 'never',
+              '%.2fs' % done if done is not None else 'never', window['failed'],
+              result['baseline_p99_ms'], result['reload_p99_ms'], result['reload_max_ms'])
+  return result
+
+
+def main():
+  plugins = int(os.environ.get('SALTCORN_BENCH_PLUGINS', 10))
+  tenants = int(os.environ.get('SALTCORN_BENCH_TENANTS', 4))
+  workers = int(os.environ.get('SALTCORN_BENCH_WORKERS', 4))
+  rounds = int(os.environ.get('SALTCORN_BENCH_ROUNDS', 5))
+  timeout = float(os.environ.get('SALTCORN_BENCH_TIMEOUT', 60))
+  pause = float(os.environ.get('SALTCORN_BENCH_PAUSE', 2))
+  if tenants:
+    # for the CLI and the server, which both inherit our environment
+    benchutil.enable_multi_tenant()
+  SaltcornSession.close_warm()
+  folder = make_plugin()
+  try:
+    sites = setup_sites(plugins, tenants, folder)
+    server = SaltcornSession(env_vars={'SALTCORN_NWORKERS': workers})
+    clients = {}
+    for site in sites:
+      clients[site] = SaltcornSession(open_process=False, port=shard.port())
+      clients[site].base_url = site_url(site)
+    load = SteadyLoad(clients, URL).start()
+    try:
+      results = []
+      for version in range(1, rounds + 1):
+        time.sleep(pause)  # a baseline before each reload
+        results.append(reload_round(server, load, sites, folder, version,
+                                    2 * workers, timeout))
+    finally:
+      load.stop()
+      server.close()
+    for site in sites[1:]:
+      SaltcornSession.cli_result("rm-tenant", "-f", "-t", site, check=False)
+  finally:
+    shutil.rmtree(folder, ignore_errors=True)
+  return benchutil.write_report('plugin-reload', {
+    'plugins': plugins, 'tenants': tenants, 'workers': workers, 'rounds': results,
+  })
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,447 @@
+"""
+How long a change made on one node of a multi-node cluster stays invisible
+on the others. For each kind of message the nodes exchange over
+LISTEN/NOTIFY, the benchmark makes a change on node A, timestamps the
+response, then tight-polls every node (A included, for its own workers)
+until the change shows, and keeps latency histograms per message kind:
+
+  SALTCORN_BENCH_NODES=2,4 SALTCORN_BENCH_ROUNDS=20 python3 propagation_bench.py
+
+Each poller records when its first successful poll was sent (`first`) and
+when it started seeing the change on `confirm` polls in a row (`settled`,
+one per worker by default, as the cluster balances requests over them).
+`remote_last_settled` is the time until every other node has settled, i.e.
+the stale window of the whole cluster. The report goes to
+bench-results/propagation.json.
+"""
+import os
+import json
+import time
+import types
+import threading
+import logging
+import scdb
+from scsession import SaltcornSession
+from shard import shard
+from session_pool import pool
+from cluster import ClusterHarness
+from latency import Histogram
+import benchutil
+
+benchutil.setup_logging()
+
+logger = logging.getLogger(__name__)
+
+TENANT = 'benchprop'
+TENANT_EMAIL = 'benchprop@foo.com'
+TENANT_PASSWORD = 'tyrh5h544yt48'
+
+THEME_PLUGIN = 'any-bootstrap-theme'
+THEME_MARKER = '/plugins/public/any-bootstrap-theme@'
+
+
+class Probe:
+  """a change to make on node A, and how to tell a node has picked it up"""
+  kind = None
+  # rounds to run, if fewer than SALTCORN_BENCH_ROUNDS
+  max_rounds = None
+
+  def kind_for(self, i):
+    return self.kind
+
+  def session(self, port):
+    sess = SaltcornSession(port=port, open_process=False)
+    pool.login(sess, benchutil.ADMIN_EMAIL, benchutil.ADMIN_PASSWORD)
+    return sess
+
+  def setup(self, sess):
+    pass
+
+  def write(self, sess, i):
+    """make change number i through `sess`; returns the token seen() looks for"""
+    raise NotImplementedError
+
+  def seen(self, sess, token):
+    raise NotImplementedError
+
+
+class TableProbe(Probe):
+  kind = 'refresh:tables'
+
+  def write(self, sess, i):
+    sess.get('/table/new')
+    sess.postForm('/table', {'name': 'prop_table_%d' % i, '_csrf': sess.csrf()})
+    assert sess.status == 302 and sess.redirect_url.startswith('/table/'), sess.status
+    return sess.redirect_url
+
+  def seen(self, sess, token):
+    sess.get(token)
+    return sess.status == 200
+
+
+class ViewProbe(Probe):
+  kind = 'refresh:views'
+
+  def write(self, sess, i):
+    name = 'prop_view_%d' % i
+    sess.get('/viewedit/new')
+    sess.postForm('/viewedit/save', {
+      'name': name,
+      'viewtemplate': 'List',
+      'table_name': 'albums',
+      'min_role': '1',
+      'description': '',
+      '_csrf': sess.csrf(),
+    })
+    assert sess.status == 302, sess.status
+    return '/view/' + name
+
+  def seen(self, sess, token):
+    sess.get(token)
+    return sess.status == 200
+
+
+class PageProbe(Probe):
+  kind = 'refresh:pages'
+
+  def write(self, sess, i):
+    name = 'prop_page_%d' % i
+    sess.get('/pageedit/new')
+    sess.postForm('/pageedit/edit-properties', {
+      'name': name,
+      'title': '',
+      'description': '',
+      'min_role': 1,
+      'attributes.no_menu': 'false',
+      'attributes.request_fluid_layout': 'false',
+      '_csrf': sess.csrf(),
+    })
+    assert sess.status == 302, sess.status
+    return name
+
+  def seen(self, sess, token):
+    sess.get('/page/' + token)
+    return sess.status == 200 and ('Page %s not found' % token) not in sess.content
+
+
+class TriggerProbe(Probe):
+  kind = 'refresh:triggers'
+
+  def write(self, sess, i):
+    name = 'prop_trigger_%d' % i
+    sess.get('/actions/new')
+    sess.postForm('/actions/new', {
+      'name': name,
+      'when_trigger': 'Insert',
+      'table_id': '18',
+      'action': 'run_js_code',
+      'description': '',
+      'configuration__only_if': '',
+      '_csrf': sess.csrf(),
+    })
+    assert sess.status == 302, sess.status
+    return '/actions/configure/' + name
+
+  def seen(self, sess, token):
+    sess.get(token)
+    return sess.status == 200 and 'An error occurred' not in sess.content
+
+
+class ConfigProbe(Probe):
+  kind = 'refresh:config'
+
+  def write(self, sess, i):
+    site_name = 'Propagation round %d' % i
+    sess.get('/admin')
+    sess.postForm('/admin', {
+      'site_name': site_name,
+      'timezone': 'Europe/Berlin',
+      'default_locale': 'en',
+      'base_url': '',
+      'multitenancy_enabled': 'on',
+      'site_logo_id': '',
+      'favicon_id': '',
+      'page_custom_css': '',
+      'page_custom_html': '',
+      'plugins_store_endpoint': 'https://store.saltcorn.com/api/extensions',
+      'packs_store_endpoint': 'https://store.saltcorn.com/api/packs',
+      'maintenance_mode_page': '',
+      '_csrf': sess.csrf(),
+    })
+    assert sess.status == 302, sess.status
+    return site_name
+
+  def seen(self, sess, token):
+    sess.get('/')
+    return token in sess.content
+
+
+def _theme_installed(sess):
+  sess.get('/')
+  return THEME_MARKER in sess.content
+
+
+def _install_theme(sess):
+  sess.get('/plugins')
+  sess.postForm('/plugins/install/' + THEME_PLUGIN, {'_csrf': sess.csrf()})
+  assert sess.status == 302, sess.status
+
+
+def _remove_theme(sess):
+  sess.get('/plugins')
+  sess.postForm('/plugins/delete/' + THEME_PLUGIN, {'_csrf': sess.csrf()})
+  assert sess.status == 302, sess.status
+
+
+class PluginConfigProbe(Probe):
+  kind = 'refresh_plugin_cfg'
+
+  def setup(self, sess):
+    if not _theme_installed(sess):
+      _install_theme(sess)
+
+  def write(self, sess, i):
+    mode = 'dark' if i % 2 == 0 else 'light'
+    sess.get('/plugins/configure/' + THEME_PLUGIN)
+    sess.postForm('/plugins/saveconfig/' + THEME_PLUGIN, {
+      **THEME_CONFIG, 'mode': mode, '_csrf': sess.csrf(),
+    })
+    assert sess.status == 200, sess.status
+    return mode
+
+  def seen(self, sess, token):
+    sess.get('/')
+    return 'data-bs-theme="%s"' % token in sess.content
+
+
+class PluginInstallProbe(Probe):
+  """installs and removes the theme in turn: installPlugin, then removePlugin"""
+  max_rounds = int(os.environ.get('SALTCORN_BENCH_PLUGIN_ROUNDS', 4))
+
+  def kind_for(self, i):
+    return 'installPlugin' if i % 2 == 0 else 'removePlugin'
+
+  def setup(self, sess):
+    if _theme_installed(sess):
+      _remove_theme(sess)
+
+  def write(self, sess, i):
+    if i % 2 == 0:
+      _install_theme(sess)
+    else:
+      _remove_theme(sess)
+    return i % 2 == 0
+
+  def seen(self, sess, token):
+    return _theme_installed(sess) == token
+
+
+class RestartTenantProbe(Probe):
+  """
+  changes the tenant's site name behind every node's back, straight in
+  the database, so only a tenant restart on a node can make it show
+  """
+  kind = 'restart_tenant'
+
+  def session(self, port):
+    sess = SaltcornSession(port=port, open_process=False)
+    # the server runs with --subdomain_offset 1, so this is the tenant
+    sess.base_url = shard.url(offset=port - shard.port(), host='%s.localhost' % TENANT)
+    pool.login(sess, TENANT_EMAIL, TENANT_PASSWORD)
+    return sess
+
+  def write(self, sess, i):
+    site_name = 'Restarted round %d' % i
+    scdb.db.tenant(TENANT).query(
+      "insert into _sc_config(key, value) values ('site_name', %s::jsonb) "
+      "on conflict (key) do update set value = excluded.value",
+      (json.dumps({'v': site_name}),))
+    sess.get('/admin')
+    sess.postForm('/admin/restart', {'_csrf': sess.csrf()})
+    assert sess.status == 302, sess.status
+    return site_name
+
+  def seen(self, sess, token):
+    sess.get('/')
+    return token in sess.content
+
+
+PROBES = [TableProbe(), ViewProbe(), PageProbe(), TriggerProbe(), ConfigProbe(),
+          PluginConfigProbe(), PluginInstallProbe(), RestartTenantProbe()]
+
+
+def _watch(sess, probe, rnd, results, i):
+  """poll one node until it shows the change on rnd.confirm polls in a row"""
+  rnd.go.wait()
+  first = settled = None
+  streak = 0
+  while True:
+    sent = time.perf_counter() - rnd.acked
+    if sent > rnd.timeout:
+      break
+    if probe.seen(sess, rnd.token):
+      if first is None:
+        first = sent
+      if streak == 0:
+        settled = sent
+      streak += 1
+      if streak >= rnd.confirm:
+        break
+    else:
+      streak = 0
+    time.sleep(rnd.interval)
+  results[i] = (first, settled if streak >= rnd.confirm else None)
+
+
+class KindStats:
+  def __init__(self):
+    self.hists = {name: Histogram() for name in (
+      'write', 'local_first', 'local_settled',
+      'remote_first', 'remote_settled', 'remote_last_settled')}
+    self.rounds = 0
+    self.timeouts = 0
+
+  def record(self, write_s, results):
+    self.rounds += 1
+    self.hists['write'].record(benchutil.us(write_s))
+    (local_first, local_settled), remote = results[0], results[1:]
+    if local_first is not None:
+      self.hists['local_first'].record(benchutil.us(local_first))
+    if local_settled is not None:
+      self.hists['local_settled'].record(benchutil.us(local_settled))
+    for first, settled in remote:
+      if first is not None:
+        self.hists['remote_first'].record(benchutil.us(first))
+      if settled is not None:
+        self.hists['remote_settled'].record(benchutil.us(settled))
+    if any(settled is None for _, settled in results):
+      self.timeouts += 1
+    elif remote:
+      self.hists['remote_last_settled'].record(benchutil.us(max(s for _, s in remote)))
+
+  def to_dict(self):
+    return {'rounds': self.rounds, 'timeouts': self.timeouts,
+            **{name: h.to_dict() for name, h in self.hists.items()}}
+
+
+def measure(probe, writer, watchers, i, confirm, timeout, interval):
+  """one change and the pollers timing it; returns (write seconds, per node results)"""
+  rnd = types.SimpleNamespace(go=threading.Event(), token=None, acked=None,
+                              confirm=confirm, timeout=timeout, interval=interval)
+  results = [None] * len(watchers)
+  threads = [threading.Thread(target=_watch, args=(w, probe, rnd, results, n))
+             for n, w in enumerate(watchers)]
+  for t in threads:
+    t.start()
+  started = time.perf_counter()
+  try:
+    rnd.token = probe.write(writer, i)
+  finally:
+    rnd.acked = time.perf_counter()
+    if rnd.token is None:
+      rnd.timeout = 0  # write failed: let the pollers exit
+    rnd.go.set()
+    for t in threads:
+      t.join()
+  return rnd.acked - started, results
+
+
+def _setup_tenant():
+  SaltcornSession.cli_result("rm-tenant", "-f", "-t", TENANT, check=False)
+  SaltcornSession.cli("create-tenant", TENANT)
+  benchutil.check_tenants(TENANT, 1)
+  SaltcornSession.cli("create-user", "-e", TENANT_EMAIL, "-a", "-p", TENANT_PASSWORD, "-t", TENANT)
+
+
+def run_cluster(nodes, workers, rounds, probes, timeout, interval):
+  SaltcornSession.reset_to_fixtures()
+  if any(isinstance(p, RestartTenantProbe) for p in probes):
+    benchutil.enable_multi_tenant()
+    _setup_tenant()
+  stats = {}
+  with ClusterHarness(nodes=nodes, workers=workers) as cluster:
+    for probe in probes:
+      writer = probe.session(cluster.port(0))
+      watchers = [probe.session(cluster.port(n)) for n in range(nodes)]
+      probe.setup(writer)
+      for i in range(min(rounds, probe.max_rounds or rounds)):
+        write_s, results = measure(probe, writer, watchers, i,
+                                   confirm=workers, timeout=timeout, interval=interval)
+        stats.setdefault(probe.kind_for(i), KindStats()).record(write_s, results)
+      for sess in [writer, *watchers]:
+        sess.close()
+  for kind, s in stats.items():
+    h = s.hists['remote_last_settled']
+    logger.info("%d nodes, %-20s stale window p50 %s ms, p99 %s ms, %d/%d timeouts",
+                nodes, kind,
+                h.percentile(50) and round(h.percentile(50) / 1000, 1),
+                h.percentile(99) and round(h.percentile(99) / 1000, 1),
+                s.timeouts, s.rounds)
+  return {kind: s.to_dict() for kind, s in stats.items()}
+
+
+def main():
+  node_counts = benchutil.env_ints('SALTCORN_BENCH_NODES', '2,4')
+  workers = int(os.environ.get('SALTCORN_BENCH_WORKERS', 2))
+  rounds = int(os.environ.get('SALTCORN_BENCH_ROUNDS', 20))
+  timeout = float(os.environ.get('SALTCORN_BENCH_TIMEOUT', 30))
+  interval = float(os.environ.get('SALTCORN_BENCH_POLL_INTERVAL', 0.005))
+  kinds = os.environ.get('SALTCORN_BENCH_KINDS')
+  probes = PROBES
+  if kinds:
+    wanted = kinds.split(',')
+    probes = [p for p in PROBES if any(k in (p.kind, p.kind_for(0), p.kind_for(1)) for k in wanted)]
+  clusters = []
+  for nodes in node_counts:
+    clusters.append({'nodes': nodes, 'workers': workers,
+                     'kinds': run_cluster(nodes, workers, rounds, probes, timeout, interval)})
+  return benchutil.write_report('propagation', {
+    'rounds': rounds, 'timeout_s': timeout, 'poll_interval_s': interval,
+    'clusters': clusters,
+  })
+
+
+# the any-bootstrap-theme configuration form, as multinode_test posts it
+THEME_CONFIG = {
+  'theme': 'flatly',
+  'backgroundColor': '#ffffff',
+  'backgroundColorDark': '#212529',
+  'cardBackgroundColor': '#ffffff',
+  'cardBackgroundColorDark': '#212529',
+  'cardFooterBg': '#2c3e50',
+  'cardFooterBgAlpha': '0.03',
+  'cardFooterBgAlphaDark': '0.03',
+  'cardFooterBgDark': '#2c3e50',
+  'cardFooterText': '#2c3e50',
+  'cardFooterTextDark': '#2c3e50',
+  'cardHeaderBg': '#2c3e50',
+  'cardHeaderBgAlpha': '0.03',
+  'cardHeaderBgAlphaDark': '0.03',
+  'cardHeaderBgDark': '#2c3e50',
+  'cardHeaderText': '#2c3e50',
+  'cardHeaderTextDark': '#2c3e50',
+  'colorscheme': 'navbar-light',
+  'danger': '#e74c3c',
+  'dangerDark': '#e74c3c',
+  'dark': '#7b8a8b',
+  'info': '#3498db',
+  'infoDark': '#3498db',
+  'light': '#ecf0f1',
+  'linkColor': '#007bff',
+  'linkColorDark': '#007bff',
+  'menu_style': 'Top Navbar',
+  'primary': '#2c3e50',
+  'primaryDark': '#2c3e50',
+  'secondary': '#95a5a6',
+  'secondaryDark': '#95a5a6',
+  'stepName': 'stylesheet',
+  'success': '#18bc9c',
+  'successDark': '#18bc9c',
+  'toppad': '2',
+  'warning': '#f39c12',
+  'warningDark': '#f39c12',
+}
+
+
+if __name__ == '__main__':
+  main()
@@ -1,6 +1,4 @@
-from scsession import SaltcornSession
-import socketio
-import threading
+from socket_client import SocketClient, mark_action
 import logging
 logging.basicConfig(
     level=logging.INFO,
@@ -10,57 +8,34 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-class RealTimeCollabClient:
-  def __init__(self):
-    self.session = SaltcornSession(port=3001, open_process=False)
-    self.updates = []
-    sio = socketio.Client()
-    
-    self.sio = sio
-    self.init_csrf()
+class RealTimeCollabClient(SocketClient):
+  reload_after_login = True
 
-  def handle_update_event(self, data):
-    logger.info("handle_event")
-    self.updates.append(data)
-
-  def init_csrf(self):
-    self.session.get('/auth/login')
-    self.csrf = self.session.csrf()
+  @property
+  def updates(self):
+    return self.received
 
-  def login(self, email, password):
-    self.session.postForm('/auth/login',
-        {'email': email,
-          'password': password,
-          '_csrf': self.csrf
-        })
-    assert self.session.redirect_url == '/'
-    self.session.get('/')  # refresh CSRF for the new post-login session
-
-  def connect(self):
-    auth_headers = 'connect.sid=' + self.session.sessionID() + '; loggedin=true'
-    self.sio.connect('http://localhost:3001', 
-        transports= ["websocket"], headers={'cookie': auth_headers})
+  def handle_event(self, event, data):
+    logger.info("handle_event")
+    super().handle_event(event, data)
 
-  def join_collab_room(self, viewName):
-    self.sio.emit("join_collab_room", viewName)
+  def join_collab_room(self, viewName, timeout=5):
+    return self.join_collab_room_with_ack(viewName, timeout)
 
   def join_collab_room_with_ack(self, viewName, timeout=5):
-    result = {}
-    done = threading.Event()
-    def ack(data):
-      result.update(data)
-      done.set()
-    self.sio.emit("join_collab_room", viewName, callback=ack)
-    done.wait(timeout=timeout)
-    return result
+    return self.call("join_collab_room", viewName, timeout=timeout) or {}
 
   def submit_view_form(self, viewname, row_id, data):
     self.session.get(f'/view/{viewname}?id={row_id}')
     csrf = self.session.csrf()
+    since = mark_action()
     self.session.postForm(f'/view/{viewname}', {'id': row_id, '_csrf': csrf, **data})
+    return since
 
   def send_update(self, tablename, id, data):
+    since = mark_action()
     self.session.apiPost(f'/api/{tablename}/{id}', data)
+    return since
 
   def register_event_handler(self, event_name):
-    self.sio.on(event_name, self.handle_update_event)
+    self.on(event_name)
@@ -1,7 +1,6 @@
 from scsession import SaltcornSession
+from shard import shard
 from real_time_collab_client import RealTimeCollabClient;
-import socketio
-import time
 import logging
 
 logging.basicConfig(
@@ -17,7 +16,7 @@ adminPassword='AhGGr6rhu45'
 class Test:
   def setup_class(self):
     SaltcornSession.reset_to_fixtures()
-    self.sess = SaltcornSession(port=3001)
+    self.sess = SaltcornSession.warm(port=shard.port())
 
   def teardown_class(self):
     self.sess.close()
@@ -29,16 +28,15 @@ class Test:
     client = RealTimeCollabClient()
     client.login(email=adminEmail, password=adminPassword)
     client.connect()
-    assert client.sio.connected
-    client.sio.disconnect()
+    assert client.connected
+    client.disconnect()
 
   def test_join_collab_room(self):
     client = RealTimeCollabClient()
     client.login(email=adminEmail, password=adminPassword)
     client.connect()
     viewName = 'authoredit'
-    client.join_collab_room(viewName)
-    time.sleep(1)
+    assert client.join_collab_room(viewName) == {'status': 'ok'}
 
   def test_send_update(self):
     client = RealTimeCollabClient()
@@ -47,8 +45,8 @@ class Test:
     viewName = 'authoredit'
     client.join_collab_room(viewName)
     client.register_event_handler('authoredit_UPDATE_EVENT?id=1')
-    client.send_update('books', 1, {'author': 'New Author', 'pages': 213})
-    time.sleep(1)
+    t = client.send_update('books', 1, {'author': 'New Author', 'pages': 213})
+    client.wait_for(since=t)
     assert len(client.updates) > 0
 
   def test_send_update_with_custom_event(self):
@@ -58,8 +56,8 @@ class Test:
     viewName = 'authoredit'
     client.join_collab_room(viewName)
     client.register_event_handler('authoredit_UPDATE_EVENT?id=1')
-    client.send_update('books', 1, {'author': 'My Author', 'pages': 213})
-    time.sleep(1)
+    t = client.send_update('books', 1, {'author': 'My Author', 'pages': 213})
+    client.wait_for(since=t)
     assert len(client.updates) > 0
     expected = {
       'updates': {'author': 'My Author'},
@@ -91,8 +89,8 @@ class Test:
     viewName = 'authoredit'
     client.join_collab_room(viewName)
     client.register_event_handler('authoredit_UPDATE_EVENT?id=1')
-    client.send_update('books', 1, {'pages': 23})
-    time.sleep(1)
+    t = client.send_update('books', 1, {'pages': 23})
+    client.expect_no_event(since=t)
     assert len(client.updates) == 0
 
   def test_send_update_without_changes(self):
@@ -102,11 +100,11 @@ class Test:
     viewName = 'authoredit'
     client.join_collab_room(viewName)
     client.register_event_handler('authoredit_UPDATE_EVENT?id=1')
-    client.send_update('books', 1, {'author': 'MisterJ', 'pages': 213})
-    time.sleep(1)
+    t = client.send_update('books', 1, {'author': 'MisterJ', 'pages': 213})
+    client.wait_for(since=t)
     assert len(client.updates) > 0
-    client.send_update('books', 1, {'author': 'MisterJ', 'pages': 213})
-    time.sleep(1)
+    t = client.send_update('books', 1, {'author': 'MisterJ', 'pages': 213})
+    client.expect_no_event(since=t)
     assert len(client.updates) == 1
 
   # ── Security tests for GHSA-vrm5-86xf-hh6h ─────────────────────────────────
@@ -129,7 +127,7 @@ class Test:
     assert ack.get('status') == 'error', (
       f"Expected error joining admin-only room, got: {ack}"
     )
-    client.sio.disconnect()
+    client.disconnect()
 
   def test_idor_low_priv_user_does_not_receive_admin_view_events(self):
     """
@@ -145,16 +143,22 @@ class Test:
     assert ack.get('status') == 'ok'
     attacker.register_event_handler('admin_authoredit_UPDATE_EVENT?id=1')
 
+    # an admin socket in the admin_authoredit room is the barrier: once it
+    # has the update, the server has emitted it to every room it would
     admin = RealTimeCollabClient()
     admin.login(email=adminEmail, password=adminPassword)
-    admin.submit_view_form('admin_authoredit', 1, {'author': 'secret admin value'})
-    time.sleep(1)
+    admin.connect()
+    assert admin.join_collab_room_with_ack('admin_authoredit').get('status') == 'ok'
+    admin.register_event_handler('admin_authoredit_UPDATE_EVENT?id=1')
+    t = admin.submit_view_form('admin_authoredit', 1, {'author': 'secret admin value'})
+    admin.wait_for(since=t)
+    attacker.expect_no_event(since=t)
 
     assert len(attacker.updates) == 0, (
       "IDOR: regular user received UPDATE events from an admin-only view "
       "via the shared collab room"
     )
-    attacker.sio.disconnect()
+    attacker.disconnect()
 
   def test_per_view_room_isolation(self):
     """
@@ -181,13 +185,21 @@ class Test:
     assert client_b.join_collab_room_with_ack('admin_authoredit').get('status') == 'ok'
     client_b.register_event_handler('authoredit_UPDATE_EVENT?id=1')
 
+    # the trigger's own socket joins both rooms for their events, as the
+    # barrier that both have been emitted
     admin_trigger = RealTimeCollabClient()
     admin_trigger.login(email=adminEmail, password=adminPassword)
+    admin_trigger.connect()
+    for view in ('authoredit', 'admin_authoredit'):
+      assert admin_trigger.join_collab_room_with_ack(view).get('status') == 'ok'
+      admin_trigger.register_event_handler(view + '_UPDATE_EVENT?id=1')
 
     # Updating a book fires both views' virtual triggers, each emitting to its
     # own scoped room.  Neither client should receive the other view's event.
-    admin_trigger.submit_view_form('authoredit', 1, {'author': 'room isolation test'})
-    time.sleep(1)
+    t = admin_trigger.submit_view_form('authoredit', 1, {'author': 'room isolation test'})
+    admin_trigger.wait_for(since=t, count=2)
+    client_a.expect_no_event(since=t)
+    client_b.expect_no_event(since=t)
 
     assert len(client_a.updates) == 0, (
       "IDOR: user in authoredit room received admin_authoredit UPDATE events "
@@ -198,5 +210,5 @@ class Test:
       "(cross-room leakage)"
     )
 
-    client_a.sio.disconnect()
-    client_b.sio.disconnect()
+    client_a.disconnect()
+    client_b.disconnect()
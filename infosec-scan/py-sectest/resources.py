@@ -0,0 +1,163 @@
+"""
+Samples the resource use of a Saltcorn server process tree from /proc:
+the master and every cluster worker it forked. Each sample has per process
+RSS, CPU time, open fds, threads and the Postgres connections it holds.
+
+  sampler = sess.start_sampler(interval=0.5)
+  ...
+  sess.stop_sampler('resources-chat')   # JSON time series in bench-results/
+"""
+import os
+import time
+import threading
+import logging
+import benchutil
+import scdb
+
+logger = logging.getLogger(__name__)
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def _read(path):
+  with open(path) as f:
+    return f.read()
+
+
+def _stat(pid):
+  """(ppid, cpu seconds) from /proc/<pid>/stat"""
+  raw = _read(f"/proc/{pid}/stat")
+  # the command name may contain spaces; fields resume after its ')'
+  fields = raw[raw.rindex(")") + 2:].split()
+  return int(fields[1]), (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def descendants(root):
+  """root and every process below it"""
+  children = {}
+  for entry in os.listdir("/proc"):
+    if entry.isdigit():
+      try:
+        children.setdefault(_stat(entry)[0], []).append(int(entry))
+      except (OSError, ValueError):
+        pass  # exited while we looked
+  found, todo = [], [root]
+  while todo:
+    pid = todo.pop()
+    found.append(pid)
+    todo.extend(children.get(pid, []))
+  return found
+
+
+def _socket_ports():
+  """socket inode -> local TCP port, for matching pg_stat_activity.client_port"""
+  ports = {}
+  for table in ("/proc/net/tcp", "/proc/net/tcp6"):
+    try:
+      lines = _read(table).splitlines()[1:]
+    except OSError:
+      continue
+    for line in lines:
+      cols = line.split()
+      ports[cols[9]] = int(cols[1].rsplit(":", 1)[1], 16)
+  return ports
+
+
+def process_sample(pid, ports, pg_ports):
+  _, cpu = _stat(pid)
+  status = dict(line.split(":", 1) for line in _read(f"/proc/{pid}/status").splitlines()
+                if ":" in line)
+  fds = os.listdir(f"/proc/{pid}/fd")
+  pg = 0
+  for fd in fds:
+    try:
+      target = os.readlink(f"/proc/{pid}/fd/{fd}")
+    except OSError:
+      continue
+    if target.startswith("socket:[") and ports.get(target[8:-1]) in pg_ports:
+      pg += 1
+  return {
+    "rss_kb": int(status.get("VmRSS", "0 kB").split()[0]),
+    "cpu_s": cpu,
+    "fds": len(fds),
+    "threads": int(status.get("Threads", "0")),
+    "pg_connections": pg,
+  }
+
+
+class ResourceSampler:
+  def __init__(self, pid, interval=0.5, database=None):
+    self.pid = pid
+    self.interval = interval
+    self.database = database or scdb.db
+    self.samples = []
+    self.started = None
+    self._stop = threading.Event()
+    self._thread = None
+
+  def _pg_client_ports(self):
+    if self.database.driver != "postgres":
+      return set(), None
+    rows = self.database.query(
+      "select client_port from pg_stat_activity "
+      "where datname = current_database() and pid <> pg_backend_pid()")
+    return {r["client_port"] for r in rows if r["client_port"] not in (None, -1)}, len(rows)
+
+  def sample(self):
+    try:
+      pg_ports, pg_total = self._pg_client_ports()
+    except Exception as e:
+      logger.debug("no pg_stat_activity sample: %s", e)
+      pg_ports, pg_total = set(), None
+    ports = _socket_ports()
+    procs = {}
+    for pid in descendants(self.pid):
+      try:
+        procs[str(pid)] = {"role": "master" if pid == self.pid else "worker",
+                           **process_sample(pid, ports, pg_ports)}
+      except (OSError, ValueError):
+        pass  # exited while we looked
+    totals = {key: sum(p[key] for p in procs.values())
+              for key in ("rss_kb", "cpu_s", "fds", "threads", "pg_connections")}
+    self.samples.append({
+      "t": time.monotonic() - self.started,
+      "processes": procs,
+      "total": {**totals, "processes": len(procs), "pg_connections_db": pg_total},
+    })
+
+  def _loop(self):
+    while not self._stop.is_set():
+      t0 = time.monotonic()
+      self.sample()
+      self._stop.wait(max(0, self.interval - (time.monotonic() - t0)))
+
+  def start(self):
+    if not os.path.isdir(f"/proc/{self.pid}"):
+      logger.warning("no /proc entry for pid %s, not sampling resources", self.pid)
+      return self
+    self.started = time.monotonic()
+    self._thread = threading.Thread(target=self._loop, daemon=True)
+    self._thread.start()
+    return self
+
+  def stop(self):
+    self._stop.set()
+    if self._thread is not None:
+      self._thread.join()
+    return self
+
+  def to_dict(self):
+    first, last = (self.samples[0], self.samples[-1]) if self.samples else ({}, {})
+    return {
+      "pid": self.pid,
+      "interval_s": self.interval,
+      "samples": self.samples,
+      "growth": {
+        key: last["total"][key] - first["total"][key]
+        for key in ("rss_kb", "fds", "threads", "pg_connections")
+      } if self.samples else {},
+      "peak_rss_kb": max((s["total"]["rss_kb"] for s in self.samples), default=None),
+    }
+
+  def dump(self, name):
+    return benchutil.write_report(name, self.to_dict())
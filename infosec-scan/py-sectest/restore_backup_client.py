@@ -2,32 +2,42 @@ import re
 import time
 import json
 from urllib.parse import urljoin
-import socketio
+from socket_client import SocketClient, mark_action
 
 # embedded by sendRestoreWaitPage in packages/server/auth/routes.ts
 JOBID_RE = re.compile(r'const jobId = "([0-9a-f-]{36})"')
 
 
-class RestoreBackupClient:
+class RestoreBackupClient(SocketClient):
   """
   Drives the create-first-user backup-restore flow against an already
   running SaltcornSession: uploads a backup, then tracks progress either
   over the restore_progress socket room or by polling
   /auth/restore_status/:jobId, mirroring what the browser's wait page does.
   """
+  events = ('restore_progress', 'test_conn_msg')
 
   def __init__(self, session):
+    super().__init__(session=session)
     self.http = session
     self.job_id = None
-    self.messages = []
     self.join_ack = None
-    self.sio = None
+
+  @property
+  def messages(self):
+    return self.received
+
+  def handle_event(self, event, data):
+    if event == 'test_conn_msg':
+      data = {"status": "__test_conn_msg__"}
+    super().handle_event(event, data)
 
   def upload_backup(self, backup_path):
     self.http.get('/auth/create_first_user')
     assert self.http.status == 200
     assert "Create first user" in self.http.content
     with open(backup_path, 'rb') as f:
+      mark_action()
       resp = self.http.session.post(
         urljoin(self.http.base_url, '/auth/create_from_restore'),
         data={'_csrf': self.http.csrf()},
@@ -40,45 +50,21 @@ class RestoreBackupClient:
     return self.job_id
 
   def connect_socket(self):
-    sio = socketio.Client()
-
-    @sio.event
-    def restore_progress(data):
-      self.messages.append(data)
-
-    @sio.event
-    def test_conn_msg(data):
-      self.messages.append({"status": "__test_conn_msg__"})
-
     # same cookie a real (anonymous, pre-login) browser tab would send
-    auth_headers = 'connect.sid=' + self.http.sessionID()
-    sio.connect(self.http.base_url, transports=["websocket"],
-                headers={'cookie': auth_headers})
-    self.sio = sio
+    self.connect_as_public()
 
   def join_restore_room(self):
-    ack = {}
-
-    def cb(a):
-      ack.update(a or {})
-
-    self.sio.emit("join_restore_room", self.job_id, callback=cb)
-    time.sleep(0.3)
-    self.join_ack = ack
-    return ack
-
-  def disconnect(self):
-    if self.sio is not None:
-      self.sio.disconnect()
+    self.join_ack = self.call("join_restore_room", self.job_id) or {}
+    return self.join_ack
 
   def wait_for_status(self, status, timeout=30):
-    """poll the socket-collected messages for a given terminal status"""
-    deadline = time.time() + timeout
-    while time.time() < deadline:
-      if any(m.get("status") == status for m in self.messages):
-        return True
-      time.sleep(0.5)
-    return False
+    """wait for the socket-collected messages to reach a given terminal status"""
+    try:
+      # any message so far, including those before the last action
+      self.wait_for(lambda m: m.get("status") == status, timeout=timeout, since=0)
+      return True
+    except TimeoutError:
+      return False
 
   def poll_status(self):
     """hits the same endpoint the browser's polling fallback uses"""
@@ -1,7 +1,7 @@
 from scsession import SaltcornSession
+from shard import shard
 from restore_backup_client import RestoreBackupClient
 import os
-import time
 
 BACKUP_PATH = os.path.join(
   os.path.dirname(os.path.realpath(__file__)),
@@ -11,10 +11,10 @@ BACKUP_PATH = os.path.join(
 
 class TestCreateFirstUserRestore:
   def setup_class(self):
-    # reset-schema without fixtures() leaves zero users, which is what
+    # reset_schema() without fixtures leaves zero users, which is what
     # makes /auth/create_first_user reachable
-    SaltcornSession.cli("reset-schema", "-f")
-    self.sess = SaltcornSession(port=3001)
+    SaltcornSession.reset_schema()
+    self.sess = SaltcornSession.warm(port=shard.port())
 
   def teardown_class(self):
     self.sess.close()
@@ -61,8 +61,8 @@ class TestRestorePollingFallback:
   """Simulates a broken socket connection to test the polling fallback. """
 
   def setup_class(self):
-    SaltcornSession.cli("reset-schema", "-f")
-    self.sess = SaltcornSession(port=3002)
+    SaltcornSession.reset_schema()
+    self.sess = SaltcornSession.warm(port=shard.port(1))
 
   def teardown_class(self):
     self.sess.close()
@@ -76,7 +76,7 @@ class TestRestorePollingFallback:
     # what the browser's 5s fallback timer is watching for
     client.connect_socket()
     try:
-      time.sleep(2)
+      client.expect_no_event(window=2)
       assert client.messages == [], (
         f"should not receive anything without joining the room, got: {client.messages}"
       )
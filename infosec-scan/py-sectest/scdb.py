@@ -0,0 +1,380 @@
+"""
+Direct access to the database a Saltcorn under test runs against.
+
+Connection settings are resolved like getConnectObject() in
+packages/saltcorn-data/db/connect.ts: environment variables first, then
+the .saltcorn config file, then the default SQLite file.
+
+  from scdb import db
+  db.scalar("select count(*) from books where author = %s", ("x",))
+  db.tenant("sub1").query("select * from users")
+  db.wait_until("select status from _sc_workflow_runs where id = %s",
+                lambda rows: rows and rows[0]["status"] == "Finished", params=(run_id,))
+"""
+import os
+import re
+import json
+import time
+import queue
+import shutil
+import sqlite3
+import hashlib
+import platform
+import logging
+
+try:
+  import psycopg
+  from psycopg import sql
+  from psycopg.rows import dict_row
+  from psycopg.conninfo import conninfo_to_dict
+except ImportError:  # postgres snapshots are optional, see restore_or_build
+  psycopg = None
+
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", ".."))
+
+# what the fixture database is built from; a change to any of these means
+# the cached snapshot is stale
+SNAPSHOT_SOURCES = [
+  "packages/saltcorn-data/db/fixtures.ts",
+  "packages/saltcorn-data/db/reset_schema.ts",
+  "packages/saltcorn-data/package.json",
+]
+SNAPSHOT_SOURCE_DIRS = ["packages/saltcorn-data/migrations"]
+
+
+def _env_paths_dir(kind, app=""):
+  """same folders as the env-paths package used by the node side"""
+  home = os.path.expanduser("~")
+  if platform.system() == "Darwin":
+    base = {"config": os.path.join(home, "Library", "Preferences"),
+            "data": os.path.join(home, "Library", "Application Support")}[kind]
+    return os.path.join(base, app)
+  elif platform.system() == "Windows":
+    base = os.environ.get("APPDATA" if kind == "config" else "LOCALAPPDATA", home)
+    return os.path.join(base, app, "Config" if kind == "config" else "Data")
+  else:
+    xdg = {"config": ("XDG_CONFIG_HOME", ".config"),
+           "data": ("XDG_DATA_HOME", os.path.join(".local", "share"))}[kind]
+    return os.path.join(os.environ.get(xdg[0], os.path.join(home, xdg[1])), app)
+
+
+def config_file():
+  try:
+    with open(os.path.join(_env_paths_dir("config"), ".saltcorn")) as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return {}
+
+
+def connect_params():
+  """
+  {'driver': 'postgres', 'conninfo': {...libpq keywords}} or
+  {'driver': 'sqlite', 'path': ...}
+  """
+  cfg = config_file()
+
+  def setting(key, env):
+    return os.environ[env] if env in os.environ else cfg.get(key)
+
+  if os.environ.get("FORCE_SQLITE") != "true":
+    if os.environ.get("DATABASE_URL"):
+      return {"driver": "postgres", "conninfo": conninfo_to_dict(os.environ["DATABASE_URL"])
+              if psycopg else {"dbname": None},
+              "default_schema": setting("default_schema", "SALTCORN_DEFAULT_SCHEMA") or "public"}
+    user, password, database = setting("user", "PGUSER"), setting("password", "PGPASSWORD"), \
+      setting("database", "PGDATABASE")
+    if user and password and database and not setting("sqlite_path", "SQLITE_FILEPATH"):
+      conninfo = {"user": user, "password": password, "dbname": database}
+      for key, env in (("host", "PGHOST"), ("port", "PGPORT"), ("sslmode", "PGSSLMODE")):
+        if setting(key, env):
+          conninfo[key] = str(setting(key, env))
+      return {"driver": "postgres", "conninfo": conninfo,
+              "default_schema": setting("default_schema", "SALTCORN_DEFAULT_SCHEMA") or "public"}
+  path = setting("sqlite_path", "SQLITE_FILEPATH") or \
+    os.path.join(_env_paths_dir("data", "saltcorn"), "saltcorndb.sqlite")
+  return {"driver": "sqlite", "path": path}
+
+
+def _fingerprint(extra=""):
+  h = hashlib.sha1(extra.encode())
+  for rel in SNAPSHOT_SOURCES:
+    try:
+      with open(os.path.join(REPO_ROOT, rel), "rb") as f:
+        h.update(f.read())
+    except OSError:
+      h.update(rel.encode())
+  for rel in SNAPSHOT_SOURCE_DIRS:
+    try:
+      h.update("\n".join(sorted(os.listdir(os.path.join(REPO_ROOT, rel)))).encode())
+    except OSError:
+      pass
+  return h.hexdigest()[:16]
+
+
+# --- postgres: template databases ----------------------------------------------
+
+def _admin_connect(conninfo):
+  # CREATE/DROP DATABASE can't run inside a transaction, or connected to
+  # the database being dropped
+  return psycopg.connect(**{**conninfo, "dbname": "postgres"}, autocommit=True)
+
+
+def _terminate_connections(cur, dbname):
+  cur.execute(
+    "SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+    "WHERE datname = %s AND pid <> pg_backend_pid()", (dbname,))
+
+
+def ensure_database(dbname):
+  """create an empty postgres database, e.g. for a test shard, if missing"""
+  if psycopg is None:
+    raise RuntimeError("psycopg is needed to create database %s" % dbname)
+  conninfo = connect_params()["conninfo"]
+  with _admin_connect(conninfo) as conn, conn.cursor() as cur:
+    cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (dbname,))
+    if cur.fetchone() is None:
+      cur.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(dbname)))
+
+
+def _pg_template_name(dbname, name):
+  return f"{dbname}__sc_{name}"[:63]
+
+
+def _pg_snapshot_comment(cur, template):
+  cur.execute(
+    "SELECT shobj_description(oid, 'pg_database') FROM pg_database WHERE datname = %s",
+    (template,))
+  row = cur.fetchone()
+  return row[0] if row else None
+
+
+def _pg_restore(conninfo, name, fingerprint):
+  dbname = conninfo["dbname"]
+  template = _pg_template_name(dbname, name)
+  with _admin_connect(conninfo) as conn, conn.cursor() as cur:
+    if _pg_snapshot_comment(cur, template) != fingerprint:
+      return False
+    for attempt in range(10):
+      _terminate_connections(cur, dbname)
+      try:
+        cur.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(dbname)))
+        break
+      except psycopg.errors.ObjectInUse:
+        # a warm server reconnected in between, see SaltcornSession.warm
+        if attempt == 9:
+          raise
+        time.sleep(0.1)
+    cur.execute(sql.SQL("CREATE DATABASE {} TEMPLATE {}").format(
+      sql.Identifier(dbname), sql.Identifier(template)))
+  return True
+
+
+def _pg_save(conninfo, name, fingerprint):
+  dbname = conninfo["dbname"]
+  template = _pg_template_name(dbname, name)
+  with _admin_connect(conninfo) as conn, conn.cursor() as cur:
+    _terminate_connections(cur, dbname)
+    cur.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(template)))
+    cur.execute(sql.SQL("CREATE DATABASE {} TEMPLATE {}").format(
+      sql.Identifier(template), sql.Identifier(dbname)))
+    cur.execute(sql.SQL("COMMENT ON DATABASE {} IS {}").format(
+      sql.Identifier(template), sql.Literal(fingerprint)))
+
+
+# --- sqlite: cached file copies --------------------------------------------------
+
+def _sqlite_snapshot_path(path, name, fingerprint):
+  return f"{path}.{name}-{fingerprint}.snapshot"
+
+
+def _sqlite_restore(path, name, fingerprint):
+  snapshot = _sqlite_snapshot_path(path, name, fingerprint)
+  if not os.path.exists(snapshot):
+    return False
+  for suffix in ("-wal", "-shm", "-journal"):
+    if os.path.exists(path + suffix):
+      os.remove(path + suffix)
+  shutil.copyfile(snapshot, path)
+  return True
+
+
+def _sqlite_save(path, name, fingerprint):
+  shutil.copyfile(path, _sqlite_snapshot_path(path, name, fingerprint))
+
+
+def snapshots_enabled():
+  return os.environ.get("SALTCORN_SECTEST_SNAPSHOTS", "true") != "false"
+
+
+def restore_or_build(name, build):
+  """
+  Put the database back into the state called `name`: restored from a
+  snapshot (a template database on postgres, a file copy on sqlite) when
+  one exists for the current fixture sources, otherwise by calling
+  `build()` and snapshotting the result for next time.
+  Set SALTCORN_SECTEST_SNAPSHOTS=false to always build.
+  """
+  params = connect_params()
+  # the database is about to be dropped or overwritten under them
+  db.close()
+  if not snapshots_enabled() or (params["driver"] == "postgres" and psycopg is None):
+    if snapshots_enabled():
+      logger.warning("psycopg not installed, database snapshots disabled")
+    build()
+    return False
+  fingerprint = _fingerprint(os.environ.get("SALTCORN_MULTI_TENANT", ""))
+  if params["driver"] == "postgres":
+    restore, save, target = _pg_restore, _pg_save, params["conninfo"]
+  else:
+    restore, save, target = _sqlite_restore, _sqlite_save, params["path"]
+  try:
+    if restore(target, name, fingerprint):
+      return True
+  except Exception as e:
+    logger.warning("restoring snapshot %s failed, rebuilding: %s", name, e)
+  build()
+  try:
+    save(target, name, fingerprint)
+  except Exception as e:
+    logger.warning("could not save snapshot %s: %s", name, e)
+  return False
+
+
+# --- queries ---------------------------------------------------------------
+
+TENANT_RE = re.compile(r"^[a-z0-9_]+$", re.I)
+# quoted strings and identifiers, and the psycopg escapes outside them
+SQLITE_TOKEN_RE = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|%%|%s|%""")
+
+
+def sqlite_placeholders(query):
+  """
+  a query written for psycopg (%s placeholders, %% for a literal %) in
+  SQLite's ? style. Quoted text is left alone but for %%, as psycopg
+  would; any other % in it could not mean the same on both, so is refused
+  """
+  def convert(m):
+    token = m.group(0)
+    if token[0] in "'\"":
+      if "%" in token.replace("%%", ""):
+        raise ValueError("%% in a quoted string must be written %%%%: %s" % query)
+      return token.replace("%%", "%")
+    if token == "%s":
+      return "?"
+    if token == "%%":
+      return "%"
+    raise ValueError("only %%s and %%%% may follow a %% outside quotes: %s" % query)
+  return SQLITE_TOKEN_RE.sub(convert, query)
+
+
+class Database:
+  """
+  Pooled direct connections for assertions. Queries use %s placeholders
+  on both drivers and return rows as dicts with typed values. Connections
+  are autocommit, so every query sees what the server has committed.
+  """
+
+  def __init__(self, params=None, pool_size=4, schema=None, _pool=None):
+    self.params = params
+    # resolved on first use, and again after close()
+    self._resolve_params = params is None
+    self.pool_size = pool_size
+    self.schema = schema
+    self._pool = _pool if _pool is not None else queue.LifoQueue()
+
+  def tenant(self, schema):
+    """the same pool, with queries run in a tenant's schema"""
+    if not TENANT_RE.match(schema):
+      raise ValueError("Invalid tenant name: %s" % schema)
+    return Database(self.params or connect_params(), self.pool_size, schema, self._pool)
+
+  @property
+  def driver(self):
+    if self.params is None:
+      self.params = connect_params()
+    return self.params["driver"]
+
+  def _connect(self):
+    if self.driver == "postgres":
+      if psycopg is None:
+        raise RuntimeError("psycopg is needed to query a postgres database")
+      return psycopg.connect(**self.params["conninfo"], autocommit=True, row_factory=dict_row)
+    conn = sqlite3.connect(self.params["path"], isolation_level=None, check_same_thread=False,
+                           detect_types=sqlite3.PARSE_DECLTYPES, timeout=30)
+    conn.row_factory = lambda cur, row: {d[0]: v for d, v in zip(cur.description, row)}
+    return conn
+
+  def _execute(self, conn, query, params):
+    if self.driver == "sqlite":
+      if self.schema:
+        raise ValueError("SQLite databases have no tenant schemas")
+      return conn.execute(sqlite_placeholders(query), params).fetchall()
+    with conn.cursor() as cur:
+      cur.execute(sql.SQL("SET search_path TO {}").format(
+        sql.Identifier(self.schema or self.params["default_schema"])))
+      cur.execute(query, params)
+      return cur.fetchall() if cur.description else []
+
+  def query(self, query, params=()):
+    try:
+      conn = self._pool.get_nowait()
+    except queue.Empty:
+      conn = self._connect()
+    try:
+      rows = self._execute(conn, query, params)
+    except Exception as e:
+      if self.driver == "postgres" and isinstance(e, psycopg.OperationalError):
+        # connection killed, e.g. by a snapshot restore; retry on a fresh one
+        conn.close()
+        conn = self._connect()
+        try:
+          rows = self._execute(conn, query, params)
+        except Exception:
+          conn.close()
+          raise
+      else:
+        self._release(conn)
+        raise
+    self._release(conn)
+    return rows
+
+  def _release(self, conn):
+    if self._pool.qsize() < self.pool_size:
+      self._pool.put(conn)
+    else:
+      conn.close()
+
+  def scalar(self, query, params=()):
+    """first column of the first row, or None"""
+    rows = self.query(query, params)
+    return next(iter(rows[0].values())) if rows else None
+
+  def wait_until(self, query, predicate, timeout=10, interval=0.05, params=()):
+    """
+    poll `query` until `predicate(rows)` holds and return those rows;
+    raises TimeoutError with the last rows seen
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+      rows = self.query(query, params)
+      if predicate(rows):
+        return rows
+      if time.monotonic() >= deadline:
+        raise TimeoutError("wait_until timed out after %ss on %r, last rows: %r"
+                           % (timeout, query, rows))
+      time.sleep(interval)
+
+  def close(self):
+    while True:
+      try:
+        self._pool.get_nowait().close()
+      except queue.Empty:
+        break
+    if self._resolve_params:
+      # settings may differ by the next use, e.g. another shard's database
+      self.params = None
+
+
+db = Database()
@@ -1,8 +1,17 @@
-from sectest import Session
+from sectest import Session, AsyncSession, HEAD_SCAN_LIMIT
 import re
+import json
 import subprocess
 import os 
-from helpers import wait_for_port_open
+import time
+import signal
+import atexit
+from helpers import wait_for_port_open, SignalPipe
+import scdb
+import resources
+from logcapture import LogBuffer
+from shard import shard
+import cli_client
 import threading
 import logging
 
@@ -14,38 +23,201 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+CSRF_RE = re.compile('_sc_globalCsrf = "([^"]*)"')
+
+def page_csrf(content, limit=None):
+  """the page's CSRF token; `limit` caps how much of it is searched"""
+  content = content or ''
+  m = CSRF_RE.search(content, 0, len(content) if limit is None else limit)
+  if m:
+    return m.group(1)
+  else:
+    return ""
+
+def head_has_csrf(head):
+  return b'_sc_globalCsrf' in head and \
+    bool(page_csrf(head.decode(errors='replace'), HEAD_SCAN_LIMIT))
+
+def warm_enabled():
+  return os.environ.get("SALTCORN_SECTEST_WARM", "true") != "false"
+
 class SaltcornSession(Session):
-  def __init__(self, port=3001, open_process=True, env_vars=None, pipe_output=False):
+  # bumped on every fixture reset, which also empties the session store
+  fixture_generation = 0
+  # port -> server kept running between test modules, see warm()
+  _warm = {}
+
+  def __init__(self, port=None, open_process=True, env_vars=None, pipe_output=False):
     self.salcorn_process = None
     self._last_csrf = ''
+    # seconds from spawning `saltcorn serve` to its ready signal
+    self.boot_time = None
+    self.ready_info = None
+    self.sampler = None
+    self._sampler_report = None
+    self.signals = None
+    # set while this is one of the warm servers, which close() leaves up
+    self.warm_key = None
+    # with pipe_output, the server's log lines as structured records
+    self.logs = LogBuffer()
     self.open(port, open_process, env_vars, pipe_output)
 
   def __del__(self):
     self.close()
 
   def csrf(self):
-    m = re.findall('_sc_globalCsrf = "([^"]*)"', self.content)
-    if len(m) > 0:
-      return m[0]
-    else:
-      return ""
+    # a buffered page is searched in full, a streamed one only in its head
+    if self.content is not None:
+      return page_csrf(self.content)
+    return page_csrf(self.head, HEAD_SCAN_LIMIT)
 
-  def get(self, url, allow_redirects=False, timeout=30):
-    super().get(url, allow_redirects=allow_redirects, timeout=timeout)
+  def head_complete(self, head):
+    return head_has_csrf(head) or super().head_complete(head)
+
+  def get(self, url, allow_redirects=False, timeout=30, stream=False):
+    super().get(url, allow_redirects=allow_redirects, timeout=timeout, stream=stream)
     token = self.csrf()
     if token:
       self._last_csrf = token
 
+  def refresh_csrf(self):
+    # token for apiPost without having to render a full page
+    super().get('/auth/csrf-token')
+    if self.status == 200:
+      self._last_csrf = json.loads(self.content).get('csrfToken', '')
+    return self._last_csrf
+
   def apiPost(self, url, data, allow_redirects=False, extra_headers=None):
     super().apiPost(url, data, allow_redirects=allow_redirects,
                     extra_headers=extra_headers, csrf_token=self._last_csrf or None)
 
+  def wait_for_log(self, pattern, timeout=10, since=0, **kwargs):
+    """see logcapture.LogBuffer; needs pipe_output=True"""
+    return self.logs.wait_for_log(pattern, timeout, since, **kwargs)
+
+  def count_logs(self, pattern, since=0, **kwargs):
+    return self.logs.count_logs(pattern, since, **kwargs)
+
+  def start_sampler(self, interval=0.5):
+    """sample the server's /proc resource use in the background, see resources.py"""
+    self.stop_sampler()
+    self.sampler = resources.ResourceSampler(self.salcorn_process.pid, interval).start()
+    return self.sampler
+
+  def stop_sampler(self, report_name=None):
+    """stop sampling; with a report name, write the time series to the bench dir"""
+    sampler, self.sampler = self.sampler, None
+    if sampler is not None:
+      sampler.stop()
+      if report_name:
+        sampler.dump(report_name)
+    return sampler
+
   def close(self):
+    if getattr(self, 'warm_key', None) is not None:
+      return
+    self.stop()
+
+  def stop(self):
+    if getattr(self, 'sampler', None) is not None:
+      self.stop_sampler(self._sampler_report)
     if self.salcorn_process is not None:
       self.salcorn_process.kill()
+    if getattr(self, 'signals', None) is not None:
+      self.signals.close()
+      self.signals = None
+
+  def running(self):
+    return self.salcorn_process is not None and self.salcorn_process.poll() is None
+
+  def _signal_and_wait(self, signum, event, timeout):
+    # other events (worker_exited, scheduler, ...) may come first; the
+    # timeout is for the whole wait, not for each of them
+    deadline = time.monotonic() + timeout
+    self.salcorn_process.send_signal(signum)
+    while True:
+      remaining = deadline - time.monotonic()
+      if remaining <= 0:
+        raise ValueError("no %s from the server within %ss" % (event, timeout))
+      if self.signals.read(remaining).get(event):
+        return
+
+  def reload_state(self, timeout=30):
+    """
+    have the server reload every tenant's state from the database (SIGUSR2),
+    e.g. after a fixture reset underneath it; returns once all workers have
+    """
+    started = time.perf_counter()
+    self._signal_and_wait(signal.SIGUSR2, 'state_reloaded', timeout)
+    logger.info("saltcorn on %s reloaded its state in %.2fs",
+                self.base_url, time.perf_counter() - started)
+
+  def reload_plugins(self, timeout=60):
+    """
+    have the server reload every tenant's plugins from disk (SIGHUP);
+    returns once all workers have, with how long that took in seconds
+    """
+    started = time.perf_counter()
+    self._signal_and_wait(signal.SIGHUP, 'plugins_reloaded', timeout)
+    elapsed = time.perf_counter() - started
+    logger.info("saltcorn on %s reloaded its plugins in %.2fs", self.base_url, elapsed)
+    return elapsed
 
-  def open(self, port=3001, open_process=True, env_vars=None, pipe_output=False):
+  @classmethod
+  def warm(cls, port=None, env_vars=None, pipe_output=False):
+    """
+    a server on `port` that stays up for the rest of the run, instead of
+    one per test module. The first call starts it; later ones, usually
+    after the next module's reset_to_fixtures(), reload its state with
+    SIGUSR2 and hand it back with fresh cookies. close() leaves it
+    running. Modules that need a cold process of their own (signals,
+    plugins mounted at boot) construct SaltcornSession directly, which
+    stops a warm server on the same port. SALTCORN_SECTEST_WARM=false
+    makes every call start a cold one.
+    """
+    port = port or shard.port()
+    if not warm_enabled():
+      return cls(port, env_vars=env_vars, pipe_output=pipe_output)
+    key = (tuple(sorted((k, str(v)) for k, v in (env_vars or {}).items())), pipe_output)
+    sess = cls._warm.get(port)
+    if sess is not None and sess.warm_key == key and sess.running():
+      sess.reload_state()
+      sess.reset()
+      sess.base_url = 'http://localhost:%d/' % port
+      sess._last_csrf = ''
+      return sess
+    sess = cls(port, env_vars=env_vars, pipe_output=pipe_output)
+    sess.warm_key = key
+    cls._warm[port] = sess
+    return sess
+
+  @classmethod
+  def _stop_warm(cls, port):
+    sess = cls._warm.pop(port, None)
+    if sess is not None:
+      sess.warm_key = None
+      sess.stop()
+      sess.salcorn_process.wait()
+
+  @classmethod
+  def close_warm(cls):
+    """stop every warm server; at the end of the run, or before a reset they cannot survive"""
+    for port in list(cls._warm):
+      cls._stop_warm(port)
+
+  @classmethod
+  def _before_reset(cls):
+    # a running server reconnects after a postgres restore, but a sqlite
+    # file must not be replaced underneath it
+    if cls._warm and scdb.connect_params()["driver"] != "postgres":
+      cls.close_warm()
+
+  def open(self, port=None, open_process=True, env_vars=None, pipe_output=False):
+    # default: the first port of this test runner's shard
+    port = port or shard.port()
     if open_process is True:
+      if self.warm_key is None:
+        SaltcornSession._stop_warm(port)
       env = os.environ.copy()
 
       if env_vars:
@@ -54,20 +226,32 @@ class SaltcornSession(Session):
 
       stdout_setting = subprocess.PIPE if pipe_output else None
       stderr_setting = subprocess.STDOUT if pipe_output else None
+      if pipe_output:
+        env.setdefault("SALTCORN_LOG_FORMAT", "json")
 
+      # the server writes a line to this pipe once every worker is listening
+      ready_read, ready_write = os.pipe()
+      env["SALTCORN_READY_FD"] = str(ready_write)
+      started = time.perf_counter()
       self.salcorn_process = subprocess.Popen(
           ["packages/saltcorn-cli/bin/saltcorn", "serve", "-p", str(port), "--subdomain_offset", "1"],
           env=env,
           stdout=stdout_setting,
           stderr=stderr_setting,
+          pass_fds=(ready_write,),
           text=True,
           bufsize=1
       )
+      os.close(ready_write)
 
       if pipe_output:
         def stream_output(pipe):
           for line in iter(pipe.readline, ""):
-            logger.info("[saltcorn] %s", line.rstrip())
+            rec = self.logs.append(line)
+            if rec.pid is not None:
+              logger.info("[saltcorn %s] %s", rec.pid, rec.message)
+            else:
+              logger.info("[saltcorn] %s", rec.message)
 
         # background thread so pytest does not block
         threading.Thread(
@@ -76,21 +260,87 @@ class SaltcornSession(Session):
             daemon=True
         ).start()
     Session.__init__(self, 'http://localhost:%d/' % port)
-    wait_for_port_open(self.base_url)    
+    if open_process is True:
+      self.signals = SignalPipe(ready_read, self.salcorn_process)
+      self.ready_info = self.signals.read()
+      self.boot_time = time.perf_counter() - started
+      logger.info("saltcorn on port %d ready in %.2fs", port, self.boot_time)
+      # SALTCORN_SECTEST_RESOURCES=<seconds> samples every server started,
+      # writing resources-<port>-<time>.json when it is closed
+      if os.environ.get('SALTCORN_SECTEST_RESOURCES'):
+        self._sampler_report = 'resources-%d-%d' % (port, time.time())
+        self.start_sampler(float(os.environ['SALTCORN_SECTEST_RESOURCES']))
+    else:
+      wait_for_port_open(self.base_url)
 
   @staticmethod
   def reset_to_fixtures():
-    SaltcornSession.cli("reset-schema", "-f")
-    SaltcornSession.cli("fixtures")
+    # the first reset builds the fixtures and snapshots the database; later
+    # ones clone it back from the snapshot instead of re-running them
+    def build():
+      cli_client.run_process("reset-schema", "-f")
+      cli_client.run_process("fixtures")
+    SaltcornSession._before_reset()
+    cli_client.restart()
+    scdb.restore_or_build("fixtures", build)
+    SaltcornSession.fixture_generation += 1
+
+  @staticmethod
+  def reset_schema():
+    # an empty site with no users, as left by reset-schema alone
+    SaltcornSession._before_reset()
+    cli_client.restart()
+    scdb.restore_or_build("empty", lambda: cli_client.run_process("reset-schema", "-f"))
+    SaltcornSession.fixture_generation += 1
 
   @staticmethod
   def cli(*args):
-    result = subprocess.run(["packages/saltcorn-cli/bin/saltcorn"]+list(args),
-                             capture_output = True,
-                             check= True,
-                             text = True)
-    return result.stdout.strip()
-                             
+    # served by a long-lived `saltcorn command-server`, see cli_client
+    return cli_client.run(*args).stdout.strip()
+
+  @staticmethod
+  def cli_result(*args, check=True):
+    """the full cli_client.CliResult: exit code, stdout, stderr, timing"""
+    return cli_client.run(*args, check=check)
+
   @staticmethod
   def asset_path(name):
-    return os.path.join(os.path.dirname(os.path.realpath(__file__)), "assets", name)
\ No newline at end of file
+    return os.path.join(os.path.dirname(os.path.realpath(__file__)), "assets", name)
+
+
+atexit.register(SaltcornSession.close_warm)
+
+
+class AsyncSaltcornSession(AsyncSession):
+  """
+  async counterpart of SaltcornSession for load generation. It only
+  attaches to an already running server - start that with SaltcornSession.
+  """
+  def __init__(self, port=None, base_url=None, **kwargs):
+    self._last_csrf = ''
+    super().__init__(base_url or 'http://localhost:%d/' % (port or shard.port()), **kwargs)
+
+  def csrf(self):
+    # a buffered page is searched in full, a streamed one only in its head
+    if self.content is not None:
+      return page_csrf(self.content)
+    return page_csrf(self.head, HEAD_SCAN_LIMIT)
+
+  def head_complete(self, head):
+    return head_has_csrf(head) or super().head_complete(head)
+
+  async def get(self, url, allow_redirects=False, timeout=30, stream=False):
+    await super().get(url, allow_redirects=allow_redirects, timeout=timeout, stream=stream)
+    token = self.csrf()
+    if token:
+      self._last_csrf = token
+
+  async def refresh_csrf(self):
+    await super().get('/auth/csrf-token')
+    if self.status == 200:
+      self._last_csrf = json.loads(self.content).get('csrfToken', '')
+    return self._last_csrf
+
+  async def apiPost(self, url, data, allow_redirects=False, extra_headers=None):
+    await super().apiPost(url, data, allow_redirects=allow_redirects,
+                          extra_headers=extra_headers, csrf_token=self._last_csrf or None)
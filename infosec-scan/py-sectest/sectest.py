@@ -1,20 +1,128 @@
+import time
+import asyncio
 import requests
+import httpx
+import latency
 from urllib.parse import urljoin
 from urllib.request import urlopen
 
-class Session:
-  def __init__(self, base_url):
-    self.base_url = base_url
-    self.reset()
+# a streamed response only has this much of its head read up front; the
+# rest of the body is left on the socket until it is asked for
+HEAD_SCAN_LIMIT = 64 * 1024
+HEAD_CHUNK_SIZE = 8 * 1024
+
+
+def redirect_url(status, headers, content):
+  """where a 3xx response points, from Location or else the body's last word"""
+  if not (300 <= status < 400):
+    return None
+  url = headers.get('Location')
+  if url is None and content:
+    ws = content.split()
+    url = ws[len(ws)-1]
+  return url
+
+
+class ResponseState:
+  """
+  what Session and AsyncSession keep of the last response, and how they
+  read it: the whole body as `content`, or for a streamed one only its
+  `head`, with the rest left to iter_body()
+  """
+
+  def head_complete(self, head):
+    """whether a streamed body's `head` bytes hold everything we look at"""
+    return b'</head>' in head
 
-  def __read_response(self, resp):
+  def _clear_response(self):
+    self.response = None
+    self.status = None
+    self.content = None
+    self.head = None
+    self.redirect_url = None
+
+  def _start_head(self, resp, body):
+    self.response = resp
+    self._body = body
+    self._head = b''
+
+  def _add_to_head(self, chunk):
+    """True once the head scanned so far is enough"""
+    self._head += chunk
+    return len(self._head) >= HEAD_SCAN_LIMIT or self.head_complete(self._head)
+
+  def _finish_response(self, resp, stream):
     self.status = resp.status_code
-    self.content = resp.text
-    if self.status >= 300 and self.status <400:
-        ws = self.content.split()
-        self.redirect_url=ws[len(ws)-1]
+    if stream:
+      self.head = self._head.decode(resp.encoding or 'utf-8', errors='replace')
+      self.content = None
     else:
-        self.redirect_url = None
+      self.head = None
+      self.content = resp.text
+    self.redirect_url = redirect_url(self.status, resp.headers, self.content)
+
+
+class Session(ResponseState):
+  def __init__(self, base_url, recorder=None):
+    self.base_url = base_url
+    # a latency.LatencyRecorder; set SALTCORN_SECTEST_LATENCY to give every
+    # session the shared one
+    self.recorder = recorder if recorder is not None else latency.recorder
+    self.reset()
+
+  def __request(self, method, url, **kwargs):
+    self.close_body()
+    full_url = urljoin(self.base_url, url)
+    if self.recorder is None:
+      return self.session.request(method, full_url, **kwargs)
+    latency.reset_connect_time()
+    t0 = time.perf_counter()
+    resp = self.session.request(method, full_url, **kwargs)
+    total = time.perf_counter() - t0
+    # a streamed body has not been read yet, go by its declared length
+    body_in = int(resp.headers.get('Content-Length') or 0) if kwargs.get('stream') \
+      else len(resp.content)
+    self.recorder.record(
+      method, full_url, resp.status_code,
+      connect=latency.connect_time(),
+      ttfb=resp.elapsed.total_seconds(),
+      total=total,
+      bytes_in=body_in + latency.headers_size(resp.headers),
+      bytes_out=len(resp.request.body or b'') + latency.headers_size(resp.request.headers),
+    )
+    return resp
+
+  def __read_response(self, resp, stream=False):
+    if stream:
+      self._start_head(resp, resp.iter_content(HEAD_CHUNK_SIZE))
+      for chunk in self._body:
+        if self._add_to_head(chunk):
+          break
+    self._finish_response(resp, stream)
+
+  def iter_body(self):
+    """rest of a streamed response, starting with the already scanned head"""
+    if self.response is None:
+      return
+    try:
+      yield self._head
+      for chunk in self._body:
+        yield chunk
+    finally:
+      self.close_body()
+
+  def save_body(self, path):
+    size = 0
+    with open(path, 'wb') as f:
+      for chunk in self.iter_body():
+        f.write(chunk)
+        size += len(chunk)
+    return size
+
+  def close_body(self):
+    if getattr(self, 'response', None) is not None:
+      self.response.close()
+      self.response = None
 
   def sessionID(self):
     cookiesDict = self.session.cookies.get_dict()
@@ -23,19 +131,24 @@ class Session:
     else:
       return ""
 
-  def get(self, url, allow_redirects=False, timeout=30):
-    resp = self.session.get(urljoin(self.base_url, url), allow_redirects=allow_redirects, timeout=timeout)
-    self.__read_response(resp)
+  def get(self, url, allow_redirects=False, timeout=30, stream=False):
+    resp = self.__request('GET', url, allow_redirects=allow_redirects, timeout=timeout, stream=stream)
+    self.__read_response(resp, stream)
+
+  def download(self, url, path, timeout=30):
+    """stream a large body (backups, served files) to disk without buffering it"""
+    self.get(url, timeout=timeout, stream=True)
+    return self.save_body(path)
 
   def postForm(self, url, data, allow_redirects=False):
-    resp = self.session.post(urljoin(self.base_url, url), data=data, allow_redirects=allow_redirects)
+    resp = self.__request('POST', url, data=data, allow_redirects=allow_redirects)
     self.__read_response(resp)
 
   def apiPost(self, url, data, allow_redirects=False, extra_headers=None, csrf_token=None):
     headers = {'Content-Type': 'application/json', **(extra_headers or {})}
     if csrf_token:
       headers['x-csrf-token'] = csrf_token
-    resp = self.session.post(urljoin(self.base_url, url), json=data, headers=headers, allow_redirects=allow_redirects)
+    resp = self.__request('POST', url, json=data, headers=headers, allow_redirects=allow_redirects)
     self.__read_response(resp)
 
   def follow_redirect(self):
@@ -43,8 +156,143 @@ class Session:
 
 
   def reset(self):
-    self.status = None
-    self.content = None
-    self.redirect_url = None
+    self.close_body()
+    self._clear_response()
     self.session = requests.Session()
-  
+    adapter = latency.TimedHTTPAdapter()
+    self.session.mount('http://', adapter)
+    self.session.mount('https://', adapter)
+
+
+class AsyncSession(ResponseState):
+  """
+  asyncio twin of Session on top of a pooled httpx.AsyncClient, so one
+  event loop can keep many requests in flight without a thread each.
+  Pass a shared `transport` to pool connections across several sessions
+  (e.g. one per logged-in user) while keeping their cookie jars apart.
+  """
+
+  def __init__(self, base_url, max_connections=100, transport=None, timeout=30, recorder=None):
+    self.base_url = base_url
+    self.recorder = recorder if recorder is not None else latency.recorder
+    self.limits = httpx.Limits(max_connections=max_connections,
+                               max_keepalive_connections=max_connections)
+    self.transport = transport
+    self.timeout = timeout
+    self.session = None
+    self.reset()
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *exc):
+    await self.aclose()
+
+  async def __request(self, method, url, follow_redirects=False, stream=False, **kwargs):
+    await self.close_body()
+    full_url = urljoin(self.base_url, url)
+    if self.recorder is None:
+      req = self.session.build_request(method, full_url, **kwargs)
+      return await self.session.send(req, stream=stream, follow_redirects=follow_redirects)
+    marks = {}
+
+    async def trace(event_name, info):
+      marks[event_name] = time.perf_counter()
+
+    t0 = time.perf_counter()
+    req = self.session.build_request(method, full_url, extensions={'trace': trace}, **kwargs)
+    resp = await self.session.send(req, stream=stream, follow_redirects=follow_redirects)
+    end = time.perf_counter()
+
+    def span(step):
+      return marks.get(f'connection.{step}.complete', 0) - marks.get(f'connection.{step}.started', 0)
+
+    headers_done = marks.get('http11.receive_response_headers.complete') \
+      or marks.get('http2.receive_response_headers.complete') or end
+    self.recorder.record(
+      method, full_url, resp.status_code,
+      connect=span('connect_tcp') + span('start_tls'),
+      ttfb=headers_done - t0,
+      total=end - t0,
+      bytes_in=(int(resp.headers.get('Content-Length') or 0) if stream else len(resp.content))
+        + latency.headers_size(resp.headers),
+      bytes_out=len(resp.request.content) + latency.headers_size(resp.request.headers),
+    )
+    return resp
+
+  async def __read_response(self, resp, stream=False):
+    if stream:
+      self._start_head(resp, resp.aiter_bytes(HEAD_CHUNK_SIZE))
+      async for chunk in self._body:
+        if self._add_to_head(chunk):
+          break
+    self._finish_response(resp, stream)
+
+  async def iter_body(self):
+    if self.response is None:
+      return
+    try:
+      yield self._head
+      async for chunk in self._body:
+        yield chunk
+    finally:
+      await self.close_body()
+
+  async def save_body(self, path):
+    size = 0
+    with open(path, 'wb') as f:
+      async for chunk in self.iter_body():
+        f.write(chunk)
+        size += len(chunk)
+    return size
+
+  async def close_body(self):
+    if getattr(self, 'response', None) is not None:
+      await self.response.aclose()
+      self.response = None
+
+  def sessionID(self):
+    for cookie in self.session.cookies.jar:
+      if cookie.name == 'connect.sid':
+        return cookie.value
+    return ""
+
+  async def get(self, url, allow_redirects=False, timeout=30, stream=False):
+    resp = await self.__request('GET', url, follow_redirects=allow_redirects, timeout=timeout, stream=stream)
+    await self.__read_response(resp, stream)
+
+  async def download(self, url, path, timeout=30):
+    await self.get(url, timeout=timeout, stream=True)
+    return await self.save_body(path)
+
+  async def postForm(self, url, data, allow_redirects=False):
+    resp = await self.__request('POST', url, data=data, follow_redirects=allow_redirects)
+    await self.__read_response(resp)
+
+  async def apiPost(self, url, data, allow_redirects=False, extra_headers=None, csrf_token=None):
+    headers = {'Content-Type': 'application/json', **(extra_headers or {})}
+    if csrf_token:
+      headers['x-csrf-token'] = csrf_token
+    resp = await self.__request('POST', url, json=data, headers=headers, follow_redirects=allow_redirects)
+    await self.__read_response(resp)
+
+  async def follow_redirect(self):
+    await self.get(self.redirect_url)
+
+  async def aclose(self):
+    await self.close_body()
+    # closing the client would also close a shared transport; its owner
+    # closes that once every session using it is done
+    if self.session is not None and self.transport is None:
+      await self.session.aclose()
+
+  def reset(self):
+    self._clear_response()
+    old_session = self.session
+    self.session = httpx.AsyncClient(limits=self.limits, transport=self.transport,
+                                     timeout=self.timeout)
+    if old_session is not None and self.transport is None:
+      try:
+        asyncio.get_running_loop().create_task(old_session.aclose())
+      except RuntimeError:
+        pass
@@ -0,0 +1,138 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import logging
+from urllib.parse import urlparse
+from scsession import SaltcornSession, AsyncSaltcornSession
+from shard import shard
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = shard.url()
+
+
+class SessionPool:
+  """
+  Hands out already logged-in sessions keyed by (base_url, email).
+
+  The connect.sid cookie jars are kept on disk between runs, so a session
+  is only re-created (GET /auth/login + the bcrypt-hashing POST) when the
+  server no longer accepts the stored cookie. That check is lazy: it runs
+  once per key, and again after SaltcornSession.reset_to_fixtures() since
+  a schema reset also wipes the session store.
+  """
+
+  def __init__(self, cache_dir=None):
+    self.cache_dir = cache_dir or os.environ.get(
+      'SALTCORN_SECTEST_SESSION_CACHE',
+      os.path.join(tempfile.gettempdir(), 'saltcorn-sectest-sessions'))
+    os.makedirs(self.cache_dir, exist_ok=True)
+    self.sessions = {}
+    # key -> fixture generation the stored cookie was last validated in
+    self.validated = {}
+    self.lock = threading.RLock()
+
+  def _jar_path(self, base_url, email):
+    key = hashlib.sha1(f'{base_url}|{email}'.encode()).hexdigest()
+    return os.path.join(self.cache_dir, key + '.json')
+
+  def _load_jar(self, sess, email):
+    path = self._jar_path(sess.base_url, email)
+    if not os.path.exists(path):
+      return False
+    try:
+      with open(path) as f:
+        cookies = json.load(f)
+    except (OSError, ValueError):
+      return False
+    for c in cookies:
+      sess.session.cookies.set(c['name'], c['value'], domain=c['domain'], path=c['path'])
+    return True
+
+  def _save_jar(self, sess, email):
+    cookies = [
+      {'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path}
+      for c in sess.session.cookies
+    ]
+    path = self._jar_path(sess.base_url, email)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+      json.dump(cookies, f)
+    os.replace(tmp, path)
+
+  def _is_authenticated(self, sess):
+    sess.get('/auth/authenticated')
+    if sess.status != 200:
+      return False
+    try:
+      return json.loads(sess.content).get('authenticated') is True
+    except ValueError:
+      return False
+
+  def _password_login(self, sess, email, password):
+    sess.get('/auth/login')
+    sess.postForm('/auth/login', {
+      'email': email,
+      'password': password,
+      '_csrf': sess.csrf(),
+    })
+    assert sess.redirect_url == '/', (
+      f"login as {email} on {sess.base_url} failed: {sess.status} {sess.redirect_url}"
+    )
+
+  def login(self, sess, email, password):
+    """
+    drop-in replacement for the per-module login(sess) helpers: puts a
+    valid connect.sid for `email` into `sess`, logging in only if needed
+    """
+    key = (sess.base_url, email)
+    with self.lock:
+      if self.validated.get(key) == SaltcornSession.fixture_generation \
+          and getattr(sess, '_pool_email', None) == email:
+        return sess
+      if self._load_jar(sess, email) and self._is_authenticated(sess):
+        logger.info("reusing stored session for %s on %s", email, sess.base_url)
+      else:
+        sess.reset()
+        self._password_login(sess, email, password)
+        self._save_jar(sess, email)
+      sess.refresh_csrf()
+      sess._pool_email = email
+      self.validated[key] = SaltcornSession.fixture_generation
+      return sess
+
+  def session(self, email, password, base_url=DEFAULT_BASE_URL):
+    """a pooled, logged-in SaltcornSession attached to a running server"""
+    key = (base_url, email)
+    with self.lock:
+      sess = self.sessions.get(key)
+      if sess is None:
+        sess = SaltcornSession(port=urlparse(base_url).port or 80, open_process=False)
+        sess.base_url = base_url
+        self.sessions[key] = sess
+      return self.login(sess, email, password)
+
+  def async_session(self, email, password, base_url=DEFAULT_BASE_URL, **kwargs):
+    """
+    a new AsyncSaltcornSession sharing the pooled cookie; each call gets
+    its own client so virtual users don't share connection state
+    """
+    sess = self.session(email, password, base_url)
+    asess = AsyncSaltcornSession(base_url=base_url, **kwargs)
+    for c in sess.session.cookies:
+      asess.session.cookies.set(c.name, c.value, domain=c.domain, path=c.path)
+    asess._last_csrf = sess._last_csrf
+    return asess
+
+  def invalidate(self, base_url, email):
+    with self.lock:
+      self.validated.pop((base_url, email), None)
+      self.sessions.pop((base_url, email), None)
+      path = self._jar_path(base_url, email)
+      if os.path.exists(path):
+        os.remove(path)
+
+
+pool = SessionPool()
@@ -0,0 +1,79 @@
+"""
+Splits ports and databases between parallel test runners, so the suite
+can run under `pytest -n <workers>` (pytest-xdist) or as several
+SALTCORN_SHARD=<n> processes at once.
+
+Shard 0 is what a plain serial run has always used: ports from 3001 and
+the configured database. Shard n gets ports from 3001 + n * PORT_SPAN and
+its own database (PGDATABASE + "_shard<n>", or a sibling SQLite file), so
+it also gets its own fixture snapshot (see scdb.restore_or_build). The
+settings are applied to os.environ on import, so the CLI commands and
+servers this process starts, and scdb itself, all use the shard's
+database.
+"""
+import os
+import re
+import logging
+import scdb
+
+logger = logging.getLogger(__name__)
+
+BASE_PORT = 3001
+# ports per shard: servers, cluster nodes and side services like the
+# oauth2 test server all take an offset within this range
+PORT_SPAN = 100
+
+
+def shard_index():
+  """SALTCORN_SHARD, else the number in PYTEST_XDIST_WORKER (gw3 -> 3), else 0"""
+  if os.environ.get("SALTCORN_SHARD"):
+    return int(os.environ["SALTCORN_SHARD"])
+  m = re.search(r"(\d+)$", os.environ.get("PYTEST_XDIST_WORKER", ""))
+  return int(m.group(1)) if m else 0
+
+
+class Shard:
+  def __init__(self, index=0):
+    self.index = index
+
+  def port(self, offset=0):
+    assert 0 <= offset < PORT_SPAN, "port offset %d outside the shard's range" % offset
+    return BASE_PORT + self.index * PORT_SPAN + offset
+
+  def url(self, path="", offset=0, host="localhost"):
+    return "http://%s:%d/%s" % (host, self.port(offset), path.lstrip("/"))
+
+  def env(self):
+    """environment settings that point Saltcorn at this shard's database"""
+    if self.index == 0:
+      return {}
+    params = scdb.connect_params()
+    if params["driver"] == "postgres":
+      base = params["conninfo"]["dbname"]
+      env = {"PGDATABASE": "%s_shard%d" % (base, self.index)}
+      # spell the rest out too: they may have come from DATABASE_URL,
+      # which activate() drops
+      for key, var in (("user", "PGUSER"), ("password", "PGPASSWORD"),
+                       ("host", "PGHOST"), ("port", "PGPORT"), ("sslmode", "PGSSLMODE")):
+        if params["conninfo"].get(key):
+          env[var] = str(params["conninfo"][key])
+      return env
+    root, ext = os.path.splitext(params["path"])
+    return {"SQLITE_FILEPATH": "%s_shard%d%s" % (root, self.index, ext)}
+
+  def activate(self):
+    env = self.env()
+    if not env:
+      return
+    if "DATABASE_URL" in os.environ:
+      # it would take precedence over the per-shard PGDATABASE
+      del os.environ["DATABASE_URL"]
+    os.environ.update(env)
+    scdb.db.close()
+    if "PGDATABASE" in env:
+      scdb.ensure_database(env["PGDATABASE"])
+    logger.info("running as shard %d: ports from %d, %s", self.index, self.port(), env)
+
+
+shard = Shard(shard_index())
+shard.activate()
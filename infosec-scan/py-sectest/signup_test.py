@@ -1,9 +1,10 @@
 from scsession import SaltcornSession
+from shard import shard
 
 class Test:
     def setup_class(self):
         SaltcornSession.reset_to_fixtures()
-        self.sess = SaltcornSession(3002)
+        self.sess = SaltcornSession.warm(shard.port(1))
 
     def teardown_class(self):
         self.sess.close()
@@ -0,0 +1,320 @@
+"""
+Socket.io clients for the tests and benchmarks. Every connection is a
+socketio.AsyncClient on one shared event loop, a SocketHub running in a
+background thread, so one process can hold thousands of them without a
+thread each.
+
+SocketClient is one browser tab with a blocking API for the tests: the
+HTTP session it logs in and posts forms with, plus one socket.io
+connection that sends that session's cookie. The chat, logs viewer,
+dynamic updates, collab and restore clients subclass it. Events are
+stamped with their arrival time, and the tests wait on them instead of
+sleeping:
+
+  staff.send_message(...)               # marks the time of the action
+  admin.wait_for(lambda m: 'hi' in m['append'])
+  foo.expect_no_event(window=0.2)       # nothing within 0.2s of the action
+
+How long each event took to arrive after the action that caused it is
+recorded per event name; SALTCORN_SECTEST_DELIVERY=<file.json> writes
+those histograms at exit. Benchmarks open connections in bulk instead:
+
+  hub = SocketHub.default()
+  conns, errors = hub.run(open_connections(
+    shard.url(), cookies, events=['dynamic_update'], on_event=record,
+    join=lambda c: c.emit('join_dynamic_update_room', {...})))
+"""
+import os
+import json
+import time
+import atexit
+import asyncio
+import resource
+import functools
+import threading
+import collections
+import logging
+import socketio
+from scsession import SaltcornSession
+from latency import Histogram
+
+logger = logging.getLogger(__name__)
+
+Arrival = collections.namedtuple('Arrival', ['time', 'event', 'data'])
+
+# when a client last did something that should make events arrive
+_last_action = 0.0
+# event name -> Histogram of us from that action to the event's arrival
+delivery = {}
+_delivery_lock = threading.Lock()
+
+
+def mark_action():
+  """note that an action which should cause socket events happens now"""
+  global _last_action
+  _last_action = time.monotonic()
+  return _last_action
+
+
+def last_action():
+  return _last_action
+
+
+def _record_delivery(event, seconds):
+  with _delivery_lock:
+    delivery.setdefault(event, Histogram('us')).record(seconds * 1e6)
+
+
+def _dump_delivery(path):
+  with _delivery_lock:
+    data = {event: h.to_dict() for event, h in sorted(delivery.items())}
+  with open(path, 'w') as f:
+    json.dump(data, f, indent=2)
+
+
+if os.environ.get('SALTCORN_SECTEST_DELIVERY'):
+  atexit.register(_dump_delivery, os.environ['SALTCORN_SECTEST_DELIVERY'])
+
+
+def raise_fd_limit(wanted):
+  """lift the soft open files limit towards `wanted`, as every socket takes an fd"""
+  soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+  target = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+  if soft < target:
+    resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    soft = target
+  return soft
+
+
+class SocketHub:
+  """an event loop in a thread of its own, for the socket.io connections"""
+  _default = None
+  _lock = threading.Lock()
+
+  def __init__(self):
+    self.loop = asyncio.new_event_loop()
+    self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+    self._thread.start()
+
+  @classmethod
+  def default(cls):
+    """the hub shared by every client that is not given one"""
+    with cls._lock:
+      if cls._default is None:
+        cls._default = cls()
+      return cls._default
+
+  def run(self, coro, timeout=None):
+    """run a coroutine on the hub's loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+  def stop(self):
+    self.loop.call_soon_threadsafe(self.loop.stop)
+    self._thread.join()
+
+
+class SocketConnection:
+  """
+  one socket.io connection; the coroutines run on the hub's loop. Events
+  registered with on() go to on_event(conn, event, data). `options` go
+  to socketio.AsyncClient; it does not reconnect unless asked to.
+  """
+
+  def __init__(self, base_url, cookie='', on_event=None, **options):
+    self.base_url = base_url
+    self.cookie = cookie
+    self.on_event = on_event
+    options.setdefault('reconnection', False)
+    self.sio = socketio.AsyncClient(**options)
+
+  def _dispatch(self, event, *args):
+    if self.on_event is not None:
+      self.on_event(self, event, args[0] if len(args) == 1 else (args or None))
+
+  def on(self, event, handler=None):
+    self.sio.on(event, handler or functools.partial(self._dispatch, event))
+
+  @property
+  def connected(self):
+    return self.sio.connected
+
+  async def connect(self, timeout=10):
+    headers = {'cookie': self.cookie} if self.cookie else {}
+    await self.sio.connect(self.base_url, transports=['websocket'], headers=headers,
+                           wait_timeout=timeout)
+
+  async def emit(self, event, data=None, callback=None):
+    await self.sio.emit(event, data, callback=callback)
+
+  async def call(self, event, data=None, timeout=5):
+    """emit and wait for the server's acknowledgement; None if there is none in time"""
+    try:
+      return await self.sio.call(event, data, timeout=timeout)
+    except socketio.exceptions.TimeoutError:
+      return None
+
+  async def disconnect(self):
+    await self.sio.disconnect()
+
+
+async def open_connections(base_url, cookies, events=(), on_event=None, join=None,
+                           concurrency=100, timeout=10, **options):
+  """
+  one connection per cookie ('' for an anonymous one), with at most
+  `concurrency` handshakes in flight. `join(conn)`, a coroutine function,
+  runs on each once it is connected, e.g. to join a room. Returns the
+  connections that made it and the exceptions of those that did not.
+  `options` are those of SocketConnection.
+  """
+  slots = asyncio.Semaphore(concurrency)
+
+  async def open_one(cookie):
+    conn = SocketConnection(base_url, cookie, on_event, **options)
+    for event in events:
+      conn.on(event)
+    async with slots:
+      await conn.connect(timeout)
+      if join is not None:
+        await join(conn)
+    return conn
+
+  results = await asyncio.gather(*(open_one(c) for c in cookies), return_exceptions=True)
+  return ([r for r in results if isinstance(r, SocketConnection)],
+          [r for r in results if not isinstance(r, SocketConnection)])
+
+
+async def close_connections(conns):
+  await asyncio.gather(*(c.disconnect() for c in conns), return_exceptions=True)
+
+
+class SocketClient:
+  """
+  Base of the socket test clients. Events named in `events` (and any
+  added with on()) go to handle_event(event, data), which by default
+  collects the data in `received` and a timestamped Arrival in
+  `arrivals`. Methods that make the server send events call
+  mark_action() first.
+  """
+  events = ()
+  # load a page after logging in, for a CSRF token of the new session
+  reload_after_login = False
+
+  def __init__(self, port=None, session=None, hub=None):
+    self.session = session if session is not None \
+      else SaltcornSession(port=port, open_process=False)
+    self.hub = hub or SocketHub.default()
+    self.csrf = ''
+    self.received = []
+    self.arrivals = []
+    self.cond = threading.Condition()
+    # arrivals already counted in the delivery latencies
+    self._measured = 0
+    self.conn = SocketConnection(self.session.base_url, on_event=self._on_event)
+    for event in self.events:
+      self.conn.on(event)
+    if session is None:
+      self.init_csrf()
+
+  def _on_event(self, conn, event, data):
+    self.handle_event(event, data)
+
+  def handle_event(self, event, data):
+    with self.cond:
+      self.received.append(data)
+      self.arrivals.append(Arrival(time.monotonic(), event, data))
+      self.cond.notify_all()
+
+  def _measure(self, since):
+    # delivery latency of everything that arrived after the action
+    for a in self.arrivals[self._measured:]:
+      if a.time >= since:
+        _record_delivery(a.event, a.time - since)
+    self._measured = len(self.arrivals)
+
+  def wait_for(self, predicate=None, timeout=5, count=1, since=None):
+    """
+    block until `count` events that arrived from `since` (default: the
+    last action) on have matched predicate(data) (any event if None);
+    returns their Arrivals, or raises TimeoutError
+    """
+    since = last_action() if since is None else since
+    deadline = time.monotonic() + timeout
+    with self.cond:
+      while True:
+        found = [a for a in self.arrivals
+                 if a.time >= since and (predicate is None or predicate(a.data))]
+        if len(found) >= count:
+          self._measure(last_action())
+          return found
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+          raise TimeoutError("%d of %d events within %ss, got %r"
+                             % (len(found), count, timeout, self.received))
+        self.cond.wait(remaining)
+
+  def expect_no_event(self, predicate=None, window=1, since=None):
+    """
+    fail if an event matching predicate(data) (any if None) arrives from
+    `since` (default: the last action) until `window` seconds after it.
+    Any client's action moves the default, so when other clients act
+    meanwhile pass `since` explicitly, and where possible first wait for
+    a client that should get the same event, so the window starts once
+    the server has delivered it
+    """
+    since = last_action() if since is None else since
+    deadline = since + window
+    with self.cond:
+      while True:
+        late = [a for a in self.arrivals
+                if a.time >= since and (predicate is None or predicate(a.data))]
+        assert not late, "unexpected %s %.3fs after the action: %r" % (
+          late[0].event, late[0].time - since, late[0].data)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+          return
+        self.cond.wait(remaining)
+
+  def init_csrf(self):
+    self.session.get('/auth/login')
+    self.csrf = self.session.csrf()
+
+  def login(self, email, password):
+    self.session.postForm('/auth/login',
+      {'email': email,
+        'password': password,
+        '_csrf': self.csrf
+      })
+    assert self.session.redirect_url == '/'
+    if self.reload_after_login:
+      self.session.get('/')
+
+  def cookie(self, logged_in=True):
+    return 'connect.sid=' + self.session.sessionID() + ('; loggedin=true' if logged_in else '')
+
+  def _connect(self, cookie):
+    self.conn.base_url = self.session.base_url
+    self.conn.cookie = cookie
+    self.hub.run(self.conn.connect())
+
+  def connect(self):
+    self._connect(self.cookie())
+
+  def connect_as_public(self):
+    self._connect(self.cookie(logged_in=False))
+
+  @property
+  def connected(self):
+    return self.conn.connected
+
+  def on(self, event):
+    self.conn.on(event)
+
+  def emit(self, event, data=None, callback=None):
+    self.hub.run(self.conn.emit(event, data, callback))
+
+  def call(self, event, data=None, timeout=5):
+    return self.hub.run(self.conn.call(event, data, timeout))
+
+  def disconnect(self):
+    if self.conn.connected:
+      self.hub.run(self.conn.disconnect())
@@ -0,0 +1,150 @@
+"""
+How long `saltcorn serve` takes to come up, and where the time goes. The
+server is booted again and again over a matrix of installed plugins,
+tenants and workers:
+
+  SALTCORN_BENCH_PLUGINS=0,5,10 SALTCORN_BENCH_TENANTS=0,10 \\
+    SALTCORN_BENCH_NWORKERS=1,4 python3 startup_bench.py
+
+Each boot is timed from spawning the process to the first successful
+request, and split into the phases the server reports with its ready
+signal (see packages/server/ready_signal.js): connecting to the database,
+migrations, plugin loading, tenant state init, forking the workers, and
+each worker's app setup, socket.io setup and listen. Written to
+bench-results/startup.json.
+"""
+import os
+import time
+import logging
+from scsession import SaltcornSession
+from latency import Histogram
+from shard import shard
+import benchutil
+
+benchutil.setup_logging()
+
+logger = logging.getLogger(__name__)
+
+TENANT_PREFIX = 'benchboot'
+
+# master phases, each measured from the end of the one before
+MASTER_PHASES = ['db_connected', 'migrations', 'plugins', 'tenants', 'fork',
+                 'first_worker_ready', 'workers_ready']
+# the same in every worker, from the worker process starting
+WORKER_PHASES = ['app', 'socket', 'listening']
+
+
+def _durations(phases, names):
+  """phase end times (ms since process start) to how long each one took"""
+  durations, last = {}, 0
+  for name in names:
+    if name in phases:
+      durations[name] = phases[name] - last
+      last = phases[name]
+  return durations
+
+
+def install_plugins(count):
+  names = os.environ.get('SALTCORN_BENCH_PLUGIN_NAMES')
+  names = names.split(',') if names else benchutil.PLUGINS
+  if count > len(names):
+    raise ValueError("only %d plugins to install, asked for %d" % (len(names), count))
+  for name in names[:count]:
+    SaltcornSession.cli("install-plugin", "-n", name)
+
+
+def create_tenants(have, want):
+  for i in range(have, want):
+    SaltcornSession.cli("create-tenant", "%s%d" % (TENANT_PREFIX, i))
+  benchutil.check_tenants(TENANT_PREFIX, want)
+
+
+def boot(port, workers, tenants, timeout):
+  """one cold start; timings in ms"""
+  started = time.perf_counter()
+  sess = SaltcornSession(port=port, env_vars={
+    'SALTCORN_NWORKERS': workers,
+    'SALTCORN_MULTI_TENANT': 'true' if tenants else 'false',
+  })
+  try:
+    ready = time.perf_counter()
+    deadline = ready + timeout
+    while True:
+      sess.get('/auth/login')
+      if sess.status == 200:
+        break
+      if time.perf_counter() > deadline:
+        raise TimeoutError("no successful request within %ss of the ready signal" % timeout)
+      time.sleep(0.01)
+    first = time.perf_counter()
+    info = sess.ready_info or {}
+  finally:
+    sess.stop()
+  phases = info.get('phases', {})
+  master = _durations(phases, MASTER_PHASES)
+  # in single-process mode the master does the worker setup itself,
+  # right after its own phases
+  worker_phases = info.get('worker_phases') or [phases]
+  workers_done = [_durations(p, MASTER_PHASES + WORKER_PHASES) for p in worker_phases]
+  return {
+    'to_ready_ms': (ready - started) * 1000,
+    'to_first_request_ms': (first - started) * 1000,
+    'ready_to_first_request_ms': (first - ready) * 1000,
+    'master': master,
+    'workers': {
+      name: max(w.get(name, 0) for w in workers_done) for name in WORKER_PHASES
+    },
+  }
+
+
+def run_combo(port, plugins, tenants, workers, boots, timeout):
+  totals = Histogram(unit='ms')
+  phases = {}
+  for i in range(boots):
+    result = boot(port, workers, tenants, timeout)
+    totals.record(result['to_first_request_ms'])
+    for group in ('master', 'workers'):
+      for name, ms in result[group].items():
+        phases.setdefault('%s.%s' % (group, name), Histogram(unit='ms')).record(ms)
+  summary = {
+    'plugins': plugins, 'tenants': tenants, 'workers': workers, 'boots': boots,
+    'to_first_request': totals.to_dict(),
+    # workers: the slowest worker of each boot
+    'phases': {name: h.to_dict() for name, h in phases.items()},
+  }
+  logger.info("%2d plugins, %3d tenants, %2d workers: first request after %.0fms (p50), "
+              "plugins %.0fms, tenants %.0fms, worker app %.0fms",
+              plugins, tenants, workers, totals.percentile(50),
+              phases['master.plugins'].percentile(50) if 'master.plugins' in phases else 0,
+              phases['master.tenants'].percentile(50) if 'master.tenants' in phases else 0,
+              phases['workers.app'].percentile(50) if 'workers.app' in phases else 0)
+  return summary
+
+
+def main():
+  plugin_counts = sorted(benchutil.env_ints('SALTCORN_BENCH_PLUGINS', '0,5,10'))
+  tenant_counts = sorted(benchutil.env_ints('SALTCORN_BENCH_TENANTS', '0,10'))
+  worker_counts = benchutil.env_ints('SALTCORN_BENCH_NWORKERS', '1,4')
+  boots = int(os.environ.get('SALTCORN_BENCH_BOOTS', 5))
+  timeout = float(os.environ.get('SALTCORN_BENCH_TIMEOUT', 60))
+  if any(tenant_counts):
+    # for the CLI; each boot sets it for the server itself
+    benchutil.enable_multi_tenant()
+  SaltcornSession.close_warm()
+  port = shard.port()
+  results = []
+  for plugins in plugin_counts:
+    SaltcornSession.reset_to_fixtures()
+    install_plugins(plugins)
+    have = 0
+    for tenants in tenant_counts:
+      create_tenants(have, tenants)
+      have = tenants
+      for workers in worker_counts:
+        results.append(run_combo(port, plugins, tenants, workers, boots, timeout))
+  SaltcornSession.reset_to_fixtures()
+  return benchutil.write_report('startup', {'boots': boots, 'results': results})
+
+
+if __name__ == '__main__':
+  main()
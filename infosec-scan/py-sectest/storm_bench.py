@@ -0,0 +1,170 @@
+"""
+Socket.io connect and reconnect storms against one node, as after a
+deploy or a network blip, when every open tab reconnects at once. M
+sockets, some with the cookie of a logged-in session and the rest
+public, connect as fast as they can and join their rooms the way
+saltcorn-common.js does. Then all of them drop and reconnect, a few
+times over:
+
+  SALTCORN_BENCH_SOCKETS=2000 SALTCORN_BENCH_PUBLIC=0.5 \\
+    SALTCORN_BENCH_WORKERS=4 python3 storm_bench.py
+
+Every handshake deserializes the connect.sid session and every join
+does its own auth and tenant lookup, so for each storm this reports the
+handshake rate, the join ack latency of join_collab_room and
+join_dynamic_update_room, and the node's memory (RSS of the master and
+workers) before, at the peak and after. Written to
+bench-results/storm.json.
+"""
+import os
+import time
+import logging
+from scsession import SaltcornSession
+from shard import shard
+from latency import Histogram
+from socket_client import (SocketClient, SocketHub, open_connections, close_connections,
+                           raise_fd_limit)
+import benchutil
+
+benchutil.setup_logging()
+
+logger = logging.getLogger(__name__)
+
+USERS = [
+  (benchutil.ADMIN_EMAIL, benchutil.ADMIN_PASSWORD),
+  ('staff@foo.com', 'ghrarhr54hg'),
+  ('user@foo.com', 'GFeggwrwq45fjn'),
+]
+COLLAB_VIEW = 'authoredit'
+
+
+def cookies(port, sockets, public_share, sessions):
+  """
+  one cookie per socket: `public_share` of them empty, the rest spread
+  over `sessions` logged-in sessions of the fixture users
+  """
+  public = round(sockets * public_share)
+  logged_in = []
+  for i in range(min(sessions, sockets - public)):
+    client = SocketClient(port=port)
+    client.login(*USERS[i % len(USERS)])
+    logged_in.append(client.cookie())
+  result = [''] * public
+  for i in range(sockets - public):
+    result.append(logged_in[i % len(logged_in)])
+  return result
+
+
+class Storm:
+  """one wave of sockets connecting and joining; timings kept per wave"""
+
+  def __init__(self):
+    self.connected_at = []
+    self.acks = {'collab': Histogram('us'), 'dynamic_update': Histogram('us')}
+    self.refused = []
+
+  async def _call(self, conn, kind, event, data=None):
+    t = time.monotonic()
+    ack = await conn.call(event, data)
+    self.acks[kind].record((time.monotonic() - t) * 1e6)
+    if not ack or ack.get('status') != 'ok':
+      self.refused.append((kind, ack))
+
+  async def join(self, conn):
+    self.connected_at.append(time.monotonic())
+    if conn.cookie:
+      await self._call(conn, 'collab', 'join_collab_room', COLLAB_VIEW)
+    await self._call(conn, 'dynamic_update', 'join_dynamic_update_room')
+
+  def run(self, hub, base_url, cookies, concurrency, timeout):
+    t0 = time.monotonic()
+    conns, errors = hub.run(open_connections(
+      base_url, cookies, join=self.join, concurrency=concurrency, timeout=timeout))
+    elapsed = time.monotonic() - t0
+    handshakes = (max(self.connected_at) - t0) if self.connected_at else None
+    self.result = {
+      'connected': len(conns),
+      'connect_errors': len(errors),
+      'errors': sorted({type(e).__name__ for e in errors}),
+      'handshakes_per_s': len(self.connected_at) / handshakes if handshakes else None,
+      'storm_s': elapsed,
+      'refused_joins': len(self.refused),
+      'join_ack_ms': {kind: {'p50': benchutil.ms(h, 50), 'p99': benchutil.ms(h, 99),
+                             'max': (h.max or 0) / 1000, 'count': h.count}
+                      for kind, h in self.acks.items()},
+    }
+    return conns
+
+
+def _rss_kb(sampler):
+  return sampler.samples[-1]['total']['rss_kb'] if sampler.samples else None
+
+
+def _peak_rss_kb(sampler, since):
+  return max((s['total']['rss_kb'] for s in sampler.samples
+              if sampler.started + s['t'] >= since), default=None)
+
+
+def _memory(sampler, since):
+  # a fresh sample, rather than one up to an interval old
+  sampler.sample()
+  return {'rss_kb': _rss_kb(sampler), 'peak_rss_kb': _peak_rss_kb(sampler, since)}
+
+
+def main():
+  sockets = int(os.environ.get('SALTCORN_BENCH_SOCKETS', 2000))
+  public_share = float(os.environ.get('SALTCORN_BENCH_PUBLIC', 0.5))
+  sessions = int(os.environ.get('SALTCORN_BENCH_SESSIONS', 30))
+  workers = int(os.environ.get('SALTCORN_BENCH_WORKERS', 4))
+  reconnects = int(os.environ.get('SALTCORN_BENCH_RECONNECTS', 3))
+  concurrency = int(os.environ.get('SALTCORN_BENCH_CONCURRENCY', 500))
+  timeout = float(os.environ.get('SALTCORN_BENCH_TIMEOUT', 30))
+  settle = float(os.environ.get('SALTCORN_BENCH_SETTLE', 5))
+  raise_fd_limit(sockets + 256)
+  SaltcornSession.close_warm()
+  SaltcornSession.reset_to_fixtures()
+  server = SaltcornSession(env_vars={'SALTCORN_NWORKERS': workers})
+  hub = SocketHub()
+  storms = []
+  try:
+    jar = cookies(shard.port(), sockets, public_share, sessions)
+    sampler = server.start_sampler(0.5)
+    time.sleep(settle)
+    baseline = _memory(sampler, 0)
+    conns = []
+    for wave in range(reconnects + 1):
+      # wave 0 is the first connect, the rest drop everything and reconnect
+      t0 = time.monotonic()
+      if conns:
+        hub.run(close_connections(conns))
+      storm = Storm()
+      conns = storm.run(hub, server.base_url, jar, concurrency, timeout)
+      result = {'wave': wave, 'kind': 'connect' if wave == 0 else 'reconnect',
+                **storm.result, 'memory': _memory(sampler, t0)}
+      storms.append(result)
+      logger.info("%s storm: %d/%d sockets, %.0f handshakes/s, join ack p99 collab %s "
+                  "dynamic %s ms, %d refused, RSS %s MB (peak %s MB)", result['kind'],
+                  result['connected'], sockets, result['handshakes_per_s'] or 0,
+                  result['join_ack_ms']['collab']['p99'],
+                  result['join_ack_ms']['dynamic_update']['p99'], result['refused_joins'],
+                  (result['memory']['rss_kb'] or 0) // 1024,
+                  (result['memory']['peak_rss_kb'] or 0) // 1024)
+    t1 = time.monotonic()
+    hub.run(close_connections(conns))
+    time.sleep(settle)
+    after = _memory(sampler, t1)
+    server.stop_sampler()
+  finally:
+    hub.stop()
+    server.close()
+  logger.info("RSS %s MB before, %s MB with no sockets left after the storms",
+              (baseline['rss_kb'] or 0) // 1024, (after['rss_kb'] or 0) // 1024)
+  return benchutil.write_report('storm', {
+    'sockets': sockets, 'public_share': public_share, 'sessions': sessions,
+    'workers': workers, 'concurrency': concurrency,
+    'memory_before': baseline, 'storms': storms, 'memory_after': after,
+  })
+
+
+if __name__ == '__main__':
+  main()
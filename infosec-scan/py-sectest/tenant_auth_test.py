@@ -1,10 +1,11 @@
 from scsession import SaltcornSession
+from shard import shard
 
 
 
 class Test:
     def setup_class(self):
-        SaltcornSession.cli("reset-schema", "-f")
+        SaltcornSession.reset_schema()
         SaltcornSession.cli("rm-tenant", "-f", "-t", "sub1")
         SaltcornSession.cli("rm-tenant", "-f", "-t", "sub2")
         SaltcornSession.cli("create-tenant", "sub1")
@@ -12,7 +13,8 @@ class Test:
         SaltcornSession.cli("create-user", "-e","sub2@foo.com", "-a", "-p", "tyrh5h544yt45", "-t","sub2")
         SaltcornSession.cli("create-user", "-e","sub1@foo.com", "-a", "-p", "tyrh5h544yt46", "-t","sub1")
         SaltcornSession.cli("create-user", "-e","root@foo.com", "-a", "-p", "tyrh5h544yt47")
-        self.sess = SaltcornSession(3001)
+        # a cold process, so the tenants created above are set up the way a boot does it
+        self.sess = SaltcornSession(shard.port())
     def teardown_class(self):
         self.sess.close()
         SaltcornSession.cli("rm-tenant", "-f", "-t", "sub1")
@@ -26,7 +28,7 @@ class Test:
 
     def test_sub_to_sub_cross_tenant(self):
         self.sess.reset()
-        self.sess.base_url='http://sub1.example.com:3001/'
+        self.sess.base_url=f'http://sub1.example.com:{shard.port()}/'
         self.sess.get('/auth/login')
         assert "Login" in self.sess.content
         assert self.sess.status == 200
@@ -39,12 +41,12 @@ class Test:
         self.sess.get('/table')
         assert self.sess.status == 200
         assert "Your tables" in self.sess.content
-        self.sess.base_url='http://sub2.example.com:3001/'
+        self.sess.base_url=f'http://sub2.example.com:{shard.port()}/'
         self.cannot_access_admin()
 
     def test_main_to_sub_cross_tenant(self):
         self.sess.reset()
-        self.sess.base_url='http://example.com:3001/'
+        self.sess.base_url=f'http://example.com:{shard.port()}/'
         self.sess.get('/auth/login')
         assert "Login" in self.sess.content
         assert self.sess.status == 200
@@ -57,11 +59,11 @@ class Test:
         self.sess.get('/table')
         assert self.sess.status == 200
         assert "Your tables" in self.sess.content
-        self.sess.base_url='http://sub2.example.com:3001/'
+        self.sess.base_url=f'http://sub2.example.com:{shard.port()}/'
         self.cannot_access_admin()
     def test_sub_to_main_cross_tenant(self):
         self.sess.reset()
-        self.sess.base_url='http://sub1.example.com:3001/'
+        self.sess.base_url=f'http://sub1.example.com:{shard.port()}/'
         self.sess.get('/auth/login')
         assert "Login" in self.sess.content
         assert self.sess.status == 200
@@ -74,5 +76,5 @@ class Test:
         self.sess.get('/table')
         assert self.sess.status == 200
         assert "Your tables" in self.sess.content
-        self.sess.base_url='http://example.com:3001/'
+        self.sess.base_url=f'http://example.com:{shard.port()}/'
         self.cannot_access_admin()
@@ -1,4 +1,5 @@
 from scsession import SaltcornSession
+from shard import shard
 import pyotp
 import re
 email = "admin@foo.com"
@@ -8,7 +9,7 @@ password = "AhGGr6rhu45"
 class Test:
     def setup_class(self):
         SaltcornSession.reset_to_fixtures()
-        self.sess = SaltcornSession(3001)
+        self.sess = SaltcornSession.warm(shard.port())
         self.totp_key = None
 
     def teardown_class(self):
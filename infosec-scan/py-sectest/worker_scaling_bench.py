@@ -0,0 +1,152 @@
+"""
+How throughput and latency of one node scale with SALTCORN_NWORKERS. For
+each worker count the server is started fresh and a fixed set of logged
+in virtual users (see loadgen.py) runs authenticated scenarios against it:
+list views, REST reads and writes, and view form submits.
+
+  SALTCORN_BENCH_NWORKERS=1,2,4,8 SALTCORN_BENCH_USERS=50 \\
+    python3 worker_scaling_bench.py
+
+Reports scenario steps/s and p99 against workers, per scenario and
+overall, as a table in the log and as bench-results/worker-scaling.json. The master's
+and the workers' CPU use are sampled from /proc meanwhile: with cluster
+workers the master accepts every connection and hands it on over IPC,
+and relays messages between workers, so a master near one full core
+while adding workers stops paying off means IPC through the primary is
+the bottleneck. SALTCORN_BENCH_SCHED_POLICIES=rr,none repeats the sweep
+with the kernel distributing connections instead
+(NODE_CLUSTER_SCHED_POLICY), for comparison.
+
+A step is not one HTTP request: a view form submit GETs the form for its
+CSRF token and then POSTs it, so compare steps/s between runs of the
+same scenarios rather than with req/s from elsewhere.
+"""
+import os
+import logging
+from scsession import SaltcornSession
+from loadgen import LoadGenerator, Scenario, get, login, api_get, api_post, submit_view_form
+from latency import Histogram
+import benchutil
+
+benchutil.setup_logging()
+
+logger = logging.getLogger(__name__)
+
+# adding workers is "not paying off" below this gain in steps/s
+MIN_GAIN = 0.1
+# CPU cores a single-threaded process is busy at when saturated
+SATURATED = 0.85
+
+
+def _book_id(vu):
+  # writes go to the fixture books, so list views do not grow as we go
+  return 1 + vu.index % 2
+
+
+SCENARIOS = {
+  'list': Scenario('list', [get('/view/authorlist')], weight=3),
+  'rest_read': Scenario('rest_read', [api_get('books')], weight=3),
+  'rest_write': Scenario('rest_write', [
+    api_post('books', lambda vu: {'pages': vu.random.randint(1, 999)}, row_id=_book_id),
+  ]),
+  'form': Scenario('form', [
+    submit_view_form('authoredit', lambda vu: {'author': 'Bench %d' % vu.index},
+                     row_id=_book_id),
+  ]),
+}
+
+
+def run_workers(workers, policy, scenarios, users, duration, ramp_up):
+  env = {'SALTCORN_NWORKERS': workers}
+  if policy:
+    env['NODE_CLUSTER_SCHED_POLICY'] = policy
+  sess = SaltcornSession(env_vars=env)
+  try:
+    sampler = sess.start_sampler(1.0)
+    gen = LoadGenerator(scenarios, users=users, base_url=sess.base_url,
+                        setup=[login(benchutil.ADMIN_EMAIL, benchutil.ADMIN_PASSWORD)], ramp_up=ramp_up,
+                        duration=duration)
+    report = gen.run()
+    sess.stop_sampler()
+  finally:
+    sess.stop()
+  result = report.to_dict()
+  master_cpu, worker_cpu = benchutil.cpu(sampler)
+  measured = {k: s for k, s in result['steps'].items() if not k.startswith('setup/')}
+  overall = Histogram('us')
+  for key, entry in report.steps.items():
+    if key in measured:
+      overall.merge(entry['latency'])
+  p99 = overall.percentile(99)
+  return {
+    'workers': workers,
+    'sched_policy': policy or 'default',
+    'steps_per_s': sum(s['rps'] or 0 for s in measured.values()),
+    'p99_ms': p99 / 1000 if p99 is not None else None,
+    'errors': sum(s['errors'] for s in measured.values()),
+    'step_count': overall.count,
+    'master_cpu': master_cpu,
+    'worker_cpu_mean': sum(worker_cpu) / len(worker_cpu) if worker_cpu else None,
+    'steps': measured,
+  }
+
+
+def find_bottleneck(points):
+  """
+  the first worker count that adds less than MIN_GAIN steps/s over the one
+  before, and what was saturated there
+  """
+  for prev, point in zip(points, points[1:]):
+    gain = point['steps_per_s'] / prev['steps_per_s'] - 1 if prev['steps_per_s'] else 0
+    if gain >= MIN_GAIN:
+      continue
+    if point['workers'] > 1 and (point['master_cpu'] or 0) >= SATURATED:
+      cause = 'primary'
+    elif (point['worker_cpu_mean'] or 0) >= SATURATED:
+      cause = 'workers'
+    else:
+      cause = 'elsewhere'  # the database, or the load generator itself
+    return {'workers': point['workers'], 'gain': gain, 'cause': cause}
+  return None
+
+
+def table(points):
+  lines = ['%8s %10s %9s %11s %11s' % ('workers', 'steps/s', 'p99 ms', 'master cpu', 'worker cpu')]
+  top = max((p['steps_per_s'] for p in points), default=0) or 1
+  for p in points:
+    lines.append('%8d %10.1f %9.1f %11s %11s  %s' % (
+      p['workers'], p['steps_per_s'], p['p99_ms'] or 0,
+      '%.2f' % p['master_cpu'] if p['master_cpu'] is not None else '-',
+      '%.2f' % p['worker_cpu_mean'] if p['worker_cpu_mean'] is not None else '-',
+      '#' * round(40 * p['steps_per_s'] / top)))
+  return '\n'.join(lines)
+
+
+def main():
+  worker_counts = sorted(benchutil.env_ints('SALTCORN_BENCH_NWORKERS', '1,2,4,8'))
+  policies = [p for p in os.environ.get('SALTCORN_BENCH_SCHED_POLICIES', '').split(',') if p]
+  names = os.environ.get('SALTCORN_BENCH_SCENARIOS', ','.join(SCENARIOS)).split(',')
+  scenarios = [SCENARIOS[n] for n in names]
+  users = int(os.environ.get('SALTCORN_BENCH_USERS', 50))
+  duration = float(os.environ.get('SALTCORN_BENCH_DURATION', 30))
+  ramp_up = float(os.environ.get('SALTCORN_BENCH_RAMP_UP', 2))
+  SaltcornSession.close_warm()
+  sweeps = []
+  for policy in policies or [None]:
+    SaltcornSession.reset_to_fixtures()
+    points = [run_workers(n, policy, scenarios, users, duration, ramp_up)
+              for n in worker_counts]
+    bottleneck = find_bottleneck(points)
+    logger.info("scheduling policy %s, %d users:\n%s", policy or 'default', users, table(points))
+    if bottleneck:
+      logger.info("scaling stops at %d workers (+%.0f%% steps/s), bottleneck: %s",
+                  bottleneck['workers'], 100 * bottleneck['gain'], bottleneck['cause'])
+    sweeps.append({'sched_policy': policy or 'default', 'points': points,
+                   'bottleneck': bottleneck})
+  return benchutil.write_report('worker-scaling', {
+    'users': users, 'duration_s': duration, 'scenarios': names, 'sweeps': sweeps,
+  })
+
+
+if __name__ == '__main__':
+  main()
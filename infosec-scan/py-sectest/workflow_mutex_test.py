@@ -1,8 +1,9 @@
-import re
-import time
 import threading
 import logging
 from scsession import SaltcornSession
+from session_pool import pool
+from cluster import ClusterHarness
+from scdb import db
 
 logging.basicConfig(
   level=logging.INFO,
@@ -16,13 +17,9 @@ email = 'admin@foo.com'
 password = 'AhGGr6rhu45'
 
 
+# function to login, reusing a pooled session cookie where still valid
 def login(sess):
-  sess.get('/auth/login')
-  sess.postForm('/auth/login', {
-    'email': email,
-    'password': password,
-    '_csrf': sess.csrf(),
-  })
+  pool.login(sess, email, password)
 
 
 def log_step_code(prefix, sleep_ms):
@@ -39,18 +36,14 @@ def log_step_code(prefix, sleep_ms):
 class Test:
   def setup_class(self):
     SaltcornSession.reset_to_fixtures()
-    self.sess1 = SaltcornSession(port=3001, env_vars={
-        "SALTCORN_MULTI_NODE": True,
-    }, pipe_output=True)
-    self.sess2 = SaltcornSession(port=3002, env_vars={
-        "SALTCORN_MULTI_NODE": True,
-    }, pipe_output=True)
+    self.cluster = ClusterHarness(nodes=2, pipe_output=True)
+    self.cluster.start()
+    self.sess1, self.sess2 = self.cluster.nodes
     login(self.sess1)
     login(self.sess2)
 
   def teardown_class(self):
-    self.sess1.close()
-    self.sess2.close()
+    self.cluster.close()
 
   # --- helpers ---------------------------------------------------------
 
@@ -82,26 +75,18 @@ class Test:
     results[key] = (sess.status, sess.content)
 
   def _markers(self, prefix):
-    out = SaltcornSession.cli(
-      "run-sql",
-      "--sql",
-      f"select author from books where author like '{prefix}-%' order by id",
-    )
-    return re.findall(rf"'({re.escape(prefix)}-(?:start|end))'", out)
+    rows = db.query(
+      "select author from books where author like %s order by id", (f'{prefix}-%',))
+    return [row['author'] for row in rows]
 
   # testrun always redirects (302), even if a step failed, so check the
   # run's stored status instead of the HTTP response.
   def _error_run_count(self, trigger_id, message_substring):
-    out = SaltcornSession.cli(
-      "run-sql",
-      "--sql",
-      "select 'COUNT_RESULT:' || count(*) as result from _sc_workflow_runs "
-      f"where trigger_id = {trigger_id} and status = 'Error' "
-      f"and error like '%{message_substring}%'",
+    return db.scalar(
+      "select count(*) from _sc_workflow_runs "
+      "where trigger_id = %s and status = 'Error' and error like %s",
+      (int(trigger_id), f'%{message_substring}%'),
     )
-    m = re.search(r"COUNT_RESULT:(\d+)", out)
-    assert m, f"could not parse count from run-sql output: {out}"
-    return int(m.group(1))
 
   # Without a lock, concurrent runs should overlap - proving the markers
   # setup can actually tell locked from unlocked (used as the baseline for
@@ -235,7 +220,10 @@ class Test:
       target=self._fire_testrun, args=(self.sess1, trigger_id, results, 'first')
     )
     t1.start()
-    time.sleep(1)  # let the first run acquire the lock and start its 4s sleep
+    # let the first run acquire the lock and start its 4s sleep
+    db.wait_until(
+      "select id from books where author = %s", lambda rows: rows,
+      params=(f'{prefix}-start',))
     t2 = threading.Thread(
       target=self._fire_testrun, args=(self.sess2, trigger_id, results, 'second')
     )
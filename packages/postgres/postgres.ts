@@ -36,6 +36,21 @@ export let pool: Pool | null = null;
 
 let log_sql_enabled = false;
 
+/**
+ * An idle client whose backend goes away (terminated by an admin, or a
+ * database restore) is dropped by the pool and replaced on next use.
+ * Without an error listener the pool's error event would crash the process.
+ * @param {object} connObj - connection object
+ * @returns {Pool}
+ */
+const newPool = (connObj: any): Pool => {
+  const p = new Pool(connObj);
+  p.on("error", (err: Error) => {
+    console.error(`Idle database connection lost: ${err.message}`);
+  });
+  return p;
+};
+
 const quote = (s: string): string => `"${s}"`;
 
 const ppPK = (pk?: string): string => (pk ? quote(pk) : "id");
@@ -85,7 +100,7 @@ export const changeConnection = async (
   connObj: any = Object.create(null)
 ): Promise<void> => {
   await close();
-  pool = new Pool(getConnectObject!(connObj));
+  pool = newPool(getConnectObject!(connObj));
 };
 
 export const begin = async (): Promise<void> => {
@@ -1117,7 +1132,7 @@ export const init = (getConnectObjectPara: (connObj?: any) => any): void => {
     getConnectObject = getConnectObjectPara;
     const connectObj = getConnectObject();
     if (connectObj) {
-      pool = new Pool(connectObj);
+      pool = newPool(connectObj);
       getTenantSchema = tenantsModule(connectObj).getTenantSchema;
       getRequestContext = tenantsModule(connectObj).getRequestContext;
     } else {
@@ -0,0 +1,175 @@
+/**
+ * @category saltcorn-cli
+ * @module commands/command-server
+ */
+const { Command, Flags } = require("@oclif/core");
+const net = require("net");
+const fs = require("fs");
+const os = require("os");
+const path = require("path");
+
+// these never return, so they can't share the server process
+const refused_commands = new Set(["serve", "command-server", "scheduler"]);
+
+class ProcessExit extends Error {
+  constructor(code) {
+    super(`process.exit(${code})`);
+    this.code = code;
+  }
+}
+
+/**
+ * CommandServerCommand Class
+ * @extends oclif.Command
+ * @category saltcorn-cli
+ */
+class CommandServerCommand extends Command {
+  /**
+   * Run one command in this process, capturing what it writes
+   * @param {string[]} argv - command id followed by its arguments
+   * @returns {Promise<object>}
+   */
+  async runOne(argv) {
+    const [id, ...args] = argv;
+    if (!id || refused_commands.has(id))
+      return {
+        exit_code: 1,
+        stdout: "",
+        stderr: `Command not available in the command server: ${id}\n`,
+      };
+    const out = [];
+    const err = [];
+    const stdoutWrite = process.stdout.write;
+    const stderrWrite = process.stderr.write;
+    const processExit = process.exit;
+    const capture = (buf) => (chunk, encoding, cb) => {
+      buf.push(typeof chunk === "string" ? chunk : chunk.toString(encoding));
+      if (typeof encoding === "function") encoding();
+      else if (cb) cb();
+      return true;
+    };
+    process.stdout.write = capture(out);
+    process.stderr.write = capture(err);
+    process.exit = (code) => {
+      throw new ProcessExit(code || 0);
+    };
+    let exit_code = 0;
+    try {
+      const { getRootState } = require("@saltcorn/data/db/state");
+      // other processes (the server under test) may have changed the
+      // configuration since the last command
+      await getRootState()?.refresh(true);
+      await this.config.runCommand(id, args);
+    } catch (e) {
+      if (e instanceof ProcessExit) exit_code = e.code;
+      else if (e.oclif && typeof e.oclif.exit === "number")
+        exit_code = e.oclif.exit;
+      else {
+        err.push(`${e.stack || e.message || e}\n`);
+        exit_code = 1;
+      }
+    } finally {
+      process.stdout.write = stdoutWrite;
+      process.stderr.write = stderrWrite;
+      process.exit = processExit;
+      process.exitCode = undefined;
+    }
+    return { exit_code, stdout: out.join(""), stderr: err.join("") };
+  }
+
+  /**
+   * @returns {Promise<void>}
+   */
+  async run() {
+    const { flags } = await this.parse(CommandServerCommand);
+    const socketPath =
+      flags.socket ||
+      path.join(os.tmpdir(), `saltcorn-cli-${process.getuid?.() ?? 0}.sock`);
+    if (fs.existsSync(socketPath)) fs.unlinkSync(socketPath);
+
+    // one command at a time: output capture and tenant state are per process
+    let queue = Promise.resolve();
+    const reply = (socket, msg) => {
+      if (!socket.destroyed) socket.write(JSON.stringify(msg) + "\n");
+    };
+    const handle = (line, socket) => {
+      let req;
+      try {
+        req = JSON.parse(line);
+      } catch (e) {
+        reply(socket, {
+          id: null,
+          exit_code: 1,
+          stdout: "",
+          stderr: `Invalid request: ${e.message}\n`,
+          ms: 0,
+        });
+        return;
+      }
+      let started;
+      const elapsed = () =>
+        started ? Number(process.hrtime.bigint() - started) / 1e6 : 0;
+      // a failure here must still answer, and must not leave the queue
+      // rejected for the requests after it
+      queue = queue
+        .then(async () => {
+          started = process.hrtime.bigint();
+          const result = await this.runOne(req.argv || []);
+          reply(socket, { id: req.id, ms: elapsed(), ...result });
+        })
+        .catch((e) =>
+          reply(socket, {
+            id: req.id,
+            exit_code: 1,
+            stdout: "",
+            stderr: `${e?.stack || e?.message || e}\n`,
+            ms: elapsed(),
+          })
+        );
+    };
+
+    const server = net.createServer((socket) => {
+      let buffered = "";
+      socket.setEncoding("utf8");
+      socket.on("data", (data) => {
+        buffered += data;
+        let nl;
+        while ((nl = buffered.indexOf("\n")) >= 0) {
+          const line = buffered.slice(0, nl);
+          buffered = buffered.slice(nl + 1);
+          if (line.trim()) handle(line, socket);
+        }
+      });
+      socket.on("error", () => {});
+    });
+    const shutdown = () => {
+      server.close();
+      if (fs.existsSync(socketPath)) fs.unlinkSync(socketPath);
+      process.exit(0);
+    };
+    process.on("SIGTERM", shutdown);
+    process.on("SIGINT", shutdown);
+    server.listen(socketPath, () => {
+      console.log(`Command server listening on ${socketPath}`);
+    });
+  }
+}
+
+/**
+ * @type {string}
+ */
+CommandServerCommand.description = `Run CLI commands sent over a local socket, without a new process for each.
+Each request is a line of JSON {"id": ..., "argv": ["run-sql", "-s", "select 1"]};
+the reply is a line of JSON with id, exit_code, stdout, stderr and ms.`;
+
+/**
+ * @type {object}
+ */
+CommandServerCommand.flags = {
+  socket: Flags.string({
+    char: "s",
+    description: "Unix socket path. Default: saltcorn-cli-<uid>.sock in the temp directory",
+  }),
+};
+
+module.exports = CommandServerCommand;
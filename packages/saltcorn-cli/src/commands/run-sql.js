@@ -47,7 +47,7 @@ class RunSQLCommand extends Command {
           await db.query("SET SEARCH_PATH='" + schema + "'");
         }
 
-      console.log("current tenant:", schema);
+      if (!flags.json) console.log("current tenant:", schema);
       //if(flags.sql){
       const sql_str = flags.sql ? flags.sql : readFileSync(flags.file);
       // check that file not find (not directly)
@@ -61,11 +61,15 @@ class RunSQLCommand extends Command {
           console.error(`Cannot execute Query ${flags.sql}`);
           this.exit(1);
         }
-        // print sql statement
-        console.log(sql_str);
-        console.table(query.rows);
+        if (flags.json) console.log(JSON.stringify(query.rows));
+        else {
+          // print sql statement
+          console.log(sql_str);
+          console.table(query.rows);
+        }
       } catch (e) {
         console.error(e);
+        if (flags.json) this.exit(1);
       }
     });
     this.exit(0);
@@ -95,6 +99,10 @@ RunSQLCommand.flags = {
     char: "f",
     description: "path to sql file name",
   }),
+  json: Flags.boolean({
+    char: "j",
+    description: "print only the result rows, as JSON",
+  }),
 };
 
 module.exports = RunSQLCommand;
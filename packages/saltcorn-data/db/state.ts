@@ -235,6 +235,8 @@ class State {
   pluginManager?: any;
   codeNPMmodules: Record<string, any>;
   npm_refresh_in_progess: boolean;
+  // whether any socket on this node joined the tenant's rooms; kept up
+  // to date by the server (see server/socket_members.js)
   hasJoinedLogSockets: boolean;
   hasJoinedDynamicUpdateSockets: boolean;
   hasJoinedCollabSockets: boolean;
@@ -541,15 +543,31 @@ class State {
   log(min_level: number, ...msgs: any[]) {
     if (min_level <= this.logLevel) {
       const ten = db.getTenantSchema();
+      const asText = (ms: any[]) =>
+        ms
+          .map((m) =>
+            typeof m === "string" ? m : m?.toString ? m.toString() : `${m}`
+          )
+          .join(" ");
+      if (process.env.SALTCORN_LOG_FORMAT === "json") {
+        // one parseable record per line, for test harnesses and log shippers
+        const msg = asText(msgs);
+        const line = JSON.stringify({
+          ts: Date.now(),
+          pid: process.pid,
+          level: min_level,
+          tenant: ten,
+          msg,
+        });
+        if (min_level === 1) console.error(line);
+        else console.log(line);
+        this.emitLog(ten, min_level, msg);
+        return;
+      }
       if (ten !== "public") msgs.unshift(`Tenant=${ten}`);
       if (min_level === 1) console.error(...msgs);
       else console.log(...msgs);
-      const msg = msgs
-        .map((m) =>
-          typeof m === "string" ? m : m?.toString ? m.toString() : `${m}`
-        )
-        .join(" ");
-      this.emitLog(ten, min_level, msg);
+      this.emitLog(ten, min_level, asText(msgs));
     }
   }
 
@@ -671,12 +689,6 @@ class State {
    */
   refresh_ephemeral_config(key: string, value: any) {
     this.configs[key] = { value };
-    this.hasJoinedLogSockets =
-      (this.configs.joined_log_socket_ids?.value || []).length > 0;
-    this.hasJoinedDynamicUpdateSockets =
-      (this.configs.joined_dynamic_update_socket_ids?.value || []).length > 0;
-    this.hasJoinedCollabSockets =
-      (this.configs.joined_real_time_socket_ids?.value || []).length > 0;
   }
 
   //legacy
@@ -982,12 +994,6 @@ class State {
         this.configs[key] = { value };
         if (key.startsWith("localizer_")) await this.refresh_i18n();
         if (key === "log_level") this.logLevel = +value;
-        if (key === "joined_log_socket_ids")
-          this.hasJoinedLogSockets = (value || []).length > 0;
-        if (key === "joined_dynamic_update_socket_ids")
-          this.hasJoinedDynamicUpdateSockets = (value || []).length > 0;
-        if (key === "joined_real_time_socket_ids")
-          this.hasJoinedCollabSockets = (value || []).length > 0;
         if (db.is_node) {
           if (isEphemeral) {
             // config does not persist, send the whole object
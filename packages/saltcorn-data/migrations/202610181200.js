@@ -0,0 +1,11 @@
+// multi-node messages too large for a NOTIFY payload, see server/multinode_bus.js
+const sql_pg = `
+create table if not exists _sc_node_messages (
+  id serial primary key,
+  payload text not null,
+  created_at timestamp not null default now()
+);
+create index if not exists _sc_node_messages_created_idx on _sc_node_messages(created_at);
+`;
+
+module.exports = { sql_pg };
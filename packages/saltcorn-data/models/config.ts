@@ -1485,27 +1485,6 @@ const configTypes: ConfigTypes = {
       },
     },
   },
-  joined_log_socket_ids: {
-    type: "hidden",
-    label: "Joined log socket ids",
-    default: [],
-    excludeFromMobile: true,
-    ephemeral: true,
-  },
-  joined_real_time_socket_ids: {
-    type: "hidden",
-    label: "Joined real time socket ids",
-    default: [],
-    excludeFromMobile: true,
-    ephemeral: true,
-  },
-  joined_dynamic_update_socket_ids: {
-    type: "hidden",
-    label: "Joined dynamic update socket ids",
-    default: [],
-    excludeFromMobile: true,
-    ephemeral: true,
-  },
   prune_session_interval: {
     type: "Integer",
     label: "Prune session interval (seconds)",
@@ -15,6 +15,8 @@
  * @property {module:app} app
  * @property {module:errors} errors
  * @property {module:load_plugins} load_plugins
+ * @property {module:multinode_bus} multinode_bus
+ * @property {module:ready_signal} ready_signal
  * @property {module:serve} serve
  * @property {module:systemd} systemd
  * @property {module:wrapper} wrapper
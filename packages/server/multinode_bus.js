@@ -0,0 +1,155 @@
+/**
+ * @category server
+ * @module multinode_bus
+ */
+import db from "@saltcorn/data/db";
+import { getState } from "@saltcorn/data/db/state";
+
+// NOTIFY payloads must stay below 8000 bytes; leave room for the envelope
+const MAX_PAYLOAD_BYTES = 7900;
+const MAX_MESSAGE_BYTES = MAX_PAYLOAD_BYTES - 64;
+const SPILL_RETENTION = "10 minutes";
+
+const channelSchema = (channel) => channel.replace(/_events$/, "");
+
+const spillTable = (schema) =>
+  `"${db.sqlsanitize(schema)}"."_sc_node_messages"`;
+
+/**
+ * Sender side of the multi-node message bus. Messages sent in the same
+ * tick (or while the previous flush is still in flight) are coalesced
+ * into one NOTIFY per tenant channel, as many as fit in a payload, and
+ * all of them go out in a single query with the payloads as bind
+ * parameters. A message too large for a NOTIFY payload is stored in the
+ * tenant's _sc_node_messages table and sent as a reference to its id.
+ *
+ * Each payload is `{"seq": n, "batch": [msg, {"_spilled": id}, ...]}`,
+ * with `seq` counting up per channel so receivers can tell if they
+ * missed any.
+ * @param {object} client pg client, not used for LISTEN elsewhere
+ * @returns {function} send(schema, msg), resolves when msg is published
+ */
+export const createMultiNodeSender = (client) => {
+  let queue = new Map();
+  let scheduled = null;
+  let flushing = Promise.resolve();
+  const seqs = {};
+
+  const spill = async (schema, json) => {
+    const table = spillTable(schema);
+    const { rows } = await client.query(
+      `insert into ${table}(payload) values ($1) returning id`,
+      [json]
+    );
+    await client.query(
+      `delete from ${table} where created_at < now() - interval '${SPILL_RETENTION}'`
+    );
+    getState().log(
+      5,
+      `Multinode message of ${Buffer.byteLength(json, "utf8")} bytes sent as id ${rows[0].id}`
+    );
+    return JSON.stringify({ _spilled: rows[0].id });
+  };
+
+  const flush = async () => {
+    const pending = queue;
+    queue = new Map();
+    scheduled = null;
+    const channels = [];
+    const payloads = [];
+    for (const [schema, messages] of pending) {
+      let batch = [];
+      let bytes = 0;
+      const close = () => {
+        seqs[schema] = (seqs[schema] || 0) + 1;
+        channels.push(`${schema}_events`);
+        payloads.push(`{"seq":${seqs[schema]},"batch":[${batch.join(",")}]}`);
+        batch = [];
+        bytes = 0;
+      };
+      for (let json of messages) {
+        if (Buffer.byteLength(json, "utf8") > MAX_MESSAGE_BYTES)
+          json = await spill(schema, json);
+        const size = Buffer.byteLength(json, "utf8") + 1;
+        if (batch.length > 0 && bytes + size > MAX_MESSAGE_BYTES) close();
+        batch.push(json);
+        bytes += size;
+      }
+      if (batch.length > 0) close();
+    }
+    if (channels.length > 0)
+      await client.query(
+        "select pg_notify(c, p) from unnest($1::text[], $2::text[]) as t(c, p)",
+        [channels, payloads]
+      );
+  };
+
+  return (schema, msg) => {
+    if (!queue.has(schema)) queue.set(schema, []);
+    queue.get(schema).push(JSON.stringify(msg));
+    if (!scheduled) {
+      // flushes run one at a time, so messages keep their order
+      scheduled = flushing
+        .then(() => new Promise((resolve) => setImmediate(resolve)))
+        .then(flush)
+        .catch((e) => {
+          getState().log(
+            2,
+            `Error while sending multinode messages: ${e.message}`
+          );
+        });
+      flushing = scheduled;
+    }
+    return scheduled;
+  };
+};
+
+/**
+ * Receiver side: unpacks the batches (and single messages from nodes
+ * that predate the batching), fetches spilled messages and calls
+ * `dispatch` for each message, in the order they were sent.
+ * @param {object} client the pg client that LISTENs
+ * @param {function} dispatch
+ * @returns {function} handler for the client's "notification" events
+ */
+export const createMultiNodeReceiver = (client, dispatch) => {
+  let handling = Promise.resolve();
+  const lastSeq = {};
+
+  const unpack = async ({ channel, payload, processId }) => {
+    const parsed = JSON.parse(payload);
+    if (!Array.isArray(parsed.batch)) {
+      dispatch(parsed);
+      return;
+    }
+    const last = lastSeq[processId];
+    if (last !== undefined && parsed.seq !== 1 && parsed.seq !== last + 1)
+      getState().log(
+        2,
+        `Missed ${parsed.seq - last - 1} multinode message batches from ${processId} on ${channel}`
+      );
+    lastSeq[processId] = parsed.seq;
+    for (const msg of parsed.batch) {
+      if (msg._spilled) {
+        const { rows } = await client.query(
+          `select payload from ${spillTable(channelSchema(channel))} where id = $1`,
+          [msg._spilled]
+        );
+        if (rows.length === 0)
+          getState().log(2, `Multinode message ${msg._spilled} not found`);
+        else dispatch(JSON.parse(rows[0].payload));
+      } else dispatch(msg);
+    }
+  };
+
+  return (notification) => {
+    handling = handling.then(() =>
+      unpack(notification).catch((e) => {
+        getState().log(
+          2,
+          `Error while handling a multinode msg: ${e.message}`
+        );
+      })
+    );
+  };
+};
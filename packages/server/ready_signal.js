@@ -0,0 +1,66 @@
+/**
+ * @category server
+ * @module ready_signal
+ */
+import { writeSync } from "fs";
+
+let signalled = false;
+const phases = {};
+
+/**
+ * Record that a boot phase (migrations, plugins, ...) has finished, as
+ * milliseconds since the process started
+ * @param {string} name
+ * @returns {void}
+ */
+export const markPhase = (name) => {
+  phases[name] = Math.round(process.uptime() * 1000);
+};
+
+/**
+ * @returns {object} the phases recorded so far with markPhase
+ */
+export const bootPhases = () => ({ ...phases });
+
+const writeLine = (info) => {
+  const fd = +process.env.SALTCORN_READY_FD;
+  if (!fd) return;
+  try {
+    writeSync(fd, JSON.stringify({ pid: process.pid, ...info }) + "\n");
+  } catch (e) {
+    console.error(`Could not signal on fd ${fd}: ${e.message}`);
+  }
+};
+
+/**
+ * Tell the process that started the server it is ready to take requests:
+ * HTTP and socket.io are listening in every worker and plugins are
+ * loaded. If SALTCORN_READY_FD is set, one line of JSON is written to
+ * that file descriptor, including the boot phases of this process. The
+ * fd stays open for later events, see signalEvent.
+ * @param {object} info
+ * @param {number} info.port
+ * @param {number} info.workers
+ * @param {boolean} [info.leader] if this node runs the scheduler
+ * @param {object[]} [info.worker_phases] boot phases of each worker
+ * @returns {void}
+ */
+export default (info) => {
+  if (signalled) return;
+  signalled = true;
+  writeLine({
+    ready: true,
+    boot_ms: Math.round(process.uptime() * 1000),
+    phases: bootPhases(),
+    ...info,
+  });
+};
+
+/**
+ * Report a later event (e.g. state reloaded on SIGUSR2, a worker
+ * re-forked, the scheduler started on a new leader) as one more JSON
+ * line on SALTCORN_READY_FD
+ * @param {object} info
+ * @returns {void}
+ */
+export const signalEvent = (info) => writeLine(info);
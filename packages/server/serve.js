@@ -20,6 +20,7 @@ import {
   restart_tenant,
   add_tenant,
   get_other_domain_tenant,
+  getAllTenants as getLoadedTenants,
 } from "@saltcorn/data/db/state";
 import _am_tenant from "@saltcorn/admin-models/models/tenant";
 const { create_tenant, eachTenant, getAllTenants } = _am_tenant;
@@ -27,6 +28,23 @@ import path from "path";
 
 import getApp from "./app.js";
 import systemd from "./systemd.js";
+import signalReady, {
+  signalEvent,
+  markPhase,
+  bootPhases,
+} from "./ready_signal.js";
+import {
+  createMultiNodeSender,
+  createMultiNodeReceiver,
+} from "./multinode_bus.js";
+import {
+  joinSocket,
+  leaveSocket,
+  applyJoined,
+  onWorkerMembers,
+  onWorkerExit,
+  syncWorker,
+} from "./socket_members.js";
 import { createRequire } from "module";
 const require = createRequire(import.meta.url);
 import Trigger from "@saltcorn/data/models/trigger";
@@ -181,40 +199,35 @@ const ensureNotificationSubscriptions = async () => {
   }
 };
 
+const dispatchNodeMsg = (payload) => {
+  if (
+    payload.dynamic_update ||
+    payload.real_time_collab_event ||
+    payload.real_time_chat_event ||
+    payload.log_event ||
+    payload.restore_progress_event
+  ) {
+    const workers = Object.values(cluster.workers || {});
+    if (workers.length > 0) {
+      // use only one worker, master has no serversocket
+      workers[0].send(payload);
+    } else workerDispatchMsg(payload); // only master
+  } else {
+    Object.entries(cluster.workers).forEach(([wpid, w]) => {
+      w.send(payload);
+    });
+    workerDispatchMsg(payload); //also master
+  }
+};
+
 const getMultiNodeListener = (client) => {
   return async () => {
     await client.query(`LISTEN ${db.getTenantSchema()}_events`);
+    const receive = createMultiNodeReceiver(client, dispatchNodeMsg);
     client.on("notification", (msg) => {
       if (msg.processId === client.processID)
         return; // check self echo via connection pid
-      else {
-        try {
-          const payload = JSON.parse(msg.payload);
-          if (
-            payload.dynamic_update ||
-            payload.real_time_collab_event ||
-            payload.real_time_chat_event ||
-            payload.log_event ||
-            payload.restore_progress_event
-          ) {
-            const workers = Object.values(cluster.workers || {});
-            if (workers.length > 0) {
-              // use only one worker, master has no serversocket
-              workers[0].send(payload);
-            } else workerDispatchMsg(payload); // only master
-          } else {
-            Object.entries(cluster.workers).forEach(([wpid, w]) => {
-              w.send(payload);
-            });
-            workerDispatchMsg(payload); //also master
-          }
-        } catch (e) {
-          getState().log(
-            2,
-            `Error while handling a multinode msg: ${e.message}`
-          );
-        }
-      }
+      else receive(msg);
     });
   };
 };
@@ -247,6 +260,7 @@ const initMaster = async (
     }
     process.exit(1);
   }
+  markPhase("db_connected");
   // switch on sql logging
   if (sql_log) db.set_sql_logging(); // dont override cli flag
   // migrate database
@@ -255,8 +269,10 @@ const initMaster = async (
       db.connectObj.default_schema,
       async () => await migrate(db.connectObj.default_schema, true)
     );
+  markPhase("migrations");
   // load all plugins
   await Plugin.loadAllPlugins(true);
+  markPhase("plugins");
   // switch on sql logging - but it was initiated before???
   if (getState().getConfig("log_sql", false)) db.set_sql_logging();
 
@@ -272,9 +288,113 @@ const initMaster = async (
       db.connectObj.multi_node ? getMultiNodeListener : null
     );
   }
+  markPhase("tenants");
   if (useClusterAdaptor) setupPrimary();
 };
 
+/**
+ * Reload the state of the root and of every tenant from the database,
+ * e.g. after the database was restored underneath the running server.
+ * Plugins and tenants that are no longer in the database are dropped,
+ * not just left loaded as loadAllPlugins would.
+ * @returns {Promise<void>}
+ */
+const reloadAllTenantStates = async () => {
+  // the root State is shared by reference, so empty it instead of
+  // replacing it; the modules themselves stay cached, so reloading the
+  // plugins still in the database is cheap
+  const root = getRootState();
+  root.plugins = {};
+  root.plugin_cfgs = {};
+  root.plugin_module_names = {};
+  root.plugin_locations = {};
+  root.plugins_cfg_context = {};
+  await Plugin.loadAllPlugins();
+  await root.refresh_plugins(true);
+  if (!db.is_it_multi_tenant()) return;
+  const tenants = await getAllTenants();
+  const loaded = getLoadedTenants();
+  const rootSchema = db.connectObj.default_schema || "public";
+  for (const tenant of Object.keys(loaded))
+    if (tenant !== rootSchema && !tenants.includes(tenant))
+      delete loaded[tenant];
+  for (const tenant of tenants)
+    await db.runWithTenant(tenant, () =>
+      restart_tenant(Plugin.loadAllPlugins)
+    );
+};
+
+/**
+ * Have the workers reload the plugins of each tenant as the master gets
+ * to it, and keep track of their acknowledgements
+ * @returns {object} send(tenant), and done() which resolves once every
+ * worker has reloaded every tenant sent
+ */
+const trackWorkerPluginReloads = () => {
+  const workers = Object.values(cluster.workers || {});
+  const sent = new Set();
+  const acked = new Map(workers.map((w) => [w, new Set()]));
+  let finish = null;
+  // a worker that died meanwhile is replaced by one that loads afresh
+  const allAcked = () =>
+    workers.every(
+      (w) => w.isDead() || [...sent].every((t) => acked.get(w).has(t))
+    );
+  const check = () => finish && allAcked() && finish();
+  const listeners = workers.map((w) => {
+    const onMessage = (msg) => {
+      if (!msg?.plugins_reloaded) return;
+      acked.get(w).add(msg.plugins_reloaded);
+      check();
+    };
+    w.on("message", onMessage);
+    w.once("exit", check);
+    return [w, onMessage];
+  });
+  return {
+    send: (tenant) => {
+      sent.add(tenant);
+      workers.forEach((w) => w.send({ tenant, reload_plugins: true }));
+    },
+    done: async () => {
+      await new Promise((resolve) => {
+        finish = resolve;
+        if (allAcked()) resolve();
+      });
+      listeners.forEach(([w, onMessage]) => w.off("message", onMessage));
+    },
+  };
+};
+
+/**
+ * Master: ask every worker to reload its state, and wait until each has
+ * said so or died
+ * @returns {Promise<void>}
+ */
+const reloadWorkerStates = async () => {
+  const workers = Object.values(cluster.workers || {});
+  const acked = new Set();
+  let listeners = [];
+  // a worker that died meanwhile is replaced by one that loads afresh
+  await new Promise((resolve) => {
+    const check = () =>
+      workers.every((w) => w.isDead() || acked.has(w)) && resolve();
+    listeners = workers.map((w) => {
+      const onMessage = (msg) => {
+        if (!msg?.state_reloaded) return;
+        acked.add(w);
+        check();
+      };
+      w.on("message", onMessage);
+      w.once("exit", check);
+      return [w, onMessage];
+    });
+    workers.forEach((w) => w.isDead() || w.send({ reload_state: true }));
+    check();
+  });
+  listeners.forEach(([w, onMessage]) => w.off("message", onMessage));
+};
+
 /**
  * @param {object} opts
  * @param {object} opts.tenant
@@ -341,8 +461,16 @@ const workerDispatchMsg = ({ tenant, ...msg }) => {
   }
 
   if (msg.reload_plugins) {
-    Plugin.loadAllPlugins(cluster.isPrimary, true);
+    const tenantSchema = db.getTenantSchema();
+    Plugin.loadAllPlugins(cluster.isPrimary, true)
+      .catch((e) => {
+        console.error(`Error reloading plugins: ${e.message}`);
+      })
+      .then(() => {
+        process.send && process.send({ plugins_reloaded: tenantSchema });
+      });
   }
+  if (msg.socket_members_joined) applyJoined(msg.socket_members_joined);
   if (msg.refresh) {
     if (msg.refresh === "ephemeral_config")
       getState().refresh_ephemeral_config(msg.key, msg.value);
@@ -366,6 +494,14 @@ const workerDispatchMsg = ({ tenant, ...msg }) => {
   }
   if (msg.restart_tenant) restart_tenant(Plugin.loadAllPlugins);
   if (msg.removePlugin) getState().remove_plugin(msg.removePlugin, true);
+  if (msg.reload_state)
+    reloadAllTenantStates()
+      .catch((e) => {
+        console.error(`Error reloading state: ${e.message}`);
+      })
+      .then(() => {
+        process.send && process.send({ state_reloaded: true });
+      });
 };
 
 /**
@@ -377,12 +513,38 @@ const workerDispatchMsg = ({ tenant, ...msg }) => {
  * @param {boolean} opts.watchReaper
  * @param {boolean} opts.disableScheduler
  * @param {number} opts.pid
+ * @param {object} opts.worker
+ * @param {number} opts.nWorkers
  * @returns {function}
  */
 const onMessageFromWorker =
-  (masterState, { port, pid, nodesDispatchMsg, scheduleHelper, isLeader }) =>
+  (
+    masterState,
+    { port, pid, worker, nodesDispatchMsg, scheduleHelper, isLeader, nWorkers }
+  ) =>
   (msg) => {
     //console.log("worker msg", typeof msg, msg);
+    if (msg?.boot_phases) {
+      masterState.workerPhases.push(msg.boot_phases);
+      return true;
+    }
+    if (msg?.socket_members) {
+      onWorkerMembers(msg.socket_members, pid);
+      return true;
+    }
+    if (msg === "Start") syncWorker(worker);
+    if (msg === "Start" && masterState.workersStarted === 0)
+      markPhase("first_worker_ready");
+    if (msg === "Start" && ++masterState.workersStarted === nWorkers) {
+      markPhase("workers_ready");
+      signalReady({
+        port,
+        workers: nWorkers,
+        leader: isLeader,
+        worker_phases: masterState.workerPhases,
+      });
+    } else if (msg === "Start" && masterState.workersStarted > nWorkers)
+      signalEvent({ worker_started: pid }); // re-forked after a crash
     if (msg === "Start" && !masterState.started) {
       masterState.started = true;
       if (isLeader) scheduleHelper.start();
@@ -419,8 +581,6 @@ const onMessageFromWorker =
     }
   };
 
-const escapeSingleQuotes = (value) => value.replace(/'/g, "''");
-
 // read 'store_entries.json' into a config
 // on pre-install time no db connection exists, that's why we nee a file
 // but for the server it's better to have a config instead of reading a file each time
@@ -483,9 +643,11 @@ const startLeadershipMonitor = ({
       if (isLeader && !schedulerStarted) {
         scheduleHelper.start();
         schedulerStarted = true;
+        signalEvent({ scheduler: "started" });
       } else if (!isLeader && schedulerStarted) {
         scheduleHelper.stop();
         schedulerStarted = false;
+        signalEvent({ scheduler: "stopped" });
       }
     } catch (e) {
       console.log(`Error checking leadership: ${e.message}`);
@@ -520,27 +682,44 @@ async ({
     await ensurePluginsFolder();
     await ensureNotificationSubscriptions();
 
-    // reload plugins on SIGHUP
+    // reload plugins on SIGHUP, and report it on SALTCORN_READY_FD once
+    // every worker has done the same
     process.on("SIGHUP", async () => {
       getState().log(
         4,
         "SIGHUP received: reloading plugins and state for all tenants"
       );
-      await Plugin.loadAllPlugins(true, true);
-      await getState().refresh_plugins(true);
-      Object.entries(cluster.workers || {}).forEach(([wpid, w]) => {
-        w.send({ reload_plugins: true });
-      });
-      if (db.is_it_multi_tenant()) {
-        for (const tenant of await getAllTenants()) {
-          await db.runWithTenant(tenant, async () => {
-            await Plugin.loadAllPlugins(true, true);
-            await getState().refresh_plugins(true);
-            Object.entries(cluster.workers || {}).forEach(([wpid, w]) => {
-              w.send({ tenant, reload_plugins: true });
+      try {
+        const workerReloads = trackWorkerPluginReloads();
+        await Plugin.loadAllPlugins(true, true);
+        await getState().refresh_plugins(true);
+        workerReloads.send(db.connectObj.default_schema);
+        if (db.is_it_multi_tenant()) {
+          for (const tenant of await getAllTenants()) {
+            await db.runWithTenant(tenant, async () => {
+              await Plugin.loadAllPlugins(true, true);
+              await getState().refresh_plugins(true);
+              workerReloads.send(tenant);
             });
-          });
+          }
         }
+        await workerReloads.done();
+        signalEvent({ plugins_reloaded: true });
+      } catch (e) {
+        getState().log(2, `Error reloading plugins on SIGHUP: ${e.message}`);
+      }
+    });
+
+    // reload all state from the database on SIGUSR2, and report it on
+    // SALTCORN_READY_FD once every worker has done the same
+    process.on("SIGUSR2", async () => {
+      getState().log(4, "SIGUSR2 received: reloading state for all tenants");
+      try {
+        await reloadAllTenantStates();
+        await reloadWorkerStates();
+        signalEvent({ state_reloaded: true });
+      } catch (e) {
+        getState().log(2, `Error reloading state on SIGUSR2: ${e.message}`);
       }
     });
   }
@@ -562,6 +741,8 @@ async ({
   ));
   const masterState = {
     started: false,
+    workersStarted: 0,
+    workerPhases: [],
     listeningTo: new Set([]),
   };
 
@@ -575,11 +756,8 @@ async ({
       isLeaderFn = await getIsLeaderFn();
       isLeader = await isLeaderFn();
     }
+    const sendToNodes = createMultiNodeSender(multiNodeClient);
     nodesDispatchMsg = async ({ tenant, ...msg }) => {
-      if (tenant) {
-        db.runWithTenant(tenant, () => nodesDispatchMsg(msg));
-        return;
-      }
       if (
         msg.restart_tenant ||
         msg.installPlugin ||
@@ -592,20 +770,8 @@ async ({
         msg.restore_progress_event ||
         msg.node_handle_msg ||
         (msg.refresh && msg.refresh !== "ephemeral_config")
-      ) {
-        const payload = escapeSingleQuotes(JSON.stringify(msg));
-        const payloadBytes = Buffer.byteLength(payload, "utf8");
-        if (payloadBytes < 8000) {
-          await multiNodeClient.query(
-            `NOTIFY ${db.getTenantSchema()}_events, '${payload}'`
-          );
-        } else {
-          getState().log(
-            2,
-            `Not sending multinode message, too large (${payloadBytes} bytes)`
-          );
-        }
-      }
+      )
+        await sendToNodes(tenant || db.getTenantSchema(), msg);
     };
   }
 
@@ -636,9 +802,11 @@ async ({
       onMessageFromWorker(masterState, {
         port,
         pid: worker.process.pid,
+        worker,
         nodesDispatchMsg,
         scheduleHelper,
         isLeader,
+        nWorkers: useNCpus,
       })
     );
   };
@@ -714,6 +882,7 @@ async ({
     await initMaster(appargs, forkAnyWorkers, multiNodeClient);
 
     if (forkAnyWorkers) {
+      markPhase("fork");
       for (let i = 0; i < useNCpus; i++) addWorker(cluster.fork());
       getState().sendMessageToWorkers = (msg) => {
         Object.entries(cluster.workers).forEach(([wpid, w]) => {
@@ -724,6 +893,8 @@ async ({
 
       cluster.on("exit", (worker, code, signal) => {
         console.log(`worker ${worker.process.pid} died`);
+        signalEvent({ worker_exited: worker.process.pid, code, signal });
+        onWorkerExit(worker.process.pid);
         addWorker(cluster.fork());
       });
     } else {
@@ -742,6 +913,7 @@ async ({
           });
       };
       await nonGreenlockWorkerSetup(appargs, port, host);
+      signalReady({ port, workers: 1, leader: isLeader });
       if (isLeader) scheduleHelper.start();
       if (db.connectObj.multi_node) {
         startLeadershipMonitor({
@@ -766,6 +938,7 @@ const nonGreenlockWorkerSetup = async (appargs, port, host) => {
   process.send && process.on("message", workerDispatchMsg);
 
   const app = await getApp(appargs);
+  markPhase("app");
 
   const cert = getState().getConfig("custom_ssl_certificate", "");
   const key = getState().getConfig("custom_ssl_private_key", "");
@@ -807,17 +980,25 @@ const nonGreenlockWorkerSetup = async (appargs, port, host) => {
     const http = require("http");
     const httpServer = http.createServer(app);
     setupSocket(appargs?.subdomainOffset, pruneSessionInterval, httpServer);
+    markPhase("socket");
 
     // todo timeout to config
     // todo refer in doc to httpserver doc
     // todo there can be added other parameters for httpserver
     httpServer.setTimeout(timeout * 1000);
-    httpServer.listen(listenArgs, () => {
-      console.log(
-        `Saltcorn listening on http://${host || `localhost`}:${port}/`
-      );
-    });
+    // "Start" tells the master this worker is ready, so wait until it is
+    await new Promise((resolve) =>
+      httpServer.listen(listenArgs, () => {
+        console.log(
+          `Saltcorn listening on http://${host || `localhost`}:${port}/`
+        );
+        resolve();
+      })
+    );
+    markPhase("listening");
   }
+  // the master reports these with its own once all workers have started
+  if (process.send) process.send({ boot_phases: bootPhases() });
   getState().processSend("Start");
 };
 
@@ -957,11 +1138,7 @@ const setupSocket = (subdomainOffset, pruneSessionInterval, ...servers) => {
           if (!user || user.role_id !== 1) throw new Error("Not authorized");
           else {
             socket.join(`_logs_${tenant}_`);
-            const socketIds = await getState().getConfig(
-              "joined_log_socket_ids"
-            );
-            socketIds.push(socket.id);
-            await getState().setConfig("joined_log_socket_ids", [...socketIds]);
+            joinSocket("log", tenant, socket.id);
             callback({ status: "ok" });
             setTimeout(() => {
               io.of("/")
@@ -992,15 +1169,8 @@ const setupSocket = (subdomainOffset, pruneSessionInterval, ...servers) => {
           const roomName = `_${tenant}_collab_room_${viewname}_`;
           if (!socket.rooms.has(roomName)) {
             socket.join(roomName);
+            joinSocket("collab", tenant, socket.id);
             if (typeof callback === "function") callback({ status: "ok" });
-            const socketIds = await getState().getConfig(
-              "joined_real_time_socket_ids",
-              []
-            );
-            socketIds.push(socket.id);
-            await getState().setConfig("joined_real_time_socket_ids", [
-              ...new Set(socketIds),
-            ]);
           } else if (typeof callback === "function")
             callback({ status: "already_joined" });
         } catch (err) {
@@ -1029,14 +1199,7 @@ const setupSocket = (subdomainOffset, pruneSessionInterval, ...servers) => {
           } else {
             socket.join(`_${tenant}_public_dynamic_update_room`);
           }
-          const socketIds = await getState().getConfig(
-            "joined_dynamic_update_socket_ids",
-            []
-          );
-          socketIds.push(socket.id);
-          await getState().setConfig("joined_dynamic_update_socket_ids", [
-            ...new Set(socketIds),
-          ]);
+          joinSocket("dynamic_update", tenant, socket.id);
           if (typeof callback === "function") callback({ status: "ok" });
         } catch (err) {
           const state = getState();
@@ -1052,47 +1215,9 @@ const setupSocket = (subdomainOffset, pruneSessionInterval, ...servers) => {
       else await f();
     });
 
-    socket.on("disconnect", async () => {
+    socket.on("disconnect", () => {
       const tenant = tenantFromSocket(socket, subdomainOffset) || "public";
-      const f = async () => {
-        const state = getState();
-        if (state) {
-          const socketIds = state.getConfig("joined_log_socket_ids");
-          const newSocketIds = socketIds.filter((id) => id !== socket.id);
-          await state.setConfig("joined_log_socket_ids", newSocketIds);
-
-          const dynamicSocketIds = state.getConfig(
-            "joined_dynamic_update_socket_ids",
-            []
-          );
-          const newDynamicSocketIds = dynamicSocketIds.filter(
-            (id) => id !== socket.id
-          );
-          await state.setConfig(
-            "joined_dynamic_update_socket_ids",
-            newDynamicSocketIds
-          );
-
-          const realTimeSocketIds = state.getConfig(
-            "joined_real_time_socket_ids",
-            []
-          );
-          const newRealTimeSocketIds = realTimeSocketIds.filter(
-            (id) => id !== socket.id
-          );
-          await state.setConfig(
-            "joined_real_time_socket_ids",
-            newRealTimeSocketIds
-          );
-        } else {
-          console.error("No state found in socket disconnect");
-          console.error("The current tenantSchema is:", db.getTenantSchema());
-          console.error("The current tenant from request is:", tenant);
-          console.error("node version:", process.version);
-        }
-      };
-      if (tenant && tenant !== "public") await db.runWithTenant(tenant, f);
-      else await f();
+      leaveSocket(tenant, socket.id);
     });
   });
 
@@ -0,0 +1,136 @@
+/**
+ * @category server
+ * @module socket_members
+ */
+import cluster from "cluster";
+import db from "@saltcorn/data/db";
+import { getState } from "@saltcorn/data/db/state";
+
+// room kind -> State flag telling emitters whether to bother
+const FLAGS = {
+  log: "hasJoinedLogSockets",
+  collab: "hasJoinedCollabSockets",
+  dynamic_update: "hasJoinedDynamicUpdateSockets",
+};
+const KINDS = Object.keys(FLAGS);
+
+// kind -> tenant -> Set of socket ids that joined in this process
+const members = Object.fromEntries(KINDS.map((kind) => [kind, new Map()]));
+// master only: kind -> tenant -> Set of pids of workers with members
+const workersWithMembers = Object.fromEntries(
+  KINDS.map((kind) => [kind, new Map()])
+);
+
+const isWorker = () => !!process.send && !cluster.isMaster;
+
+const setFlag = (tenant, kind, joined) =>
+  db.runWithTenant(tenant, () => applyJoined({ kind, joined }));
+
+/**
+ * Set a State flag in the current tenant, on a socket_members_joined
+ * message from the master
+ * @param {object} opts
+ * @param {string} opts.kind
+ * @param {boolean} opts.joined
+ * @returns {void}
+ */
+export const applyJoined = ({ kind, joined }) => {
+  const state = getState();
+  if (state && FLAGS[kind]) state[FLAGS[kind]] = joined;
+};
+
+// the first socket of a tenant joined in this process, or the last left
+const report = (tenant, kind, joined) => {
+  // a socket here is enough to know the node has one, so do not wait
+  // for the master to say so before emitting from this process
+  if (joined || !isWorker()) setFlag(tenant, kind, joined);
+  if (isWorker()) process.send({ socket_members: { tenant, kind, joined } });
+};
+
+/**
+ * Record that a socket joined a log, collab or dynamic update room. Kept
+ * in memory per process: the State only needs to know whether any
+ * socket on this node has joined, so the master is told only when this
+ * process's count for the tenant goes from 0 to 1.
+ * @param {string} kind log, collab or dynamic_update
+ * @param {string} tenant
+ * @param {string} socketId
+ * @returns {void}
+ */
+export const joinSocket = (kind, tenant, socketId) => {
+  let ids = members[kind].get(tenant);
+  if (!ids) members[kind].set(tenant, (ids = new Set()));
+  ids.add(socketId);
+  if (ids.size === 1) report(tenant, kind, true);
+};
+
+/**
+ * Forget a disconnected socket, in whichever rooms it joined
+ * @param {string} tenant
+ * @param {string} socketId
+ * @returns {void}
+ */
+export const leaveSocket = (tenant, socketId) => {
+  for (const kind of KINDS) {
+    const ids = members[kind].get(tenant);
+    if (ids?.delete(socketId) && ids.size === 0) {
+      members[kind].delete(tenant);
+      report(tenant, kind, false);
+    }
+  }
+};
+
+/**
+ * @param {string} kind
+ * @param {string} tenant
+ * @returns {number} sockets of this process in the tenant's rooms of kind
+ */
+export const countSockets = (kind, tenant) =>
+  members[kind].get(tenant)?.size || 0;
+
+const broadcast = (tenant, kind, joined) => {
+  Object.values(cluster.workers || {}).forEach((w) =>
+    w.send({ tenant, socket_members_joined: { kind, joined } })
+  );
+  setFlag(tenant, kind, joined); // also master
+};
+
+/**
+ * Master: a worker's first socket of a tenant joined, or its last left;
+ * tell every worker when that changes whether the node has any
+ * @param {object} msg socket_members message: tenant, kind, joined
+ * @param {number} pid of the worker
+ * @returns {void}
+ */
+export const onWorkerMembers = ({ tenant, kind, joined }, pid) => {
+  if (!FLAGS[kind]) return;
+  let pids = workersWithMembers[kind].get(tenant);
+  if (!pids) workersWithMembers[kind].set(tenant, (pids = new Set()));
+  const before = pids.size > 0;
+  if (joined) pids.add(pid);
+  else pids.delete(pid);
+  if ((pids.size > 0) !== before) broadcast(tenant, kind, pids.size > 0);
+};
+
+/**
+ * Master: the sockets of a dead worker are gone with it
+ * @param {number} pid
+ * @returns {void}
+ */
+export const onWorkerExit = (pid) => {
+  for (const kind of KINDS)
+    for (const [tenant, pids] of workersWithMembers[kind])
+      if (pids.delete(pid) && pids.size === 0) broadcast(tenant, kind, false);
+};
+
+/**
+ * Master: bring a newly started worker's flags up to date
+ * @param {object} worker
+ * @returns {void}
+ */
+export const syncWorker = (worker) => {
+  for (const kind of KINDS)
+    for (const [tenant, pids] of workersWithMembers[kind])
+      if (pids.size > 0)
+        worker.send({ tenant, socket_members_joined: { kind, joined: true } });
+};